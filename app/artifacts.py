@@ -0,0 +1,177 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from app import media_utils, spectrogram
+from app.media_executor import run_media
+from app.media_utils import decode_audio, wav_to_samples
+from app.spectrogram import audio_to_spectrogram_image
+
+# Content-addressed store for audio intermediates, so identify and validate
+# on the same clip decode it and render its spectrogram once:
+#   wav: trimmed 22.05 kHz mono WAV, keyed by the raw upload hash
+#   png: spectrogram, keyed by the trimmed WAV hash
+# Both keys include a tag of the settings that produced them. Separate
+# budget from the result cache; least recently used artifacts go first.
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "./cache/artifacts")
+ARTIFACT_MEMORY_MAX_BYTES = int(os.getenv("ARTIFACT_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))
+ARTIFACT_DISK_MAX_BYTES = int(os.getenv("ARTIFACT_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+ARTIFACT_SWEEP_SECONDS = int(os.getenv("ARTIFACT_SWEEP_SECONDS", "300"))
+
+_MEMORY = OrderedDict()  # name -> bytes
+_MEMORY_BYTES = 0
+_LOCK = threading.Lock()
+_LAST_SWEEP = 0.0
+_SWEEPING = False
+
+STATS = {
+    "wav_hits": 0,
+    "wav_misses": 0,
+    "png_hits": 0,
+    "png_misses": 0,
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "disk_evictions": 0,
+}
+
+
+def _tag(*params) -> str:
+    return hashlib.sha256(repr(params).encode("utf-8")).hexdigest()[:8]
+
+
+def _name(kind: str, content_hash: str) -> str:
+    if kind == "wav":
+        tag = _tag(media_utils.AUDIO_TRIM_SECONDS, media_utils.AUDIO_SAMPLE_RATE)
+    else:
+        tag = _tag(
+            spectrogram.SPECTROGRAM_RENDERER, spectrogram._WIDTH, spectrogram._HEIGHT,
+            spectrogram._BAND_HZ, spectrogram._NFFT, spectrogram._DYNAMIC_RANGE_DB,
+        )
+    return f"{kind}_{tag}_{content_hash}.{kind}"
+
+
+def _memory_put(name: str, data: bytes):
+    global _MEMORY_BYTES
+    if len(data) > ARTIFACT_MEMORY_MAX_BYTES:
+        return
+    with _LOCK:
+        old = _MEMORY.pop(name, None)
+        if old is not None:
+            _MEMORY_BYTES -= len(old)
+        _MEMORY[name] = data
+        _MEMORY_BYTES += len(data)
+        while _MEMORY_BYTES > ARTIFACT_MEMORY_MAX_BYTES:
+            _, evicted = _MEMORY.popitem(last=False)
+            _MEMORY_BYTES -= len(evicted)
+
+
+def artifact_get(kind: str, content_hash: str):
+    """kind: "wav" or "png". Returns the stored bytes or None."""
+    name = _name(kind, content_hash)
+    with _LOCK:
+        data = _MEMORY.get(name)
+        if data is not None:
+            _MEMORY.move_to_end(name)
+    if data is not None:
+        STATS["memory_hits"] += 1
+        STATS[f"{kind}_hits"] += 1
+        return data
+
+    path = os.path.join(ARTIFACT_DIR, name)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        # mtime doubles as last use for the disk sweep
+        os.utime(path)
+    except FileNotFoundError:
+        STATS[f"{kind}_misses"] += 1
+        return None
+
+    STATS["disk_hits"] += 1
+    STATS[f"{kind}_hits"] += 1
+    _memory_put(name, data)
+    return data
+
+
+def artifact_put(kind: str, content_hash: str, data: bytes):
+    name = _name(kind, content_hash)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    path = os.path.join(ARTIFACT_DIR, name)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _memory_put(name, data)
+    _maybe_sweep()
+
+
+async def decoded_audio(raw_hash: str, source):
+    """
+    (trimmed WAV bytes, float32 samples) for an upload, decoding with
+    ffmpeg only when this raw upload hasn't been seen with these settings.
+    """
+    wav = artifact_get("wav", raw_hash)
+    if wav is not None:
+        return wav, wav_to_samples(wav)
+    wav, samples = await run_media(decode_audio, source)
+    artifact_put("wav", raw_hash, wav)
+    return wav, samples
+
+
+async def spectrogram_png(audio_hash: str, wav: bytes, samples):
+    """Spectrogram of a trimmed clip (by its WAV hash), rendered at most once."""
+    png = artifact_get("png", audio_hash)
+    if png is None:
+        png = await run_media(audio_to_spectrogram_image, wav, samples)
+        artifact_put("png", audio_hash, png)
+    return png
+
+
+def _maybe_sweep():
+    global _LAST_SWEEP, _SWEEPING
+    now = time.time()
+    with _LOCK:
+        if _SWEEPING or now - _LAST_SWEEP < ARTIFACT_SWEEP_SECONDS:
+            return
+        _SWEEPING = True
+        _LAST_SWEEP = now
+    threading.Thread(target=_sweep, daemon=True).start()
+
+
+def _sweep():
+    """Removes least recently used artifacts until under ARTIFACT_DISK_MAX_BYTES."""
+    global _SWEEPING
+    try:
+        files, total = [], 0
+        with os.scandir(ARTIFACT_DIR) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        if total > ARTIFACT_DISK_MAX_BYTES:
+            files.sort()
+            for _, size, path in files:
+                if total <= ARTIFACT_DISK_MAX_BYTES:
+                    break
+                try:
+                    os.remove(path)
+                    STATS["disk_evictions"] += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+    finally:
+        _SWEEPING = False
+
+
+def artifact_stats() -> dict:
+    with _LOCK:
+        entries, size = len(_MEMORY), _MEMORY_BYTES
+    return {**STATS, "memory_entries": entries, "memory_bytes": size}
@@ -0,0 +1,344 @@
+import os
+import base64
+import threading
+
+import numpy as np
+
+# A clip counts as the same recording when at least AUDIO_FP_MIN_MATCHES of
+# its peak-pair hashes, and AUDIO_FP_MIN_SCORE of all of them, line up at one
+# time offset with an indexed clip.
+AUDIO_FP_ENABLED = os.getenv("AUDIO_FP_ENABLED", "true").lower() == "true"
+AUDIO_FP_MIN_MATCHES = int(os.getenv("AUDIO_FP_MIN_MATCHES", "12"))
+AUDIO_FP_MIN_SCORE = float(os.getenv("AUDIO_FP_MIN_SCORE", "0.15"))
+# ~2k postings of 9 bytes per clip: the default cap is ~40 MB of index
+AUDIO_FP_MAX_CLIPS = int(os.getenv("AUDIO_FP_MAX_CLIPS", "2000"))
+AUDIO_FP_INDEX_PATH = os.getenv("AUDIO_FP_INDEX_PATH", "./cache/audio_fp_index.tsv")
+
+_SAMPLE_RATE = 22050
+_FRAME = 1024
+_HOP = 256
+_BAND_HZ = (800, 11000)          # same band the spectrogram prompt is tuned for
+_PEAK_NEIGHBOURHOOD = (3, 7)     # +/- frames, +/- bins
+_PEAKS_PER_SECOND = 30
+_FAN_OUT = 5
+_MAX_DT = 63                     # frames; fits in 6 hash bits
+_FREQ_QUANT = 4                  # hash bins of ~86 Hz, tolerant of chirp smear
+
+# Indexed clips are fingerprinted at this many sub-hop alignments, so a query
+# shifted by a fraction of a frame (leading silence, re-encoder delay) still
+# lines up with one of them.
+AUDIO_FP_INDEX_ALIGNMENTS = int(os.getenv("AUDIO_FP_INDEX_ALIGNMENTS", "4"))
+
+_WINDOW = np.hanning(_FRAME).astype(np.float32)
+
+
+def _max_filter_1d(a: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    out = a.copy()
+    n = a.shape[axis]
+    for shift in range(1, radius + 1):
+        if shift >= n:
+            break
+        lead = [slice(None)] * a.ndim
+        lag = [slice(None)] * a.ndim
+        lead[axis], lag[axis] = slice(shift, None), slice(None, -shift)
+        np.maximum(out[tuple(lag)], a[tuple(lead)], out=out[tuple(lag)])
+        np.maximum(out[tuple(lead)], a[tuple(lag)], out=out[tuple(lead)])
+    return out
+
+
+def _peaks(samples: np.ndarray) -> np.ndarray:
+    """Returns spectral peaks as an (n, 2) array of (frame, bin), sorted by frame."""
+    if len(samples) < _FRAME:
+        return np.empty((0, 2), dtype=np.int32)
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, _FRAME)[::_HOP]
+    spec = np.abs(np.fft.rfft(frames * _WINDOW, axis=1))
+
+    lo = int(_BAND_HZ[0] * _FRAME / _SAMPLE_RATE)
+    hi = int(_BAND_HZ[1] * _FRAME / _SAMPLE_RATE)
+    logspec = np.log(spec[:, lo:hi] + 1e-6)
+
+    # local maxima (separable rectangular max filter) that stand out from the floor
+    neighbourhood = _max_filter_1d(
+        _max_filter_1d(logspec, _PEAK_NEIGHBOURHOOD[0], axis=0), _PEAK_NEIGHBOURHOOD[1], axis=1
+    )
+    is_peak = (logspec == neighbourhood) & (logspec > logspec.mean() + 2.0 * logspec.std())
+    t, f = np.nonzero(is_peak)
+
+    budget = max(1, int(_PEAKS_PER_SECOND * len(samples) / _SAMPLE_RATE))
+    if len(t) > budget:
+        strongest = np.argsort(logspec[t, f])[-budget:]
+        t, f = t[strongest], f[strongest]
+
+    order = np.lexsort((f, t))
+    return np.stack([t[order], f[order] + lo], axis=1).astype(np.int32)
+
+
+def _landmarks(samples: np.ndarray) -> list:
+    peaks = _peaks(samples)
+    out = []
+    for i in range(len(peaks)):
+        t1, f1 = peaks[i]
+        paired = 0
+        for j in range(i + 1, len(peaks)):
+            t2, f2 = peaks[j]
+            dt = t2 - t1
+            if dt > _MAX_DT:
+                break
+            if dt == 0:
+                continue
+            h = ((int(f1) // _FREQ_QUANT) << 13) | ((int(f2) // _FREQ_QUANT) << 6) | int(dt)
+            out.append((h, int(t1)))
+            paired += 1
+            if paired >= _FAN_OUT:
+                break
+    return out
+
+
+def audio_fingerprint(samples: np.ndarray, alignments: int = 1) -> np.ndarray:
+    """
+    Landmark fingerprint of mono 22.05 kHz samples: each spectral peak is
+    paired with the next few peaks ahead of it, and each pair is hashed as
+    (anchor band, target band, frame delta). With alignments > 1 the
+    landmarks of several sub-hop shifts of the clip are merged.
+    Returns an (n, 2) int64 array of unique (hash, anchor frame) rows.
+    """
+    out = []
+    for k in range(max(1, alignments)):
+        out.extend(_landmarks(samples[k * _HOP // max(1, alignments):]))
+    fp = np.asarray(out, dtype=np.int64).reshape(-1, 2)
+    return np.unique(fp, axis=0) if alignments > 1 else fp
+
+
+_SEGMENT_CLIPS = 256              # slots are uint8
+_OFFSET_BITS = 20                 # (slot, time offset) packed for the histogram
+
+
+class _Segment:
+    """Postings of up to _SEGMENT_CLIPS clips as parallel arrays sorted by hash."""
+
+    def __init__(self, items: list = ()):
+        self.clip_ids = [clip_id for clip_id, _ in items]
+        fps = [fp for _, fp in items]
+        rows = np.concatenate(fps) if fps else np.empty((0, 2), dtype=np.int64)
+        slots = np.repeat(np.arange(len(fps), dtype=np.uint8), [len(fp) for fp in fps])
+        order = np.argsort(rows[:, 0], kind="stable")
+        self.hashes = rows[order, 0].astype(np.int32)
+        self.times = rows[order, 1].astype(np.int32)
+        self.slots = slots[order]
+
+    def add(self, clip_id: str, fp: np.ndarray):
+        slot = len(self.clip_ids)
+        self.clip_ids.append(clip_id)
+        order = np.argsort(fp[:, 0], kind="stable")
+        hashes = fp[order, 0].astype(np.int32)
+        at = np.searchsorted(self.hashes, hashes, side="right")
+        self.hashes = np.insert(self.hashes, at, hashes)
+        self.times = np.insert(self.times, at, fp[order, 1].astype(np.int32))
+        self.slots = np.insert(self.slots, at, np.uint8(slot))
+
+    def fingerprint(self, slot: int) -> np.ndarray:
+        mask = self.slots == slot
+        return np.stack([self.hashes[mask], self.times[mask]], axis=1).astype(np.int64)
+
+    def best_alignments(self, fp: np.ndarray) -> tuple:
+        """
+        For each clip sharing hashes with fp: (slots, matches) where matches is
+        the most postings lining up at one time offset, +/- one frame.
+        """
+        hashes = fp[:, 0].astype(np.int32)    # same dtype, or numpy converts self.hashes
+        lo = np.searchsorted(self.hashes, hashes, side="left")
+        hi = np.searchsorted(self.hashes, hashes, side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        if not total:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+        # positions lo[i] .. hi[i] - 1 for every query row i, flattened
+        idx = np.arange(total) + np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        offsets = self.times[idx].astype(np.int64) - np.repeat(fp[:, 1], counts)
+        keys = (self.slots[idx].astype(np.int64) << _OFFSET_BITS) | (offsets + (1 << (_OFFSET_BITS - 1)))
+        keys, hist = np.unique(keys, return_counts=True)
+
+        # leading silence / re-encoding can move peaks by one frame
+        windowed = hist + _count_at(keys, hist, keys - 1) + _count_at(keys, hist, keys + 1)
+        slots = keys >> _OFFSET_BITS
+        starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+        return slots[starts], np.maximum.reduceat(windowed, starts)
+
+
+def _count_at(keys: np.ndarray, hist: np.ndarray, probe: np.ndarray) -> np.ndarray:
+    pos = np.minimum(np.searchsorted(keys, probe), len(keys) - 1)
+    return np.where(keys[pos] == probe, hist[pos], 0)
+
+
+class FingerprintIndex:
+    """
+    Inverted index from peak-pair hash to (clip, anchor frame), FIFO-bounded.
+    Clips are grouped into segments of segment_clips; eviction drops the
+    oldest segment whole.
+    """
+
+    def __init__(self, max_clips: int):
+        self.max_clips = max_clips
+        self.segment_clips = max(1, min(_SEGMENT_CLIPS, max_clips // 8))
+        self.segments = []
+        self.clips = {}              # clip id -> segment
+
+    def __len__(self) -> int:
+        return len(self.clips)
+
+    def __contains__(self, clip_id: str) -> bool:
+        return clip_id in self.clips
+
+    def add(self, clip_id: str, fp: np.ndarray):
+        if clip_id in self.clips or len(fp) == 0:
+            return
+        if not self.segments or len(self.segments[-1].clip_ids) >= self.segment_clips:
+            self.segments.append(_Segment())
+        self.segments[-1].add(clip_id, fp)
+        self.clips[clip_id] = self.segments[-1]
+        self._evict()
+
+    def load(self, items: list):
+        """Bulk add of [(clip id, fingerprint)], oldest first, sorted once per segment."""
+        items = [(clip_id, fp) for clip_id, fp in items if clip_id not in self.clips and len(fp)]
+        for start in range(0, len(items), self.segment_clips):
+            segment = _Segment(items[start:start + self.segment_clips])
+            self.segments.append(segment)
+            self.clips.update((clip_id, segment) for clip_id in segment.clip_ids)
+        self._evict()
+
+    def _evict(self):
+        while len(self.clips) > self.max_clips:
+            for clip_id in self.segments.pop(0).clip_ids:
+                del self.clips[clip_id]
+
+    def items(self):
+        """(clip id, fingerprint) of every indexed clip, oldest first."""
+        for segment in self.segments:
+            for slot, clip_id in enumerate(segment.clip_ids):
+                yield clip_id, segment.fingerprint(slot)
+
+    def search(self, fp: np.ndarray, min_matches: int, min_score: float) -> list:
+        """Returns [(score, clip id)] of clips aligned with fp, best first."""
+        if len(fp) == 0:
+            return []
+
+        found = []
+        for segment in self.segments:
+            slots, matches = segment.best_alignments(fp)
+            for slot, best in zip(slots.tolist(), matches.tolist()):
+                score = best / len(fp)
+                if best >= min_matches and score >= min_score:
+                    found.append((min(score, 1.0), segment.clip_ids[slot]))
+        found.sort(reverse=True)
+        return found
+
+
+_INDEX = None
+_FILE_ROWS = 0
+_LOCK = threading.Lock()
+
+STATS = {
+    "lookups": 0,
+    "exact_hits": 0,
+    "near_dup_hits": 0,
+    "misses": 0,
+    "compactions": 0,
+}
+
+
+def _encode(fp: np.ndarray) -> str:
+    return base64.b64encode(fp.astype("<i4").tobytes()).decode("ascii")
+
+
+def _decode(s: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(s), dtype="<i4").astype(np.int64).reshape(-1, 2)
+
+
+def _write_index(index: FingerprintIndex):
+    global _FILE_ROWS
+    os.makedirs(os.path.dirname(AUDIO_FP_INDEX_PATH) or ".", exist_ok=True)
+    tmp = f"{AUDIO_FP_INDEX_PATH}.tmp"
+    with open(tmp, "w", encoding="ascii") as f:
+        f.writelines(f"{clip_id}\t{_encode(fp)}\n" for clip_id, fp in index.items())
+    os.replace(tmp, AUDIO_FP_INDEX_PATH)
+    _FILE_ROWS = len(index)
+
+
+def _get_index() -> FingerprintIndex:
+    global _INDEX, _FILE_ROWS
+    if _INDEX is not None:
+        return _INDEX
+
+    # only the newest max_clips rows can survive eviction, so only those are decoded
+    lines = {}
+    total = 0
+    try:
+        with open(AUDIO_FP_INDEX_PATH, "r", encoding="ascii") as f:
+            for line in f:
+                total += 1
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 2:
+                    lines.pop(parts[0], None)
+                    lines[parts[0]] = parts[1]
+                    if len(lines) > AUDIO_FP_MAX_CLIPS:
+                        del lines[next(iter(lines))]
+    except FileNotFoundError:
+        pass
+
+    index = FingerprintIndex(AUDIO_FP_MAX_CLIPS)
+    index.load([(clip_id, _decode(encoded)) for clip_id, encoded in lines.items()])
+    _INDEX = index
+    _FILE_ROWS = total
+    _maybe_compact(index)
+    return _INDEX
+
+
+def _maybe_compact(index: FingerprintIndex):
+    # evicted clips stay in the file until it is rewritten
+    if _FILE_ROWS > len(index) * 3 // 2 + index.segment_clips:
+        _write_index(index)
+        STATS["compactions"] += 1
+
+
+def fp_index_add(audio_hash: str, fp: np.ndarray):
+    """Registers a clip (by sha256 of its trimmed WAV) under its fingerprint."""
+    global _FILE_ROWS
+    if not AUDIO_FP_ENABLED or len(fp) == 0:
+        return
+    with _LOCK:
+        index = _get_index()
+        if audio_hash in index:
+            return
+        index.add(audio_hash, fp)
+        os.makedirs(os.path.dirname(AUDIO_FP_INDEX_PATH) or ".", exist_ok=True)
+        with open(AUDIO_FP_INDEX_PATH, "a", encoding="ascii") as f:
+            f.write(f"{audio_hash}\t{_encode(fp)}\n")
+        _FILE_ROWS += 1
+        _maybe_compact(index)
+
+
+def fp_index_search(fp: np.ndarray) -> list:
+    """Returns audio hashes of near-identical indexed clips, best first."""
+    if not AUDIO_FP_ENABLED:
+        return []
+    with _LOCK:
+        return [clip_id for _, clip_id in _get_index().search(fp, AUDIO_FP_MIN_MATCHES, AUDIO_FP_MIN_SCORE)]
+
+
+def record_audio_lookup(outcome: str):
+    """outcome: "exact_hits" (including re-upload aliases), "near_dup_hits" or "misses"."""
+    STATS["lookups"] += 1
+    STATS[outcome] += 1
+
+
+def audio_fp_stats() -> dict:
+    lookups = STATS["lookups"]
+    return {
+        **STATS,
+        "indexed_clips": len(_INDEX) if _INDEX is not None else 0,
+        "exact_hit_rate": round(STATS["exact_hits"] / lookups, 4) if lookups else 0.0,
+        "near_dup_hit_rate": round(STATS["near_dup_hits"] / lookups, 4) if lookups else 0.0,
+    }
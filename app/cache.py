@@ -1,25 +1,249 @@
 import os
+import time
 import hashlib
 import json
+import threading
+from collections import OrderedDict
+
+from app import cache_sqlite
 
 CACHE_DIR = os.getenv("CACHE_DIR", "./cache")
 
+# "files": one {key}.json per entry under CACHE_DIR
+# "sqlite": single WAL-mode database at CACHE_DB_PATH (see app/cache_sqlite.py)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "files").lower()
+
+# Entries older than this are treated as misses in both tiers (0 = never expire)
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
+# In-process LRU tier, bounded by entry count and serialized size
+CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "2048"))
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Disk tier eviction, run in the background at most every CACHE_DISK_SWEEP_SECONDS
+CACHE_DISK_MAX_BYTES = int(os.getenv("CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+CACHE_DISK_SWEEP_SECONDS = int(os.getenv("CACHE_DISK_SWEEP_SECONDS", "600"))
+# A write's .tmp file this old was left by a crash before its os.replace
+_STALE_TMP_SECONDS = 300
+
+# key -> (expires_at, json_bytes); values are kept serialized so callers
+# always get a fresh dict they can mutate, and so the byte budget is exact.
+_MEMORY = OrderedDict()
+_MEMORY_BYTES = 0
+_LOCK = threading.Lock()
+_LAST_SWEEP = 0.0
+_SWEEPING = False
+_NAMESPACE = None
+
+STATS = {
+    "memory_hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "expired": 0,
+    "memory_evictions": 0,
+    "disk_evictions": 0,
+}
+
 def ensure_cache_dir():
     os.makedirs(CACHE_DIR, exist_ok=True)
 
 def sha256_bytes(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
-def cache_get(key: str):
-    ensure_cache_dir()
+def cache_namespace() -> str:
+    """
+    Model + prompt version tag for the sqlite backend, so changing
+    OPENAI_MODEL or any prompt text stops serving results made with the old ones.
+    CACHE_NAMESPACE overrides it.
+    """
+    global _NAMESPACE
+    if _NAMESPACE is not None:
+        return _NAMESPACE
+
+    _NAMESPACE = os.getenv("CACHE_NAMESPACE")
+    if not _NAMESPACE:
+        from app import prompts, prompts_validate
+
+        h = hashlib.sha256()
+        for module in (prompts, prompts_validate):
+            for name in sorted(vars(module)):
+                if name.isupper() and isinstance(getattr(module, name), str):
+                    h.update(name.encode("utf-8"))
+                    h.update(getattr(module, name).encode("utf-8"))
+        model = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+        _NAMESPACE = f"{model}:{h.hexdigest()[:12]}"
+    return _NAMESPACE
+
+def _expires_at(written_at: float) -> float:
+    return written_at + CACHE_TTL_SECONDS if CACHE_TTL_SECONDS > 0 else float("inf")
+
+def _min_written_at() -> float:
+    return time.time() - CACHE_TTL_SECONDS if CACHE_TTL_SECONDS > 0 else 0.0
+
+def _disk_read(key: str):
+    """Returns (written_at, json_bytes) from the configured backend, or None."""
+    if CACHE_BACKEND == "sqlite":
+        return cache_sqlite.store_get(cache_namespace(), key)
+
     path = os.path.join(CACHE_DIR, f"{key}.json")
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return None
+    try:
+        with open(path, "rb") as f:
+            return os.fstat(f.fileno()).st_mtime, f.read()
+    except FileNotFoundError:
+        return None
+
+def _disk_write(key: str, data: bytes):
+    if CACHE_BACKEND == "sqlite":
+        cache_sqlite.store_set(cache_namespace(), key, data)
+        return
 
-def cache_set(key: str, value: dict):
     ensure_cache_dir()
+    # write-then-rename so readers never see a partial file
     path = os.path.join(CACHE_DIR, f"{key}.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(value, f, ensure_ascii=False, indent=2)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _memory_put(key: str, data: bytes, expires_at: float):
+    global _MEMORY_BYTES
+    if len(data) > CACHE_MEMORY_MAX_BYTES:
+        return
+
+    with _LOCK:
+        old = _MEMORY.pop(key, None)
+        if old is not None:
+            _MEMORY_BYTES -= len(old[1])
+
+        _MEMORY[key] = (expires_at, data)
+        _MEMORY_BYTES += len(data)
+
+        while len(_MEMORY) > CACHE_MEMORY_MAX_ENTRIES or _MEMORY_BYTES > CACHE_MEMORY_MAX_BYTES:
+            _, (_, evicted) = _MEMORY.popitem(last=False)
+            _MEMORY_BYTES -= len(evicted)
+            STATS["memory_evictions"] += 1
+
+def _memory_get(key: str):
+    global _MEMORY_BYTES
+    with _LOCK:
+        entry = _MEMORY.get(key)
+        if entry is None:
+            return None
+
+        expires_at, data = entry
+        if expires_at <= time.time():
+            del _MEMORY[key]
+            _MEMORY_BYTES -= len(data)
+            STATS["expired"] += 1
+            return None
+
+        _MEMORY.move_to_end(key)
+        return data
+
+def cache_get(key: str):
+    data = _memory_get(key)
+    if data is not None:
+        STATS["memory_hits"] += 1
+        return json.loads(data)
+
+    found = _disk_read(key)
+    if found is None:
+        STATS["misses"] += 1
+        return None
+
+    written_at, data = found
+    expires_at = _expires_at(written_at)
+    if expires_at <= time.time():
+        STATS["expired"] += 1
+        STATS["misses"] += 1
+        return None
+
+    STATS["disk_hits"] += 1
+    _memory_put(key, data, expires_at)
+    return json.loads(data)
+
+def cache_set(key: str, value: dict):
+    data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    _disk_write(key, data)
+    _memory_put(key, data, _expires_at(time.time()))
+    _maybe_sweep_disk()
+
+def _maybe_sweep_disk():
+    global _LAST_SWEEP, _SWEEPING
+    now = time.time()
+    with _LOCK:
+        if _SWEEPING or now - _LAST_SWEEP < CACHE_DISK_SWEEP_SECONDS:
+            return
+        _SWEEPING = True
+        _LAST_SWEEP = now
+    threading.Thread(target=_sweep_disk, daemon=True).start()
+
+def _sweep_disk():
+    """
+    Drops expired entries and stale .tmp files, then the oldest entries
+    until under CACHE_DISK_MAX_BYTES.
+    """
+    global _SWEEPING
+    try:
+        if CACHE_BACKEND == "sqlite":
+            STATS["disk_evictions"] += cache_sqlite.sweep(
+                cache_namespace(), _min_written_at(), CACHE_DISK_MAX_BYTES
+            )
+            return
+
+        now = time.time()
+        files = []
+        total = 0
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                is_tmp = entry.name.endswith(".tmp")
+                if not is_tmp and not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if is_tmp:
+                    if now - st.st_mtime > _STALE_TMP_SECONDS:
+                        try:
+                            os.remove(entry.path)
+                        except FileNotFoundError:
+                            pass
+                    else:
+                        total += st.st_size  # a write in progress
+                    continue
+                if _expires_at(st.st_mtime) <= now:
+                    _remove(entry.path)
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+
+        if total > CACHE_DISK_MAX_BYTES:
+            files.sort()
+            for _, size, path in files:
+                if total <= CACHE_DISK_MAX_BYTES:
+                    break
+                _remove(path)
+                total -= size
+    finally:
+        _SWEEPING = False
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+        STATS["disk_evictions"] += 1
+    except FileNotFoundError:
+        pass
+
+def cache_stats() -> dict:
+    with _LOCK:
+        entries = len(_MEMORY)
+        size = _MEMORY_BYTES
+    lookups = STATS["memory_hits"] + STATS["disk_hits"] + STATS["misses"]
+    hits = STATS["memory_hits"] + STATS["disk_hits"]
+    return {
+        **STATS,
+        "memory_entries": entries,
+        "memory_bytes": size,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,184 @@
+"""
+Single-file SQLite backend for app.cache (CACHE_BACKEND=sqlite).
+
+Rows are keyed by (namespace, key); values are zlib-compressed compact JSON.
+Maintenance:
+
+    python -m app.cache_sqlite migrate [./cache]   # import a legacy {key}.json directory
+    python -m app.cache_sqlite compact             # drop stale/expired rows, checkpoint, VACUUM
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "./cache/cache.sqlite")
+
+_conn = None
+_lock = threading.Lock()
+
+
+def _connect():
+    global _conn
+    if _conn is not None:
+        return _conn
+
+    os.makedirs(os.path.dirname(CACHE_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        written_at REAL NOT NULL,
+        value BLOB NOT NULL,
+        PRIMARY KEY(namespace, key)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_written_at ON cache_entries(written_at)")
+    _conn = conn
+    return _conn
+
+
+def store_get(namespace: str, key: str):
+    """Returns (written_at, json_bytes) or None."""
+    with _lock:
+        row = _connect().execute(
+            "SELECT written_at, value FROM cache_entries WHERE namespace=? AND key=?",
+            (namespace, key),
+        ).fetchone()
+    if row is None:
+        return None
+    return row[0], zlib.decompress(row[1])
+
+
+def store_set(namespace: str, key: str, data: bytes, written_at: float = None):
+    blob = zlib.compress(data, 6)
+    with _lock:
+        _connect().execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, written_at, value) VALUES (?, ?, ?, ?)",
+            (namespace, key, written_at or time.time(), blob),
+        )
+
+
+def store_set_many(namespace: str, items):
+    """Bulk insert of (key, json_bytes, written_at) in one transaction."""
+    rows = [(namespace, k, ts, zlib.compress(d, 6)) for k, d, ts in items]
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, written_at, value) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return len(rows)
+
+
+def sweep(namespace: str, min_written_at: float, max_bytes: int) -> int:
+    """
+    Deletes rows from other namespaces, rows written before min_written_at,
+    then the oldest rows of this namespace until under max_bytes.
+    Returns the number of rows removed.
+    """
+    with _lock:
+        conn = _connect()
+        conn.execute("BEGIN")
+        try:
+            removed = conn.execute(
+                "DELETE FROM cache_entries WHERE namespace<>? OR written_at<?",
+                (namespace, min_written_at),
+            ).rowcount
+
+            total = conn.execute(
+                "SELECT COALESCE(SUM(length(value)), 0) FROM cache_entries"
+            ).fetchone()[0]
+            if total > max_bytes:
+                cutoff = None
+                for written_at, size in conn.execute(
+                    "SELECT written_at, length(value) FROM cache_entries ORDER BY written_at"
+                ):
+                    total -= size
+                    cutoff = written_at
+                    if total <= max_bytes:
+                        break
+                if cutoff is not None:
+                    removed += conn.execute(
+                        "DELETE FROM cache_entries WHERE written_at<=?", (cutoff,)
+                    ).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    return removed
+
+
+def compact(namespace: str, min_written_at: float, max_bytes: int) -> int:
+    removed = sweep(namespace, min_written_at, max_bytes)
+    with _lock:
+        conn = _connect()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("VACUUM")
+    return removed
+
+
+def migrate_directory(src_dir: str, namespace: str, batch_size: int = 1000) -> int:
+    """Imports every {key}.json under src_dir, keeping file mtimes as written_at."""
+    imported = 0
+    batch = []
+    with os.scandir(src_dir) as it:
+        for entry in it:
+            if not entry.name.endswith(".json") or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, "rb") as f:
+                    raw = f.read()
+                written_at = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+
+            # re-serialize the legacy indent=2 files compactly
+            try:
+                data = json.dumps(json.loads(raw), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            except ValueError:
+                print(f"skipping corrupt entry {entry.name}", file=sys.stderr)
+                continue
+
+            batch.append((entry.name[:-len(".json")], data, written_at))
+            if len(batch) >= batch_size:
+                imported += store_set_many(namespace, batch)
+                batch = []
+
+    if batch:
+        imported += store_set_many(namespace, batch)
+    return imported
+
+
+def _main(argv):
+    from app.cache import CACHE_DIR, CACHE_DISK_MAX_BYTES, cache_namespace, _min_written_at
+
+    if not argv or argv[0] not in ("migrate", "compact"):
+        print(__doc__)
+        return 2
+
+    namespace = cache_namespace()
+    if argv[0] == "migrate":
+        src = argv[1] if len(argv) > 1 else CACHE_DIR
+        n = migrate_directory(src, namespace)
+        print(f"imported {n} entries from {src} into {CACHE_DB_PATH} (namespace {namespace})")
+    else:
+        n = compact(namespace, _min_written_at(), CACHE_DISK_MAX_BYTES)
+        print(f"removed {n} rows, compacted {CACHE_DB_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -1,34 +1,94 @@
 import os
 import base64
 import json
-import requests
+import time
+import asyncio
+from contextlib import nullcontext
 
-from fastapi import UploadFile, Request
+from fastapi import HTTPException, UploadFile, Request
 
-from app.prompts import SYSTEM_PROMPT
+from app.prompts import SYSTEM_PROMPT, PHOTO_PROMPT, SOUND_PROMPT
+from app.openai_client import chat_completion, chat_completion_streamed
 from app.cache import sha256_bytes, cache_get, cache_set
-from app.spectrogram import audio_to_spectrogram_image
 from app.species import match_species
-from app.media_utils import resize_image, trim_audio
+from app.species_fuzzy import fuzzy_match_species
+from app.media_utils import preprocess_photo, preprocess_photo_cascade
+from app.artifacts import decoded_audio, spectrogram_png
 from app.usage_db import log_usage
-from app.quotas import enforce_user_quota
+from app.quotas import refund_user_quota
+from app.singleflight import singleflight
+from app.media_executor import MEDIA_WORKERS, run_media
+from app.uploads import UPLOAD_MAX_AUDIO_BYTES, UPLOAD_MAX_PHOTO_BYTES, SpooledUpload, ingest_upload
+from app.upload_alias import alias_get, alias_set
+from app.jobs import Job, submit_job
+from app.streaming import sse_stream
+from app.local_classifier import (
+    LOCAL_CLASSIFIER_ENABLED,
+    LOCAL_CLASSIFIER_MODEL,
+    audio_features,
+    classify_local,
+)
+from app.phash import phash_index_add, phash_index_discard, phash_index_search, record_photo_lookup
+from app.audio_fingerprint import (
+    AUDIO_FP_ENABLED,
+    AUDIO_FP_INDEX_ALIGNMENTS,
+    audio_fingerprint,
+    fp_index_add,
+    fp_index_search,
+    record_audio_lookup,
+)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+
+# POST /api/identify/photos: images per request, and upstream calls in flight
+# per request in "each" mode
+IDENTIFY_BATCH_MAX_IMAGES = int(os.getenv("IDENTIFY_BATCH_MAX_IMAGES", "8"))
+IDENTIFY_BATCH_CONCURRENCY = int(os.getenv("IDENTIFY_BATCH_CONCURRENCY", "4"))
+
+# Photo cascade: ask about a small, low-detail image first and send the full
+# image only when the answer's top confidence is below
+# PHOTO_CASCADE_MIN_CONFIDENCE or its top species isn't in the species DB.
+PHOTO_CASCADE_ENABLED = os.getenv("PHOTO_CASCADE_ENABLED", "false").lower() == "true"
+PHOTO_CASCADE_MIN_CONFIDENCE = float(os.getenv("PHOTO_CASCADE_MIN_CONFIDENCE", "0.7"))
+
+CASCADE_STATS = {
+    "requests": 0,
+    "escalated": 0,
+    "escalated_low_confidence": 0,
+    "escalated_unmatched": 0,
+    "low_ms_total": 0.0,
+    "full_ms_total": 0.0,
+    "low_bytes_total": 0,
+    "full_bytes_total": 0,
+}
+
+# Put in front of PHOTO_PROMPT when several photos go in one request
+_MULTI_PHOTO_PREAMBLE = (
+    "The {n} photos below were taken of the same sighting and show the same bird. "
+    "Use all of them together and give one answer for the bird.\n"
+)
 
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY is not set")
 
 
-async def _call_openai_with_image(image_bytes: bytes, text: str = "") -> dict:
+async def _call_openai_with_image(
+    image_bytes: bytes, text: str = "", mime: str = "image/png", emit=None, detail: str = None
+) -> dict:
     """
     Calls OpenAI Chat Completions with a single image + optional prompt text.
     Returns a parsed JSON dict from the assistant output.
     If OpenAI returns non-JSON, it safely returns an "unknown" JSON object.
+    With emit, the completion is streamed and each prediction is passed to
+    emit("prediction", ...) normalized, as soon as the model finishes it.
+    detail: the image_url detail level ("low", "high"); default lets the API pick.
     """
-    b64 = base64.b64encode(image_bytes).decode("utf-8")
+    return await _call_openai_with_images([(image_bytes, mime)], text, emit, detail)
 
+
+async def _call_openai_with_images(images: list, text: str = "", emit=None, detail: str = None) -> dict:
+    """Same as _call_openai_with_image for several (bytes, mime) images in one message."""
     if not text:
         text = "Identify the bird species in this image and return JSON."
 
@@ -41,29 +101,31 @@ async def _call_openai_with_image(image_bytes: bytes, text: str = "") -> dict:
                 "role": "user",
                 "content": [
                     {"type": "text", "text": text},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/png;base64,{b64}"
-                        },
-                    },
+                    *(
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime};base64,{base64.b64encode(image_bytes).decode('utf-8')}",
+                                **({"detail": detail} if detail else {}),
+                            },
+                        }
+                        for image_bytes, mime in images
+                    ),
                 ],
             },
         ],
         "response_format": {"type": "json_object"},
     }
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
-    r = requests.post(OPENAI_URL, headers=headers, json=payload, timeout=60)
-    if r.status_code != 200:
-        raise RuntimeError(f"OpenAI error {r.status_code}: {r.text}")
+    if emit is None:
+        data = await chat_completion(payload)
+        content = data["choices"][0]["message"]["content"]
+    else:
+        def on_value(path, value):
+            if path[0] == "predictions" and len(path) == 2 and path[1] < 3 and isinstance(value, dict):
+                emit("prediction", {"index": path[1], **_normalize_prediction(value)})
 
-    data = r.json()
-    content = data["choices"][0]["message"]["content"]
+        content = await chat_completion_streamed(payload, on_value)
 
     try:
         return json.loads(content)
@@ -94,26 +156,35 @@ async def _call_openai_with_image(image_bytes: bytes, text: str = "") -> dict:
         }
 
 
-def _normalize_predictions(result: dict) -> dict:
-    preds = result.get("predictions", [])
-    normalized = []
-
-    for p in preds[:3]:
-        species_name = (p.get("species_name") or "").strip()
-        scientific_name = (p.get("scientific_name") or "").strip()
-        confidence = float(p.get("confidence") or 0.0)
-        reason = (p.get("reason") or "").strip()
+def _normalize_prediction(p: dict) -> dict:
+    species_name = (p.get("species_name") or "").strip()
+    scientific_name = (p.get("scientific_name") or "").strip()
+    confidence = float(p.get("confidence") or 0.0)
+    reason = (p.get("reason") or "").strip()
+
+    match = match_species(species_name, scientific_name)
+    match_score = 1.0 if match else 0.0
+    fuzzy = False
+    if not match:
+        # misspellings, Grey/Gray, hyphenation
+        match, match_score = fuzzy_match_species(species_name, scientific_name)
+        fuzzy = bool(match)
+
+    return {
+        "species_id": match.get("id") if match else None,
+        "species_name": match.get("species_name") if match else species_name,
+        "scientific_name": match.get("scientific_name") if match else scientific_name,
+        "confidence": max(0.0, min(1.0, confidence)),
+        "reason": reason,
+        "matched_to_db": bool(match),
+        "fuzzy_match": fuzzy,
+        "match_score": round(match_score, 3)
+    }
 
-        match = match_species(species_name, scientific_name)
 
-        normalized.append({
-            "species_id": match.get("id") if match else None,
-            "species_name": match.get("species_name") if match else species_name,
-            "scientific_name": match.get("scientific_name") if match else scientific_name,
-            "confidence": max(0.0, min(1.0, confidence)),
-            "reason": reason,
-            "matched_to_db": bool(match)
-        })
+def _normalize_predictions(result: dict) -> dict:
+    preds = result.get("predictions", [])
+    normalized = [_normalize_prediction(p) for p in preds[:3]]
 
     while len(normalized) < 3:
         normalized.append({
@@ -122,7 +193,9 @@ def _normalize_predictions(result: dict) -> dict:
             "scientific_name": "",
             "confidence": 0.1,
             "reason": "Not enough information to identify.",
-            "matched_to_db": False
+            "matched_to_db": False,
+            "fuzzy_match": False,
+            "match_score": 0.0
         })
 
     # Keep existing response fields
@@ -139,152 +212,421 @@ def _normalize_predictions(result: dict) -> dict:
 
 
 async def identify_from_photo(request: Request, image: UploadFile) -> dict:
-    raw_bytes = await image.read()
-    resized_bytes = resize_image(raw_bytes)
+    with await ingest_upload(image, UPLOAD_MAX_PHOTO_BYTES) as upload:
+        return await _identify_photo(request, upload)
 
-    key = f"photo_{sha256_bytes(resized_bytes)}"
-    cached = cache_get(key)
+
+async def _identify_photo(
+    request: Request,
+    upload: SpooledUpload,
+    endpoint: str = "/api/identify/photo",
+    upstream_slots: asyncio.Semaphore = None,
+    media_slots: asyncio.Semaphore = None,
+    emit=None,
+) -> dict:
+    raw_hash = upload.sha256
 
     user_id = request.headers.get("x-user-id", f"ip:{request.client.host if request.client else 'unknown'}")
     ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "unknown").split(",")[0].strip()
 
+    # Byte-identical re-upload: answer before decoding anything
+    alias_key = alias_get("photo", raw_hash)
+    if alias_key:
+        cached = cache_get(alias_key)
+        if cached:
+            cached["cached"] = True
+            log_usage(user_id, ip, endpoint, alias_key, True, OPENAI_MODEL, cached.get("input_bytes"))
+            return cached
+
+    small_bytes = None
+    async with media_slots or nullcontext():
+        if PHOTO_CASCADE_ENABLED:
+            resized_bytes, mime, phash, small_bytes = await run_media(preprocess_photo_cascade, upload.source)
+        else:
+            resized_bytes, mime, phash = await run_media(preprocess_photo, upload.source)
+
+    key = f"photo_{sha256_bytes(resized_bytes)}"
+    cached = cache_get(key)
+    outcome = "exact_hits" if cached else "misses"
+    served_key = key
+
+    if not cached:
+        # Same shot re-saved, re-compressed or lightly cropped
+        for _, dup_key in phash_index_search(phash):
+            cached = cache_get(dup_key)
+            if cached:
+                outcome = "near_dup_hits"
+                served_key = dup_key
+                break
+            phash_index_discard(dup_key)
+    record_photo_lookup(outcome)
+
     if cached:
+        alias_set("photo", raw_hash, served_key)
         cached["cached"] = True
-        log_usage(user_id, ip, "/api/identify/photo", key, True, OPENAI_MODEL, len(resized_bytes))
+        cached["near_duplicate"] = outcome == "near_dup_hits"
+        log_usage(user_id, ip, endpoint, served_key, True, OPENAI_MODEL, len(resized_bytes))
         return cached
 
-    photo_prompt = """
-You are an expert ornithologist. Identify the bird species visible in the photo.
-
-Return EXACTLY valid JSON in this format:
-
-{
-  "predictions": [
-    {
-      "species_name": "COMMON NAME (non-empty)",
-      "scientific_name": "Scientific name (non-empty if possible)",
-      "confidence": 0.0-1.0,
-      "reason": "1-2 short sentences describing visible features"
-    },
-    {
-      "species_name": "COMMON NAME (non-empty)",
-      "scientific_name": "Scientific name (non-empty if possible)",
-      "confidence": 0.0-1.0,
-      "reason": "..."
-    },
-    {
-      "species_name": "COMMON NAME (non-empty)",
-      "scientific_name": "Scientific name (non-empty if possible)",
-      "confidence": 0.0-1.0,
-      "reason": "..."
-    }
-  ],
-  "notes": "optional additional notes"
-}
+    async def _identify():
+        async with upstream_slots or nullcontext():
+            if small_bytes is not None:
+                normalized = await _identify_photo_cascade(resized_bytes, small_bytes, mime, emit)
+            else:
+                raw = await _call_openai_with_image(resized_bytes, PHOTO_PROMPT, mime, emit)
+                normalized = _normalize_predictions(raw)
+                normalized["input_bytes"] = len(resized_bytes)
+        normalized["cached"] = False
+
+        cache_set(key, normalized)
+        phash_index_add(phash, key)
+        return normalized
+
+    # Identical uploads already in flight share one upstream call
+    normalized, coalesced = await singleflight(key, _identify)
+    if coalesced:
+        normalized["cached"] = True
+    alias_set("photo", raw_hash, key)
+
+    log_usage(user_id, ip, endpoint, key, coalesced, OPENAI_MODEL, normalized.get("input_bytes"))
+    return normalized
 
-Rules:
-- Return exactly 3 predictions.
-- species_name MUST NOT be empty.
-- scientific_name should be provided when possible.
-- confidence must be between 0 and 1.
-- reason MUST NOT be empty.
-- Do not include any extra keys outside of this JSON object.
-"""
 
-    raw = await _call_openai_with_image(resized_bytes, photo_prompt)
+async def _identify_photo_cascade(full_bytes: bytes, small_bytes: bytes, mime: str, emit=None) -> dict:
+    """
+    Normalized result from the small image at low detail, or from the full
+    image when that answer isn't good enough. Streams send an "escalated"
+    event between the two stages' predictions. input_bytes is what was
+    sent upstream in total.
+    """
+    CASCADE_STATS["requests"] += 1
+    started = time.perf_counter()
+    raw = await _call_openai_with_image(small_bytes, PHOTO_PROMPT, mime, emit, detail="low")
+    normalized = _normalize_predictions(raw)
+    CASCADE_STATS["low_ms_total"] += (time.perf_counter() - started) * 1000
+    CASCADE_STATS["low_bytes_total"] += len(small_bytes)
+
+    top = max(normalized["predictions"], key=lambda p: p["confidence"])
+    if not top["matched_to_db"]:
+        reason = "unmatched"
+    elif top["confidence"] < PHOTO_CASCADE_MIN_CONFIDENCE:
+        reason = "low_confidence"
+    else:
+        normalized["input_bytes"] = len(small_bytes)
+        normalized["cascade_stage"] = "low"
+        return normalized
+
+    CASCADE_STATS["escalated"] += 1
+    CASCADE_STATS[f"escalated_{reason}"] += 1
+    if emit is not None:
+        emit("escalated", {"reason": reason})
+
+    started = time.perf_counter()
+    raw = await _call_openai_with_image(full_bytes, PHOTO_PROMPT, mime, emit)
     normalized = _normalize_predictions(raw)
-    normalized["cached"] = False
-    normalized["input_bytes"] = len(resized_bytes)
+    CASCADE_STATS["full_ms_total"] += (time.perf_counter() - started) * 1000
+    CASCADE_STATS["full_bytes_total"] += len(full_bytes)
 
-    cache_set(key, normalized)
-    log_usage(user_id, ip, "/api/identify/photo", key, False, OPENAI_MODEL, len(resized_bytes))
+    normalized["input_bytes"] = len(small_bytes) + len(full_bytes)
+    normalized["cascade_stage"] = "full"
+    normalized["escalation_reason"] = reason
     return normalized
 
 
-async def identify_from_audio(request: Request, audio: UploadFile) -> dict:
-    raw_bytes = await audio.read()
-    trimmed_wav = trim_audio(raw_bytes)
+def cascade_stats() -> dict:
+    requests, escalated = CASCADE_STATS["requests"], CASCADE_STATS["escalated"]
+    return {
+        "enabled": PHOTO_CASCADE_ENABLED,
+        **{k: v for k, v in CASCADE_STATS.items() if not k.endswith("_total")},
+        "escalation_rate": round(escalated / requests, 4) if requests else 0.0,
+        "low_ms_avg": round(CASCADE_STATS["low_ms_total"] / requests, 2) if requests else 0.0,
+        "full_ms_avg": round(CASCADE_STATS["full_ms_total"] / escalated, 2) if escalated else 0.0,
+        "low_bytes_avg": round(CASCADE_STATS["low_bytes_total"] / requests) if requests else 0,
+        "full_bytes_avg": round(CASCADE_STATS["full_bytes_total"] / escalated) if escalated else 0,
+    }
+
+
+async def stream_identify_photo(request: Request, image: UploadFile):
+    """
+    identify_from_photo as SSE: a "prediction" event per prediction while
+    the upstream completion streams in, then "result" (the usual response
+    body). Cache hits send "result" alone.
+    """
+    upload = await ingest_upload(image, UPLOAD_MAX_PHOTO_BYTES)
+    return sse_stream(lambda emit: _identify_photo(request, upload, emit=emit), [upload])
+
+
+async def submit_photo_job(request: Request, image: UploadFile) -> Job:
+    """Reads the upload now and queues identify_from_photo's work as a job."""
+    upload = await ingest_upload(image, UPLOAD_MAX_PHOTO_BYTES)
+    return submit_job(request, "identify_photo", lambda: _identify_photo(request, upload), [upload])
+
+
+async def submit_photos_job(request: Request, images: list, mode: str = "each") -> Job:
+    uploads = await _ingest_photos(images)
+    filenames = [i.filename for i in images]
+    return submit_job(
+        request, "identify_photos", lambda: _identify_photos(request, uploads, filenames, mode), uploads, len(uploads)
+    )
+
+
+async def identify_from_photos(request: Request, images: list, mode: str = "each") -> dict:
+    """
+    Several photos of one sighting in one request.
+    mode "each": every photo goes through the single-photo path (alias,
+    cache and near-duplicate lookups, singleflight), concurrently, with at
+    most IDENTIFY_BATCH_CONCURRENCY upstream calls and MEDIA_WORKERS
+    preprocessing tasks in flight.
+    mode "combined": all photos go upstream in one multi-image request.
+    Returns per-image results plus a ranking combined across them.
+    """
+    uploads = await _ingest_photos(images)
+    try:
+        return await _identify_photos(request, uploads, [i.filename for i in images], mode)
+    finally:
+        for upload in uploads:
+            upload.close()
+
+
+async def _ingest_photos(images: list) -> list:
+    uploads = []
+    try:
+        for image in images:
+            uploads.append(await ingest_upload(image, UPLOAD_MAX_PHOTO_BYTES))
+    except BaseException:
+        for upload in uploads:
+            upload.close()
+        raise
+    return uploads
+
+
+async def _identify_photos(request: Request, uploads: list, filenames: list, mode: str) -> dict:
+    if mode == "combined":
+        return await _identify_photos_combined(request, uploads, filenames)
+
+    slots = asyncio.Semaphore(IDENTIFY_BATCH_CONCURRENCY)
+    media_slots = asyncio.Semaphore(MEDIA_WORKERS)
+    results = await asyncio.gather(
+        *(_identify_photo(request, u, "/api/identify/photos", slots, media_slots) for u in uploads),
+        return_exceptions=True,
+    )
+
+    per_image = []
+    for index, (filename, result) in enumerate(zip(filenames, results)):
+        if isinstance(result, HTTPException):
+            per_image.append({"index": index, "filename": filename,
+                              "error": result.detail, "status": result.status_code})
+        elif isinstance(result, Exception):
+            per_image.append({"index": index, "filename": filename,
+                              "error": "Identification failed.", "status": 500})
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            per_image.append({"index": index, "filename": filename, **result})
+
+    return {
+        "mode": "each",
+        "images": per_image,
+        "ranking": _combined_ranking([r for r in results if isinstance(r, dict)]),
+    }
+
+
+async def _preprocess_photos(uploads: list, filenames: list) -> list:
+    # At most MEDIA_WORKERS of one batch's photos are in the media pool at
+    # a time; the rest wait here instead of filling its queue and getting 503.
+    slots = asyncio.Semaphore(MEDIA_WORKERS)
+
+    async def one(upload: SpooledUpload):
+        async with slots:
+            return await run_media(preprocess_photo, upload.source)
+
+    results = await asyncio.gather(*(one(u) for u in uploads), return_exceptions=True)
+    for index, (filename, result) in enumerate(zip(filenames, results)):
+        if not isinstance(result, BaseException):
+            continue
+        # pool overload/timeouts keep their 503/504 (and cancellation its
+        # CancelledError); any other failure is the image itself
+        if isinstance(result, HTTPException) or not isinstance(result, Exception):
+            raise result
+        raise HTTPException(status_code=400, detail=f"Image {index} ({filename}) could not be read.")
+    return results
+
+
+async def _identify_photos_combined(request: Request, uploads: list, filenames: list) -> dict:
+    user_id = request.headers.get("x-user-id", f"ip:{request.client.host if request.client else 'unknown'}")
+    ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "unknown").split(",")[0].strip()
+    preamble = _MULTI_PHOTO_PREAMBLE.format(n=len(uploads))
+
+    # The combined key is built from the per-photo cache keys. When every
+    # photo is a known re-upload they come from the alias index, so a cached
+    # combined answer needs no image work at all.
+    async def _preprocess():
+        # the whole batch was charged up front; none of it is answered now
+        try:
+            return await _preprocess_photos(uploads, filenames)
+        except HTTPException:
+            refund_user_quota(request, len(uploads))
+            raise
+
+    keys = [alias_get("photo", u.sha256) for u in uploads]
+    processed = None
+    if not all(keys):
+        processed = await _preprocess()
+        keys = [f"photo_{sha256_bytes(b)}" for b, _, _ in processed]
+    key = "photos_" + sha256_bytes(f"{preamble}|{'|'.join(keys)}".encode("utf-8"))
 
-    key = f"audio_{sha256_bytes(trimmed_wav)}"
     cached = cache_get(key)
+    if cached:
+        normalized, coalesced = cached, True
+    else:
+        if processed is None:
+            processed = await _preprocess()
+
+        async def _identify():
+            raw = await _call_openai_with_images([(b, mime) for b, mime, _ in processed], preamble + PHOTO_PROMPT)
+            normalized = _normalize_predictions(raw)
+            normalized["input_bytes"] = [len(b) for b, _, _ in processed]
+            cache_set(key, normalized)
+            return normalized
+
+        # Identical batches already in flight share one upstream call
+        normalized, coalesced = await singleflight(key, _identify)
+
+    input_bytes = normalized.get("input_bytes") or []
+    log_usage(user_id, ip, "/api/identify/photos", key, coalesced, OPENAI_MODEL, sum(input_bytes))
+    return {
+        "mode": "combined",
+        "cached": coalesced,
+        "images": [
+            {"index": i, "filename": name, "input_bytes": input_bytes[i] if i < len(input_bytes) else None}
+            for i, name in enumerate(filenames)
+        ],
+        "ranking": _combined_ranking([normalized]),
+        "notes": normalized.get("notes", ""),
+    }
+
+
+def _combined_ranking(results: list) -> list:
+    """
+    Merges normalized results by species (DB id, else name). score is the
+    mean confidence over all results, counting 0 where a species is absent.
+    """
+    merged = {}
+    for result in results:
+        for p in result.get("predictions", []):
+            if not p.get("species_id") and p.get("species_name") == "unknown":
+                continue
+            k = p.get("species_id") or (p.get("scientific_name") or p.get("species_name") or "").lower()
+            entry = merged.setdefault(k, {
+                "species_id": p.get("species_id"),
+                "species_name": p.get("species_name"),
+                "scientific_name": p.get("scientific_name"),
+                "matched_to_db": p.get("matched_to_db", False),
+                "fuzzy_match": p.get("fuzzy_match", False),
+                "total": 0.0,
+                "appearances": 0,
+                "best_confidence": 0.0,
+            })
+            entry["total"] += p.get("confidence", 0.0)
+            entry["appearances"] += 1
+            entry["best_confidence"] = max(entry["best_confidence"], p.get("confidence", 0.0))
+
+    ranking = []
+    for entry in merged.values():
+        total = entry.pop("total")
+        entry["score"] = round(total / len(results), 4) if results else 0.0
+        ranking.append(entry)
+    ranking.sort(key=lambda e: (e["score"], e["appearances"]), reverse=True)
+    return ranking
+
+
+async def identify_from_audio(request: Request, audio: UploadFile) -> dict:
+    with await ingest_upload(audio, UPLOAD_MAX_AUDIO_BYTES) as upload:
+        return await _identify_audio(request, upload)
+
+
+async def submit_audio_job(request: Request, audio: UploadFile) -> Job:
+    upload = await ingest_upload(audio, UPLOAD_MAX_AUDIO_BYTES)
+    return submit_job(request, "identify_sound", lambda: _identify_audio(request, upload), [upload])
+
+
+async def stream_identify_audio(request: Request, audio: UploadFile):
+    """identify_from_audio as SSE, see stream_identify_photo."""
+    upload = await ingest_upload(audio, UPLOAD_MAX_AUDIO_BYTES)
+    return sse_stream(lambda emit: _identify_audio(request, upload, emit), [upload])
+
+
+async def _identify_audio(request: Request, upload: SpooledUpload, emit=None) -> dict:
+    raw_hash = upload.sha256
 
     user_id = request.headers.get("x-user-id", f"ip:{request.client.host if request.client else 'unknown'}")
     ip = request.headers.get("x-forwarded-for", request.client.host if request.client else "unknown").split(",")[0].strip()
 
+    # Byte-identical re-upload: answer before decoding anything
+    alias_hash = alias_get("audio", raw_hash)
+    if alias_hash:
+        alias_key = f"audio_{alias_hash}"
+        cached = cache_get(alias_key)
+        if cached:
+            record_audio_lookup("exact_hits")
+            cached["cached"] = True
+            log_usage(user_id, ip, "/api/identify/sound", alias_key, True, OPENAI_MODEL, cached.get("input_bytes"))
+            return cached
+
+    trimmed_wav, samples = await decoded_audio(upload.sha256, upload.source)
+
+    audio_hash = sha256_bytes(trimmed_wav)
+    key = f"audio_{audio_hash}"
+    cached = cache_get(key)
+    outcome = "exact_hits" if cached else "misses"
+    served_hash = audio_hash
+
+    if not cached and AUDIO_FP_ENABLED:
+        # Same recording re-encoded, re-wrapped or with a little leading silence
+        fp = await run_media(audio_fingerprint, samples)
+        for dup_hash in fp_index_search(fp):
+            cached = cache_get(f"audio_{dup_hash}")
+            if cached:
+                cached["near_duplicate"] = True
+                outcome = "near_dup_hits"
+                served_hash = dup_hash
+                break
+    record_audio_lookup(outcome)
+
     if cached:
+        alias_set("audio", raw_hash, served_hash)
         cached["cached"] = True
-        log_usage(user_id, ip, "/api/identify/sound", key, True, OPENAI_MODEL, len(trimmed_wav))
+        log_usage(user_id, ip, "/api/identify/sound", f"audio_{served_hash}", True, OPENAI_MODEL, len(trimmed_wav))
         return cached
 
-    # Quota enforcement
-    enforce_user_quota(request)
-
-    # Generate bird-tuned spectrogram (Fix #2)
-    spectro_png = audio_to_spectrogram_image(trimmed_wav)
-
-    sound_prompt = """
-You are an expert ornithologist and bioacoustics specialist.
-
-You are looking at a LOG-FREQUENCY spectrogram image of a bird vocalization, tuned for 800Hz–11kHz.
-
-Before choosing species, analyze these spectrogram features:
-- frequency range (approximate low and high in Hz)
-- call type (whistle / trill / chirp / complex song)
-- repetition rate (slow / medium / rapid)
-- presence of harmonics (none / weak / strong)
-- note shape (rising / falling / flat / repeated syllables / multi-part)
-
-Then choose the 3 most likely bird species.
-
-Return EXACTLY valid JSON in this format:
-
-{
-  "analysis": {
-    "freq_range_hz": "e.g. 1500-6500",
-    "call_type": "whistle/trill/chirp/song",
-    "repetition_rate": "slow/medium/rapid",
-    "harmonics": "none/weak/strong",
-    "shape_summary": "one short sentence"
-  },
-  "predictions": [
-    {
-      "species_name": "COMMON NAME (non-empty)",
-      "scientific_name": "Scientific name (non-empty if possible)",
-      "confidence": 0.0-1.0,
-      "reason": "One sentence linking spectrogram features to this species"
-    },
-    {
-      "species_name": "COMMON NAME (non-empty)",
-      "scientific_name": "Scientific name (non-empty if possible)",
-      "confidence": 0.0-1.0,
-      "reason": "..."
-    },
-    {
-      "species_name": "COMMON NAME (non-empty)",
-      "scientific_name": "Scientific name (non-empty if possible)",
-      "confidence": 0.0-1.0,
-      "reason": "..."
-    }
-  ],
-  "notes": "optional"
-}
+    async def _identify():
+        normalized = None
+        if LOCAL_CLASSIFIER_ENABLED:
+            # Songs the reference set knows well are answered without upstream
+            normalized = classify_local(await run_media(audio_features, samples))
 
-Rules:
-- Return exactly 3 predictions.
-- species_name MUST NOT be empty.
-- reason MUST NOT be empty.
-- confidence must be between 0 and 1.
-- If uncertain, do NOT assign confidence above 0.5.
-- Only use confidence > 0.7 if the pattern is extremely distinctive.
-- Do not include any extra keys outside of this JSON object.
-"""
+        if normalized is None:
+            # Generate bird-tuned spectrogram (Fix #2)
+            spectro_png = await spectrogram_png(audio_hash, trimmed_wav, samples)
 
-    raw = await _call_openai_with_image(spectro_png, sound_prompt)
+            raw = await _call_openai_with_image(spectro_png, SOUND_PROMPT, emit=emit)
 
-    normalized = _normalize_predictions(raw)
-    normalized["cached"] = False
-    normalized["input_bytes"] = len(trimmed_wav)
+            normalized = _normalize_predictions(raw)
+        normalized["cached"] = False
+        normalized["input_bytes"] = len(trimmed_wav)
+
+        cache_set(key, normalized)
+        if AUDIO_FP_ENABLED:
+            index_fp = await run_media(audio_fingerprint, samples, AUDIO_FP_INDEX_ALIGNMENTS)
+            fp_index_add(audio_hash, index_fp)
+        return normalized
+
+    # Identical clips already in flight share one spectrogram + upstream call
+    normalized, coalesced = await singleflight(key, _identify)
+    if coalesced:
+        normalized["cached"] = True
+    alias_set("audio", raw_hash, audio_hash)
 
-    cache_set(key, normalized)
-    log_usage(user_id, ip, "/api/identify/sound", key, False, OPENAI_MODEL, len(trimmed_wav))
+    model = LOCAL_CLASSIFIER_MODEL if normalized.get("local") and not coalesced else OPENAI_MODEL
+    log_usage(user_id, ip, "/api/identify/sound", key, coalesced, model, len(trimmed_wav))
     return normalized
@@ -0,0 +1,251 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+from app.quotas import get_user_id, refund_user_quota
+from app.streaming import sse_event
+
+# Identifications submitted with "Prefer: respond-async" (or ?async=true) run
+# on JOB_WORKERS worker tasks; at most JOB_QUEUE_SIZE wait for a worker, and
+# one client may have JOB_MAX_PER_USER jobs queued or running.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "5"))
+# Finished jobs can be fetched for this long
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "600"))
+JOB_LONG_POLL_MAX_SECONDS = float(os.getenv("JOB_LONG_POLL_MAX_SECONDS", "30"))
+JOB_SSE_HEARTBEAT_SECONDS = 15.0
+
+_JOBS = OrderedDict()   # id -> Job, oldest first
+_QUEUE = None
+_WORKERS = []
+_ACTIVE_BY_USER = {}
+
+STATS = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected_queue_full": 0,
+    "rejected_per_user": 0,
+    "queue_ms_total": 0.0,
+    "queue_ms_max": 0.0,
+    "run_ms_total": 0.0,
+}
+
+
+class Job:
+    def __init__(self, kind: str, user_id: str, fn, uploads: list):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.fn = fn
+        self.uploads = uploads
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.started = asyncio.Event()
+        self.done = asyncio.Event()
+
+    def view(self) -> dict:
+        out = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == "done":
+            out["result"] = self.result
+        elif self.status == "failed":
+            out["error"] = self.error
+        return out
+
+
+def wants_async(request: Request) -> bool:
+    prefer = request.headers.get("prefer", "").lower()
+    return "respond-async" in prefer or request.query_params.get("async", "").lower() in ("1", "true")
+
+
+def check_job_capacity(request: Request):
+    """
+    Rejects before any work (or quota) is spent: 429 when this client
+    already has JOB_MAX_PER_USER jobs outstanding, 503 when the queue is full.
+    """
+    if _ACTIVE_BY_USER.get(get_user_id(request), 0) >= JOB_MAX_PER_USER:
+        STATS["rejected_per_user"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many jobs in progress ({JOB_MAX_PER_USER}); wait for one to finish.",
+            headers={"Retry-After": "5"},
+        )
+    if _QUEUE is not None and _QUEUE.full():
+        STATS["rejected_queue_full"] += 1
+        raise HTTPException(
+            status_code=503,
+            detail="Job queue is full, retry shortly.",
+            headers={"Retry-After": "10"},
+        )
+
+
+def submit_job(request: Request, kind: str, fn, uploads: list = (), cost: int = 1) -> Job:
+    """
+    Queues `await fn()` and returns the job at once. The ingested uploads
+    fn works on are closed when the job finishes (or is rejected here).
+    A rejection also gives back the cost the request was charged.
+    """
+    _ensure_workers()
+    _expire_jobs()
+    job = Job(kind, get_user_id(request), fn, list(uploads))
+    try:
+        _QUEUE.put_nowait(job)
+    except asyncio.QueueFull:
+        _close_uploads(job)
+        refund_user_quota(request, cost)
+        STATS["rejected_queue_full"] += 1
+        raise HTTPException(status_code=503, detail="Job queue is full, retry shortly.", headers={"Retry-After": "10"})
+
+    _JOBS[job.id] = job
+    _ACTIVE_BY_USER[job.user_id] = _ACTIVE_BY_USER.get(job.user_id, 0) + 1
+    STATS["submitted"] += 1
+    return job
+
+
+def accepted(job: Job) -> dict:
+    return {
+        **job.view(),
+        "poll": f"/api/jobs/{job.id}",
+        "events": f"/api/jobs/{job.id}/events",
+    }
+
+
+def _ensure_workers():
+    global _QUEUE
+    if _QUEUE is None:
+        _QUEUE = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+    if not _WORKERS:
+        for _ in range(JOB_WORKERS):
+            _WORKERS.append(asyncio.create_task(_worker()))
+
+
+async def _worker():
+    while True:
+        job = await _QUEUE.get()
+        job.status = "running"
+        job.started_at = time.time()
+        job.started.set()
+        try:
+            job.result = await job.fn()
+            job.status = "done"
+            STATS["completed"] += 1
+        except HTTPException as e:
+            job.status, job.error = "failed", {"status": e.status_code, "detail": e.detail}
+            STATS["failed"] += 1
+        except Exception:
+            logging.exception("job %s (%s) failed", job.id, job.kind)
+            job.status, job.error = "failed", {"status": 500, "detail": "Identification failed."}
+            STATS["failed"] += 1
+        finally:
+            job.finished_at = time.time()
+            job.fn = None
+            _close_uploads(job)
+            _ACTIVE_BY_USER[job.user_id] -= 1
+            if not _ACTIVE_BY_USER[job.user_id]:
+                del _ACTIVE_BY_USER[job.user_id]
+            queue_ms = (job.started_at - job.created_at) * 1000
+            STATS["queue_ms_total"] += queue_ms
+            STATS["queue_ms_max"] = max(STATS["queue_ms_max"], queue_ms)
+            STATS["run_ms_total"] += (job.finished_at - job.started_at) * 1000
+            job.done.set()
+            _QUEUE.task_done()
+
+
+def _close_uploads(job: Job):
+    for upload in job.uploads:
+        upload.close()
+    job.uploads = []
+
+
+def _expire_jobs():
+    cutoff = time.time() - JOB_TTL_SECONDS
+    expired = [j.id for j in _JOBS.values() if j.finished_at is not None and j.finished_at < cutoff]
+    for job_id in expired:
+        del _JOBS[job_id]
+
+
+def get_job(job_id: str) -> Job:
+    job = _JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job
+
+
+async def wait_job(job_id: str, wait: float) -> dict:
+    """Job state, after waiting up to `wait` seconds for it to finish (long-poll)."""
+    job = get_job(job_id)
+    wait = min(max(wait, 0.0), JOB_LONG_POLL_MAX_SECONDS)
+    if wait and not job.done.is_set():
+        try:
+            await asyncio.wait_for(job.done.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+    return job.view()
+
+
+def job_events(job_id: str):
+    """
+    SSE stream for a job: a "status" event per state change, then "result"
+    or "error". Raises 404 up front for unknown jobs.
+    """
+    return _job_event_stream(get_job(job_id))
+
+
+async def _job_event_stream(job: Job):
+    sent = job.status
+    yield sse_event("status", {"job_id": job.id, "status": sent})
+    for stage in (job.started, job.done):
+        while not stage.is_set():
+            try:
+                await asyncio.wait_for(stage.wait(), JOB_SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+        if job.status == "running" and sent != "running":
+            sent = "running"
+            yield sse_event("status", {"job_id": job.id, "status": sent})
+
+    if job.status == "done":
+        yield sse_event("result", job.result)
+    else:
+        yield sse_event("error", job.error)
+
+
+async def shutdown_jobs():
+    for task in _WORKERS:
+        task.cancel()
+    await asyncio.gather(*_WORKERS, return_exceptions=True)
+    _WORKERS.clear()
+    for job in _JOBS.values():
+        _close_uploads(job)
+
+
+def jobs_stats() -> dict:
+    started = STATS["completed"] + STATS["failed"]
+    return {
+        "workers": JOB_WORKERS,
+        "queue_size": JOB_QUEUE_SIZE,
+        "queued": _QUEUE.qsize() if _QUEUE is not None else 0,
+        "running": sum(1 for j in _JOBS.values() if j.status == "running"),
+        "retained": len(_JOBS),
+        **{k: v for k, v in STATS.items() if not k.endswith("_total")},
+        "queue_ms_avg": round(STATS["queue_ms_total"] / started, 2) if started else 0.0,
+        "queue_ms_max": round(STATS["queue_ms_max"], 2),
+        "run_ms_avg": round(STATS["run_ms_total"] / started, 2) if started else 0.0,
+    }
@@ -0,0 +1,112 @@
+import json
+
+
+class JsonStreamParser:
+    """
+    Incremental scanner for a JSON object that arrives in pieces (a streamed
+    completion). feed() returns the values that the new text completed, in
+    document order:
+      (key,), value        a member of the top-level object
+      (key, index), value  an element of a top-level array member
+    Containers are returned when they close, scalars at the following
+    delimiter. Slices that don't parse are skipped; the caller still parses
+    the whole text at the end.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._stack = []            # open containers, "{" or "["
+        self._in_str = False
+        self._escaped = False
+        self._str_start = 0
+        self._last_str = None       # last string closed in the top-level object
+        self._key = None            # top-level member being read
+        self._value_start = None    # where that member's value starts
+        self._index = 0             # element of a top-level array being read
+        self._elem_start = None
+
+    def feed(self, text: str) -> list:
+        self._buf += text
+        out = []
+        buf = self._buf
+        for pos in range(self._pos, len(buf)):
+            ch = buf[pos]
+            depth = len(self._stack)
+
+            if self._in_str:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_str = False
+                    if depth == 1:
+                        self._last_str = self._load(self._str_start, pos + 1)
+                continue
+
+            if ch == '"':
+                self._in_str = True
+                self._str_start = pos
+            elif ch in "{[":
+                self._stack.append(ch)
+                if depth == 1 and ch == "[":
+                    self._index = 0
+                    self._elem_start = pos + 1
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                if depth == 2 and self._stack[-1] == "[":
+                    self._emit_element(out, pos, closing=True)
+                self._stack.pop()
+                depth -= 1
+                if depth == 1:
+                    self._emit_member(out, pos + 1)
+                elif depth == 2 and self._stack[-1] == "[" and self._elem_start is not None:
+                    self._emit(out, (self._key, self._index), self._elem_start, pos + 1)
+                    self._index += 1
+                    self._elem_start = None
+                elif depth == 0:
+                    self._emit_member(out, pos)
+            elif ch == ":" and depth == 1:
+                self._key = self._last_str
+                self._value_start = pos + 1
+            elif ch == ",":
+                if depth == 1:
+                    self._emit_member(out, pos)
+                elif depth == 2 and self._stack[-1] == "[":
+                    self._emit_element(out, pos)
+                    self._elem_start = pos + 1
+
+        self._pos = len(buf)
+        return out
+
+    def _emit_member(self, out: list, end: int):
+        if self._value_start is not None:
+            self._emit(out, (self._key,), self._value_start, end)
+            self._value_start = None
+
+    def _emit_element(self, out: list, end: int, closing: bool = False):
+        # scalar element ending at a delimiter; "[]" has no element at all
+        if self._elem_start is None:
+            return
+        if closing and not self._buf[self._elem_start:end].strip():
+            return
+        self._emit(out, (self._key, self._index), self._elem_start, end)
+        self._index += 1
+
+    def _emit(self, out: list, path: tuple, start: int, end: int):
+        if self._key is None:
+            return
+        value = self._load(start, end)
+        if value is not _INVALID:
+            out.append((path, value))
+
+    def _load(self, start: int, end: int):
+        try:
+            return json.loads(self._buf[start:end])
+        except ValueError:
+            return _INVALID
+
+
+_INVALID = object()
@@ -0,0 +1,337 @@
+import os
+import sys
+import threading
+
+import numpy as np
+
+from app.species import get_species_by_id
+
+# Optional first pass for /api/identify/sound: log-mel statistics of the
+# trimmed clip, matched against a reference set of labelled clips. It answers
+# when the k nearest references agree on one species (share of the
+# similarity-weighted vote >= LOCAL_CLASSIFIER_MIN_CONFIDENCE) and that
+# species' closest reference has a cosine similarity of at least
+# LOCAL_CLASSIFIER_MIN_SIMILARITY; everything else goes upstream as before.
+# The build tool reports how both thresholds behave on the reference set.
+LOCAL_CLASSIFIER_ENABLED = os.getenv("LOCAL_CLASSIFIER_ENABLED", "false").lower() == "true"
+LOCAL_CLASSIFIER_INDEX_PATH = os.getenv("LOCAL_CLASSIFIER_INDEX_PATH", "./data/local_audio_index.npz")
+LOCAL_CLASSIFIER_K = int(os.getenv("LOCAL_CLASSIFIER_K", "7"))
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("LOCAL_CLASSIFIER_MIN_CONFIDENCE", "0.8"))
+LOCAL_CLASSIFIER_MIN_SIMILARITY = float(os.getenv("LOCAL_CLASSIFIER_MIN_SIMILARITY", "0.5"))
+# Logged as the model for answers served locally
+LOCAL_CLASSIFIER_MODEL = "local-knn"
+
+_SAMPLE_RATE = 22050
+_FRAME = 1024
+_HOP = 512
+_MEL_BANDS = 40
+_BAND_HZ = (800.0, 11000.0)     # same band as the spectrogram and fingerprints
+_ACTIVE_DB = 30.0               # frames this far below the loudest count as silence
+# Stored in the index; an index built with other feature settings is ignored
+FEATURE_VERSION = f"logmel-{_FRAME}-{_HOP}-{_MEL_BANDS}-{_BAND_HZ[0]:g}-{_BAND_HZ[1]:g}-{_ACTIVE_DB:g}"
+
+_WINDOW = np.hanning(_FRAME).astype(np.float32)
+
+STATS = {
+    "lookups": 0,
+    "served_local": 0,
+    "below_confidence": 0,
+    "below_similarity": 0,
+}
+
+
+def _hz_to_mel(hz):
+    return 2595.0 * np.log10(1.0 + np.asarray(hz) / 700.0)
+
+
+def _mel_to_hz(mel):
+    return 700.0 * (10 ** (np.asarray(mel) / 2595.0) - 1.0)
+
+
+def _mel_filterbank() -> np.ndarray:
+    """(_MEL_BANDS, _FRAME // 2 + 1) triangular filters between _BAND_HZ."""
+    edges = _mel_to_hz(np.linspace(_hz_to_mel(_BAND_HZ[0]), _hz_to_mel(_BAND_HZ[1]), _MEL_BANDS + 2))
+    freqs = np.fft.rfftfreq(_FRAME, 1.0 / _SAMPLE_RATE)
+    bank = np.zeros((_MEL_BANDS, len(freqs)), dtype=np.float32)
+    for i in range(_MEL_BANDS):
+        lo, mid, hi = edges[i], edges[i + 1], edges[i + 2]
+        rising = (freqs - lo) / (mid - lo)
+        falling = (hi - freqs) / (hi - mid)
+        bank[i] = np.clip(np.minimum(rising, falling), 0.0, None)
+    return bank
+
+
+_MEL_BANK = _mel_filterbank()
+
+
+def audio_features(samples: np.ndarray) -> np.ndarray:
+    """
+    Feature vector of a trimmed 22.05 kHz clip: per mel band, the mean level
+    (relative to the clip's overall level, so gain doesn't matter), its
+    standard deviation and mean absolute frame-to-frame change, over the
+    frames that aren't silence. Unnormalized; see LocalAudioIndex.
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < _FRAME:
+        samples = np.pad(samples, (0, _FRAME - len(samples)))
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, _FRAME)[::_HOP]
+    power = np.abs(np.fft.rfft(frames * _WINDOW, axis=1)) ** 2
+    logmel = 10 * np.log10(power @ _MEL_BANK.T + 1e-10)   # (frames, bands) in dB
+
+    loudness = logmel.max(axis=1)
+    active = logmel[loudness >= loudness.max() - _ACTIVE_DB]
+    if len(active) < 2:
+        active = logmel
+
+    mean = active.mean(axis=0)
+    return np.concatenate([
+        mean - mean.mean(),
+        active.std(axis=0),
+        np.abs(np.diff(active, axis=0)).mean(axis=0),
+    ]).astype(np.float32)
+
+
+class LocalAudioIndex:
+    """
+    Reference clips as standardized, unit-length feature rows, labelled with
+    species ids. Searching is one matrix-vector product.
+    """
+
+    def __init__(self, features: np.ndarray, labels: np.ndarray, mean: np.ndarray, scale: np.ndarray):
+        self.features = features
+        self.labels = labels
+        self.mean = mean
+        self.scale = scale
+
+    @classmethod
+    def build(cls, raw_features: np.ndarray, labels: list) -> "LocalAudioIndex":
+        raw_features = np.asarray(raw_features, dtype=np.float32)
+        mean = raw_features.mean(axis=0)
+        scale = raw_features.std(axis=0) + 1e-6
+        index = cls(np.empty((0, raw_features.shape[1]), np.float32), np.asarray(labels), mean, scale)
+        index.features = np.stack([index.embed(f) for f in raw_features])
+        return index
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            if str(data["version"]) != FEATURE_VERSION:
+                return None
+            return cls(data["features"], data["labels"], data["mean"], data["scale"])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path, version=FEATURE_VERSION, features=self.features,
+            labels=self.labels, mean=self.mean, scale=self.scale,
+        )
+        os.replace(tmp_path, path)
+
+    def embed(self, raw: np.ndarray) -> np.ndarray:
+        v = (raw - self.mean) / self.scale
+        return (v / (np.linalg.norm(v) + 1e-9)).astype(np.float32)
+
+    def vote(self, vector: np.ndarray, k: int, exclude: int = None) -> list:
+        """
+        [(species id, vote share, best similarity)] for the k nearest
+        references, most votes first. exclude: a row to leave out (for
+        leave-one-out evaluation).
+        """
+        sims = self.features @ vector
+        if exclude is not None:
+            sims[exclude] = -np.inf
+        k = min(k, len(sims) - (exclude is not None))
+        if k <= 0:
+            return []
+        nearest = np.argpartition(-sims, k - 1)[:k]
+
+        votes, best = {}, {}
+        for i in nearest:
+            label, sim = str(self.labels[i]), float(sims[i])
+            # sharper than linear, so one close match outweighs several loose ones
+            votes[label] = votes.get(label, 0.0) + max(sim, 0.0) ** 4
+            best[label] = max(best.get(label, -1.0), sim)
+        total = sum(votes.values())
+        ranked = sorted(votes, key=votes.get, reverse=True)
+        return [(label, votes[label] / total if total else 0.0, best[label]) for label in ranked]
+
+
+_INDEX = None
+_INDEX_LOADED = False
+_LOCK = threading.Lock()
+
+
+def _get_index():
+    global _INDEX, _INDEX_LOADED
+    if _INDEX_LOADED:
+        return _INDEX
+    with _LOCK:
+        if not _INDEX_LOADED:
+            try:
+                _INDEX = LocalAudioIndex.load(LOCAL_CLASSIFIER_INDEX_PATH)
+            except FileNotFoundError:
+                _INDEX = None
+            _INDEX_LOADED = True
+    return _INDEX
+
+
+def classify_local(features: np.ndarray):
+    """
+    Identification result (the shape _normalize_predictions produces) when
+    the local index is confident about a clip with these audio_features,
+    else None. features are computed by the caller (through run_media); the
+    vote itself is one small matrix product.
+    """
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    index = _get_index()
+    if index is None or not len(index.labels):
+        return None
+
+    STATS["lookups"] += 1
+    ranked = index.vote(index.embed(features), LOCAL_CLASSIFIER_K)
+    if not ranked:
+        return None
+    top_id, confidence, similarity = ranked[0]
+    if confidence < LOCAL_CLASSIFIER_MIN_CONFIDENCE:
+        STATS["below_confidence"] += 1
+        return None
+    if similarity < LOCAL_CLASSIFIER_MIN_SIMILARITY:
+        STATS["below_similarity"] += 1
+        return None
+    STATS["served_local"] += 1
+
+    predictions = []
+    for species_id, share, _ in ranked[:3]:
+        s = get_species_by_id(species_id) or {}
+        predictions.append({
+            "species_id": species_id,
+            "species_name": s.get("species_name", species_id),
+            "scientific_name": s.get("scientific_name", ""),
+            "confidence": round(share, 4),
+            "reason": "Closely matches reference recordings of this species.",
+            "matched_to_db": bool(s),
+            "fuzzy_match": False,
+            "match_score": 1.0 if s else 0.0,
+        })
+    while len(predictions) < 3:
+        predictions.append({
+            "species_id": None,
+            "species_name": "unknown",
+            "scientific_name": "",
+            "confidence": 0.0,
+            "reason": "No other species among the nearest reference recordings.",
+            "matched_to_db": False,
+            "fuzzy_match": False,
+            "match_score": 0.0,
+        })
+    return {"predictions": predictions, "notes": "Identified by the local audio classifier.", "local": True}
+
+
+def local_classifier_stats() -> dict:
+    lookups = STATS["lookups"]
+    index = _INDEX
+    return {
+        **STATS,
+        "enabled": LOCAL_CLASSIFIER_ENABLED,
+        "reference_clips": len(index.labels) if index is not None else 0,
+        "species": len(set(index.labels.tolist())) if index is not None else 0,
+        "local_share": round(STATS["served_local"] / lookups, 4) if lookups else 0.0,
+    }
+
+
+def build_index(reference_dir: str, out_path: str) -> LocalAudioIndex:
+    """
+    Builds the index from reference_dir/<species id>/<any audio file>; each
+    file contributes its first AUDIO_TRIM_SECONDS, decoded like an upload.
+    Directories that aren't species_list.json ids are skipped.
+    """
+    from app.media_utils import decode_audio
+
+    raw, labels = [], []
+    for species_id in sorted(os.listdir(reference_dir)):
+        species_dir = os.path.join(reference_dir, species_id)
+        if not os.path.isdir(species_dir):
+            continue
+        if get_species_by_id(species_id) is None:
+            print(f"skipping {species_id}: not in the species list", file=sys.stderr)
+            continue
+        for name in sorted(os.listdir(species_dir)):
+            path = os.path.join(species_dir, name)
+            try:
+                _, samples = decode_audio(path)
+            except Exception as e:
+                print(f"skipping {path}: {e}", file=sys.stderr)
+                continue
+            raw.append(audio_features(samples))
+            labels.append(species_id)
+
+    if not raw:
+        raise ValueError(f"no decodable reference clips under {reference_dir}")
+    index = LocalAudioIndex.build(np.stack(raw), labels)
+    index.save(out_path)
+    return index
+
+
+def evaluate(index: LocalAudioIndex, k: int = None) -> list:
+    """
+    Leave-one-out over the references: for each confidence threshold,
+    (threshold, share answered locally, accuracy of those answers).
+    """
+    k = k or LOCAL_CLASSIFIER_K
+    outcomes = []
+    for i in range(len(index.labels)):
+        ranked = index.vote(index.features[i], k, exclude=i)
+        if ranked:
+            top_id, confidence, similarity = ranked[0]
+            if similarity >= LOCAL_CLASSIFIER_MIN_SIMILARITY:
+                outcomes.append((confidence, top_id == str(index.labels[i])))
+                continue
+        outcomes.append((0.0, False))
+
+    rows = []
+    for threshold in (0.5, 0.6, 0.7, 0.8, 0.9, 0.95):
+        answered = [ok for confidence, ok in outcomes if confidence >= threshold]
+        rows.append((
+            threshold,
+            len(answered) / len(outcomes) if outcomes else 0.0,
+            sum(answered) / len(answered) if answered else 0.0,
+        ))
+    return rows
+
+
+def similarity_spread(index: LocalAudioIndex) -> dict:
+    """Percentiles (5, 50, 95) of each reference's nearest same-species and other-species similarity."""
+    sims = index.features @ index.features.T
+    np.fill_diagonal(sims, -np.inf)
+    same = index.labels[:, None] == index.labels[None, :]
+    out = {}
+    for name, mask in (("same_species", same), ("other_species", ~same)):
+        nearest = np.where(mask, sims, -np.inf).max(axis=1)
+        nearest = nearest[np.isfinite(nearest)]
+        out[name] = np.percentile(nearest, [5, 50, 95]).round(3).tolist() if len(nearest) else []
+    return out
+
+
+def _main(argv):
+    if len(argv) not in (2, 3) or argv[0] != "build":
+        print("usage: python -m app.local_classifier build <reference dir> [index path]")
+        return 2
+
+    out_path = argv[2] if len(argv) > 2 else LOCAL_CLASSIFIER_INDEX_PATH
+    index = build_index(argv[1], out_path)
+    print(f"indexed {len(index.labels)} clips of {len(set(index.labels.tolist()))} species into {out_path}")
+    spread = similarity_spread(index)
+    print(f"nearest reference similarity p5/p50/p95: same species {spread['same_species']}, "
+          f"other species {spread['other_species']}")
+    print(f"leave-one-out, k={LOCAL_CLASSIFIER_K}, min similarity {LOCAL_CLASSIFIER_MIN_SIMILARITY}:")
+    print("  min confidence  answered locally  accuracy")
+    for threshold, answered, accuracy in evaluate(index):
+        print(f"  {threshold:14.2f}  {answered:16.1%}  {accuracy:8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -1,13 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
 import os
 
-from app.identify import identify_from_photo, identify_from_audio
-from app.validate import validate_sound_against_candidates
-from app.quotas import enforce_user_quota
-from app.usage_db import init_db, fetch_recent_logs
+from app.identify import (
+    IDENTIFY_BATCH_MAX_IMAGES,
+    identify_from_photo,
+    identify_from_photos,
+    identify_from_audio,
+    submit_photo_job,
+    submit_photos_job,
+    submit_audio_job,
+    stream_identify_photo,
+    stream_identify_audio,
+    cascade_stats,
+)
+from app.validate import validate_sound_against_candidates, submit_validate_job, stream_validate_sound
+from app.jobs import accepted, check_job_capacity, job_events, jobs_stats, shutdown_jobs, wait_job, wants_async
+from app.streaming import stream_stats, wants_stream
+from app.quotas import enforce_user_quota, flush_quotas, quota_stats
+from app.usage_db import init_db, fetch_recent_logs, flush_usage_logs, usage_log_stats, query_logs, query_rollups
+from app.openai_client import close_client
+from app.singleflight import singleflight_stats
+from app.cache import cache_stats
+from app.phash import photo_cache_stats
+from app.audio_fingerprint import audio_fp_stats
+from app.media_executor import media_executor_stats, shutdown_media_executor
+from app.upload_alias import alias_stats
+from app.artifacts import artifact_stats
+from app.local_classifier import local_classifier_stats
+from app.uploads import UploadLimitMiddleware, upload_stats
 
 
 load_dotenv()
@@ -18,6 +42,8 @@ FRONTEND_API_KEY = os.getenv("FRONTEND_API_KEY", "")
 
 app = FastAPI(title="BirdSpot AI Identify API", version="2.1")
 
+# added first so it sits inside CORS and 413s still carry CORS headers
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # tighten later
@@ -35,6 +61,28 @@ def check_frontend_key(request: Request):
         raise HTTPException(status_code=401, detail="Invalid frontend API key.")
 
 
+def job_accepted(job) -> JSONResponse:
+    body = accepted(job)
+    return JSONResponse(body, status_code=202, headers={"Location": body["poll"]})
+
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await shutdown_jobs()
+    await close_client()
+    shutdown_media_executor()
+    flush_usage_logs()
+    flush_quotas()
+
+
 @app.get("/health")
 def health():
     return {"ok": True}
@@ -43,17 +91,54 @@ def health():
 @app.post("/api/identify/photo")
 async def identify_photo(request: Request, image: UploadFile = File(...)):
     check_frontend_key(request)
+    job_mode = wants_async(request)
+    if job_mode:
+        check_job_capacity(request)
     enforce_user_quota(request)
 
     if not image.content_type or not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image.")
 
+    if job_mode:
+        return job_accepted(await submit_photo_job(request, image))
+    if wants_stream(request):
+        return sse_response(await stream_identify_photo(request, image))
     return await identify_from_photo(request, image)
 
 
+@app.post("/api/identify/photos")
+async def identify_photos(
+    request: Request,
+    images: List[UploadFile] = File(...),
+    mode: str = Form("each"),
+):
+    check_frontend_key(request)
+
+    if mode not in ("each", "combined"):
+        raise HTTPException(status_code=400, detail="mode must be 'each' or 'combined'.")
+    if len(images) > IDENTIFY_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {IDENTIFY_BATCH_MAX_IMAGES} images per request.")
+    for image in images:
+        if not image.content_type or not image.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="All files must be images.")
+
+    job_mode = wants_async(request)
+    if job_mode:
+        check_job_capacity(request)
+    # one identification per photo, whichever mode
+    enforce_user_quota(request, cost=len(images))
+
+    if job_mode:
+        return job_accepted(await submit_photos_job(request, images, mode))
+    return await identify_from_photos(request, images, mode)
+
+
 @app.post("/api/identify/sound")
 async def identify_sound(request: Request, audio: UploadFile = File(...)):
     check_frontend_key(request)
+    job_mode = wants_async(request)
+    if job_mode:
+        check_job_capacity(request)
     enforce_user_quota(request)
 
     if audio.content_type and not (
@@ -62,6 +147,10 @@ async def identify_sound(request: Request, audio: UploadFile = File(...)):
     ):
         raise HTTPException(status_code=400, detail="File must be audio.")
 
+    if job_mode:
+        return job_accepted(await submit_audio_job(request, audio))
+    if wants_stream(request):
+        return sse_response(await stream_identify_audio(request, audio))
     return await identify_from_audio(request, audio)
 
 
@@ -77,6 +166,9 @@ async def validate_sound(
     habitat: str = Form(""),
 ):
     check_frontend_key(request)
+    job_mode = wants_async(request)
+    if job_mode:
+        check_job_capacity(request)
     enforce_user_quota(request)
 
     if audio.content_type and not (
@@ -91,6 +183,15 @@ async def validate_sound(
             detail="target_species_id must be included in candidate_species_ids.",
         )
 
+    if job_mode:
+        return job_accepted(await submit_validate_job(
+            request, audio, target_species_id, candidate_species_ids, location, season, habitat
+        ))
+    if wants_stream(request):
+        return sse_response(await stream_validate_sound(
+            request, audio, target_species_id, candidate_species_ids, location, season, habitat
+        ))
+
     return await validate_sound_against_candidates(
         request=request,
         audio=audio,
@@ -102,6 +203,17 @@ async def validate_sound(
     )
 
 
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str, wait: float = Query(0, ge=0)):
+    # wait > 0: long-poll until the job finishes or the wait runs out
+    return await wait_job(job_id, wait)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    return sse_response(job_events(job_id))
+
+
 @app.get("/admin/usage/recent")
 def admin_recent(limit: int = 50):
     rows = fetch_recent_logs(limit=limit)
@@ -120,3 +232,73 @@ def admin_recent(limit: int = 50):
             for r in rows
         ]
     }
+
+
+@app.get("/admin/usage/logs")
+def admin_logs(
+    user_id: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    cached: Optional[bool] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    before_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=1000),
+):
+    rows = query_logs(user_id, endpoint, cached, since, until, before_id, limit)
+    return {
+        "logs": [
+            {
+                "id": r[0],
+                "user_id": r[1],
+                "ip": r[2],
+                "endpoint": r[3],
+                "file_hash": r[4],
+                "cached": bool(r[5]),
+                "created_at": r[6],
+                "model": r[7],
+                "input_bytes": r[8],
+            }
+            for r in rows
+        ],
+        # pass back as before_id for the next page
+        "next_before_id": rows[-1][0] if len(rows) == limit else None,
+    }
+
+
+@app.get("/admin/usage/summary")
+def admin_usage_summary(
+    granularity: str = "day",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    group_by: str = "",
+    endpoint: Optional[str] = None,
+    model: Optional[str] = None,
+    user_id: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    dimensions = [g.strip() for g in group_by.split(",") if g.strip()]
+    try:
+        rows = query_rollups(granularity, since, until, dimensions, endpoint, model, user_id, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"granularity": granularity, "group_by": dimensions, "rows": rows}
+
+
+@app.get("/admin/stats")
+def admin_stats():
+    return {
+        "singleflight": singleflight_stats(),
+        "cache": cache_stats(),
+        "photo_cache": photo_cache_stats(),
+        "audio_fingerprint": audio_fp_stats(),
+        "media_executor": media_executor_stats(),
+        "uploads": upload_stats(),
+        "usage_log": usage_log_stats(),
+        "quotas": quota_stats(),
+        "jobs": jobs_stats(),
+        "streams": stream_stats(),
+        "local_audio_classifier": local_classifier_stats(),
+        "photo_cascade": cascade_stats(),
+        "upload_alias": alias_stats(),
+        "audio_artifacts": artifact_stats(),
+    }
@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+# Where CPU-bound media stages (image resize, audio decode, spectrogram,
+# fingerprinting) run: "process" pool, "thread" pool, or "inline" on the loop.
+MEDIA_EXECUTOR = os.getenv("MEDIA_EXECUTOR", "process").lower()
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", str(os.cpu_count() or 2)))
+# Tasks allowed to wait for a free worker before new ones are rejected with 503
+MEDIA_QUEUE_SIZE = int(os.getenv("MEDIA_QUEUE_SIZE", str(4 * MEDIA_WORKERS)))
+MEDIA_TASK_TIMEOUT_SECONDS = float(os.getenv("MEDIA_TASK_TIMEOUT_SECONDS", "30"))
+
+_executor = None
+# Tasks submitted and not finished, including timed-out ones still running
+# in a worker: those hold their slot until the worker is actually free.
+_pending = 0
+_pending_lock = threading.Lock()
+
+STATS = {
+    "submitted": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "timeouts": 0,
+    "abandoned_running": 0,   # timed out, still occupying a worker
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+    "run_ms_total": 0.0,
+}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        if MEDIA_EXECUTOR == "thread":
+            _executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+        else:
+            # spawn: forking a process that already runs the event loop and
+            # other threads is not safe
+            _executor = ProcessPoolExecutor(
+                max_workers=MEDIA_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _executor
+
+
+def _timed_call(fn, args):
+    # runs in the worker; wall-clock timestamps are comparable across processes
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+def _release(future):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+async def run_media(fn, *args):
+    """
+    Runs fn(*args) off the event loop. fn and its arguments must be
+    picklable (module-level functions) for the process pool.
+    Raises HTTPException 503 when the queue is full, 504 on timeout.
+    """
+    global _pending
+    if MEDIA_EXECUTOR == "inline":
+        return fn(*args)
+
+    with _pending_lock:
+        if _pending >= MEDIA_WORKERS + MEDIA_QUEUE_SIZE:
+            STATS["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Media processing queue is full, retry shortly.")
+        _pending += 1
+
+    STATS["submitted"] += 1
+    submitted = time.time()
+    try:
+        future = _get_executor().submit(_timed_call, fn, args)
+    except BaseException:
+        _release(None)
+        raise
+    # Released when the task really ends, not when we stop waiting: a
+    # running process-pool task can't be cancelled and keeps its worker.
+    future.add_done_callback(_release)
+
+    try:
+        result, started, finished = await asyncio.wait_for(asyncio.wrap_future(future), MEDIA_TASK_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        # a queued task is cancelled; a running one finishes and its result is dropped
+        STATS["timeouts"] += 1
+        if not future.cancel() and not future.done():
+            STATS["abandoned_running"] += 1
+            future.add_done_callback(_abandoned_done)
+        raise HTTPException(status_code=504, detail="Media processing timed out.")
+    except HTTPException:
+        raise
+    except Exception:
+        STATS["failed"] += 1
+        raise
+
+    wait_ms = max(0.0, (started - submitted) * 1000)
+    STATS["completed"] += 1
+    STATS["wait_ms_total"] += wait_ms
+    STATS["wait_ms_max"] = max(STATS["wait_ms_max"], wait_ms)
+    STATS["run_ms_total"] += (finished - started) * 1000
+    return result
+
+
+def _abandoned_done(future):
+    STATS["abandoned_running"] -= 1
+
+
+def shutdown_media_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+
+def media_executor_stats() -> dict:
+    done = STATS["completed"]
+    return {
+        "mode": MEDIA_EXECUTOR,
+        "workers": MEDIA_WORKERS,
+        "queue_size": MEDIA_QUEUE_SIZE,
+        "in_flight": _pending,
+        "queue_depth": max(0, _pending - MEDIA_WORKERS),
+        **{k: v for k, v in STATS.items() if not k.endswith("_total")},
+        "wait_ms_avg": round(STATS["wait_ms_total"] / done, 2) if done else 0.0,
+        "run_ms_avg": round(STATS["run_ms_total"] / done, 2) if done else 0.0,
+        "wait_ms_max": round(STATS["wait_ms_max"], 2),
+    }
@@ -1,35 +1,238 @@
 import os
 import io
-from PIL import Image
+from PIL import Image, ImageOps
 import ffmpeg
 import tempfile
+import threading
+import subprocess
+import wave
+import numpy as np
+
+from app.phash import photo_phash
 
 MAX_IMAGE_SIZE = int(os.getenv("MAX_IMAGE_SIZE", "1024"))
+
+# Encoding of the image sent upstream: "jpeg", "webp" or "png" (lossless, slow, large)
+PHOTO_ENCODE_FORMAT = os.getenv("PHOTO_ENCODE_FORMAT", "jpeg").lower()
+PHOTO_ENCODE_QUALITY = int(os.getenv("PHOTO_ENCODE_QUALITY", "85"))
+
+_PHOTO_MIME = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+
+# Longest side of the first, low-detail image of the photo cascade
+PHOTO_CASCADE_SMALL_SIZE = int(os.getenv("PHOTO_CASCADE_SMALL_SIZE", "512"))
 AUDIO_TRIM_SECONDS = int(os.getenv("AUDIO_TRIM_SECONDS", "6"))
+AUDIO_SAMPLE_RATE = 22050
+
+# "pipe": stream through ffmpeg stdin/stdout; "tempfile": original temp-dir path
+AUDIO_DECODE_MODE = os.getenv("AUDIO_DECODE_MODE", "pipe").lower()
+# ffmpeg is killed past this, so a hung decode can't hold a media worker
+AUDIO_DECODE_TIMEOUT_SECONDS = float(os.getenv("AUDIO_DECODE_TIMEOUT_SECONDS", "20"))
 
 def resize_image(image_bytes: bytes) -> bytes:
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return preprocess_photo(image_bytes)[0]
+
+def preprocess_photo(source):
+    """
+    source: upload bytes, or the path of an upload spooled to disk.
+    Returns (encoded image bytes, MIME type, 64-bit perceptual hash).
+    JPEGs are decoded at a reduced DCT scale when they are much larger than
+    MAX_IMAGE_SIZE, and EXIF orientation is applied before resizing.
+    """
+    img = _open_photo(source)
+    encoded, mime = _encode_photo(img)
+    return encoded, mime, photo_phash(img)
+
+def preprocess_photo_cascade(source):
+    """
+    preprocess_photo plus a second, small encoding (longest side
+    PHOTO_CASCADE_SMALL_SIZE) from the same decode.
+    Returns (encoded image bytes, MIME type, perceptual hash, small image bytes).
+    """
+    img = _open_photo(source)
+    encoded, mime = _encode_photo(img)
+    small = img.copy()
+    small.thumbnail((PHOTO_CASCADE_SMALL_SIZE, PHOTO_CASCADE_SMALL_SIZE))
+    return encoded, mime, photo_phash(img), _encode_photo(small)[0]
+
+def _open_photo(source) -> Image.Image:
+    img = Image.open(source if isinstance(source, str) else io.BytesIO(source))
+    # JPEG only: decode at 1/2, 1/4 or 1/8 scale while staying >= the target
+    img.draft("RGB", (MAX_IMAGE_SIZE, MAX_IMAGE_SIZE))
+    img = ImageOps.exif_transpose(img).convert("RGB")
     img.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE))
+    return img
 
+def _encode_photo(img: Image.Image):
+    fmt = PHOTO_ENCODE_FORMAT if PHOTO_ENCODE_FORMAT in _PHOTO_MIME else "jpeg"
     out = io.BytesIO()
-    img.save(out, format="PNG", optimize=True)
-    return out.getvalue()
+    if fmt == "png":
+        img.save(out, format="PNG", optimize=True)
+    else:
+        img.save(out, format=fmt.upper(), quality=PHOTO_ENCODE_QUALITY)
+    return out.getvalue(), _PHOTO_MIME[fmt]
 
 def trim_audio(audio_bytes: bytes) -> bytes:
+    return decode_audio(audio_bytes)[0]
+
+def decode_audio(source):
+    """
+    Decodes, downmixes and trims an upload to AUDIO_TRIM_SECONDS of 22.05 kHz
+    mono. source: upload bytes, or the path of an upload spooled to disk
+    (read by ffmpeg in place). Returns (16-bit WAV bytes, float32 samples in [-1, 1]).
+    """
+    if isinstance(source, str) or (AUDIO_DECODE_MODE != "tempfile" and _pipe_decodable(source)):
+        pcm = _decode_pcm_pipe(source)
+        if pcm is not None:
+            return _pcm_to_wav(pcm), np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+    wav = _trim_audio_tempfile(source)
+    return wav, wav_to_samples(wav)
+
+def _pipe_decodable(audio_bytes: bytes) -> bool:
+    """
+    False for MP4/M4A/MOV files whose moov atom comes after mdat: ffmpeg
+    can't read those from a non-seekable pipe, so go straight to a temp file.
+    """
+    if audio_bytes[4:8] != b"ftyp":
+        return True
+
+    pos = 0
+    while pos + 8 <= len(audio_bytes):
+        size = int.from_bytes(audio_bytes[pos:pos + 4], "big")
+        box = audio_bytes[pos + 4:pos + 8]
+        if box == b"moov":
+            return True
+        if box == b"mdat":
+            return False
+        if size == 1 and pos + 16 <= len(audio_bytes):
+            size = int.from_bytes(audio_bytes[pos + 8:pos + 16], "big")
+        if size < 8:
+            break
+        pos += size
+    return True
+
+def _decode_pcm_pipe(source):
+    """
+    Upload on stdin (or read from its spooled path), raw s16le PCM on stdout.
+    Stops reading once the trim length is reached. Returns None when ffmpeg
+    can't decode from a pipe (e.g. MP4/M4A with the moov atom at the end)
+    or fails part-way, so the caller can fall back. Raises TimeoutError
+    past AUDIO_DECODE_TIMEOUT_SECONDS.
+    """
+    wanted = AUDIO_TRIM_SECONDS * AUDIO_SAMPLE_RATE * 2
+    from_path = isinstance(source, str)
+    args = (
+        ffmpeg
+        .input(source if from_path else "pipe:0")
+        .output("pipe:1", t=AUDIO_TRIM_SECONDS, ac=1, ar=AUDIO_SAMPLE_RATE, f="s16le")
+        .global_args("-hide_banner", "-loglevel", "error")
+        .compile()
+    )
+    # stderr goes nowhere: nothing reads it while stdout is read, and a pipe
+    # filled with per-packet errors would block ffmpeg (and us with it)
+    proc = subprocess.Popen(
+        args,
+        stdin=subprocess.DEVNULL if from_path else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+    timed_out = threading.Event()
+
+    def expire():
+        timed_out.set()
+        proc.kill()
+
+    deadline = threading.Timer(AUDIO_DECODE_TIMEOUT_SECONDS, expire)
+    deadline.daemon = True
+    deadline.start()
+
+    def feed():
+        if from_path:
+            return
+        try:
+            proc.stdin.write(source)
+        except (BrokenPipeError, OSError):
+            pass  # ffmpeg stopped reading: it has enough, or gave up
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+
+    chunks, got = [], 0
+    try:
+        while got < wanted:
+            chunk = proc.stdout.read(min(65536, wanted - got))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            got += len(chunk)
+    finally:
+        deadline.cancel()
+
+    complete = got >= wanted
+    if proc.poll() is None:
+        proc.kill()
+    writer.join()
+    proc.stdout.close()
+    returncode = proc.wait()
+
+    if timed_out.is_set() and not complete:
+        raise TimeoutError(f"ffmpeg decode exceeded {AUDIO_DECODE_TIMEOUT_SECONDS:g} s")
+    # killed by us once it had enough is fine; an error exit means truncated PCM
+    if got == 0 or (not complete and returncode != 0):
+        return None
+    pcm = b"".join(chunks)
+    return pcm[:len(pcm) - len(pcm) % 2]
+
+def _pcm_to_wav(pcm: bytes) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(AUDIO_SAMPLE_RATE)
+        w.writeframes(pcm)
+    return out.getvalue()
+
+def _trim_audio_tempfile(source) -> bytes:
     with tempfile.TemporaryDirectory() as tmpdir:
-        in_path = os.path.join(tmpdir, "in_audio")
         out_path = os.path.join(tmpdir, "out.wav")
+        if isinstance(source, str):
+            in_path = source
+        else:
+            in_path = os.path.join(tmpdir, "in_audio")
+            with open(in_path, "wb") as f:
+                f.write(source)
 
-        with open(in_path, "wb") as f:
-            f.write(audio_bytes)
-
-        (
+        args = (
             ffmpeg
             .input(in_path)
-            .output(out_path, t=AUDIO_TRIM_SECONDS, ac=1, ar=22050)
+            .output(out_path, t=AUDIO_TRIM_SECONDS, ac=1, ar=AUDIO_SAMPLE_RATE)
             .overwrite_output()
-            .run(quiet=True)
+            .compile()
         )
+        try:
+            done = subprocess.run(
+                args, stdin=subprocess.DEVNULL, capture_output=True, timeout=AUDIO_DECODE_TIMEOUT_SECONDS
+            )
+        except subprocess.TimeoutExpired:
+            raise TimeoutError(f"ffmpeg decode exceeded {AUDIO_DECODE_TIMEOUT_SECONDS:g} s")
+        if done.returncode != 0:
+            raise ffmpeg.Error("ffmpeg", done.stdout, done.stderr)
 
         with open(out_path, "rb") as f:
             return f.read()
+
+def wav_to_samples(wav_bytes: bytes) -> np.ndarray:
+    """Decodes the 16-bit mono WAV produced by trim_audio to float32 in [-1, 1]."""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as w:
+        frames = w.readframes(w.getnframes())
+        channels = w.getnchannels()
+    samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
@@ -0,0 +1,105 @@
+import os
+import json
+import asyncio
+import httpx
+
+from app.json_stream import JsonStreamParser
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_URL = os.getenv("OPENAI_URL", "https://api.openai.com/v1/chat/completions")
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+
+# Upper bound on in-flight upstream calls per worker; extra callers wait
+# on the semaphore instead of piling onto the connection pool.
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", str(OPENAI_MAX_CONCURRENCY)))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", str(OPENAI_MAX_CONNECTIONS)))
+
+_client = None
+_semaphore = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Shared keep-alive client, created on first use inside the running loop."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def close_client():
+    global _client, _semaphore
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _semaphore = None
+
+
+def _headers() -> dict:
+    return {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+async def chat_completion(payload: dict) -> dict:
+    """
+    POSTs a Chat Completions payload without blocking the event loop.
+    Returns the decoded response body; raises RuntimeError on non-200.
+    """
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY not set")
+
+    async with _get_semaphore():
+        r = await get_client().post(OPENAI_URL, headers=_headers(), json=payload)
+
+    if r.status_code != 200:
+        raise RuntimeError(f"OpenAI error {r.status_code}: {r.text}")
+    return r.json()
+
+
+async def chat_completion_streamed(payload: dict, on_value) -> str:
+    """
+    chat_completion with "stream": true, for a JSON object response.
+    Calls on_value(path, value) for each member (and top-level array
+    element) of the object as soon as it is complete, see JsonStreamParser.
+    Returns the whole assistant content; raises RuntimeError on non-200.
+    """
+    if not OPENAI_API_KEY:
+        raise RuntimeError("OPENAI_API_KEY not set")
+
+    parser = JsonStreamParser()
+    parts = []
+    async with _get_semaphore():
+        async with get_client().stream("POST", OPENAI_URL, headers=_headers(), json={**payload, "stream": True}) as r:
+            if r.status_code != 200:
+                body = (await r.aread()).decode("utf-8", errors="replace")
+                raise RuntimeError(f"OpenAI error {r.status_code}: {body}")
+
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                for choice in json.loads(data).get("choices", []):
+                    delta = (choice.get("delta") or {}).get("content")
+                    if delta:
+                        parts.append(delta)
+                        for path, value in parser.feed(delta):
+                            on_value(path, value)
+
+    return "".join(parts)
@@ -0,0 +1,238 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Max hamming distance (out of 64 bits) for two photos to count as the same
+# shot; -1 disables near-duplicate lookups.
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "8"))
+PHASH_INDEX_PATH = os.getenv("PHASH_INDEX_PATH", "./cache/phash_index.tsv")
+PHASH_INDEX_MAX_ENTRIES = int(os.getenv("PHASH_INDEX_MAX_ENTRIES", "50000"))
+
+_HASH_SIZE = 8
+_SAMPLE_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+
+
+_DCT = _dct_matrix(_SAMPLE_SIZE)
+
+
+def photo_phash(img: Image.Image) -> int:
+    """
+    64-bit DCT perceptual hash: grayscale 32x32 downscale, 2-D DCT, then one
+    bit per low-frequency coefficient above the median. Stable across JPEG
+    re-encoding, resizing and light crops.
+    """
+    small = img.convert("L").resize((_SAMPLE_SIZE, _SAMPLE_SIZE), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.float64)
+
+    coeffs = (_DCT @ pixels @ _DCT.T)[:_HASH_SIZE, :_HASH_SIZE].flatten()
+    # the DC term only carries overall brightness
+    bits = coeffs > np.median(coeffs[1:])
+
+    h = 0
+    for bit in bits:
+        h = (h << 1) | int(bit)
+    return h
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes under hamming distance."""
+
+    def __init__(self):
+        # node = (hash, key, {distance: child_node})
+        self.root = None
+        self.size = 0
+
+    def add(self, h: int, key: str):
+        if self.root is None:
+            self.root = (h, key, {})
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            if d == 0 and node[1] == key:
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = (h, key, {})
+                self.size += 1
+                return
+            node = child
+
+    def search(self, h: int, max_distance: int) -> list:
+        """Returns [(distance, key)] within max_distance, nearest first."""
+        if self.root is None:
+            return []
+
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= max_distance:
+                found.append((d, node[1]))
+            # triangle inequality: only children in [d - max, d + max] can match
+            for cd, child in node[2].items():
+                if d - max_distance <= cd <= d + max_distance:
+                    stack.append(child)
+
+        found.sort()
+        return found
+
+
+class PhashIndex:
+    """
+    The newest max_entries (hash, cache key) pairs, FIFO-bounded. A BK-tree
+    can't delete, so evicted and discarded keys stay in the tree and are
+    filtered out of results; once they outnumber half the live ones the
+    tree is rebuilt (see needs_rebuild).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # key -> hash, oldest first
+        self.tree = BKTree()
+        self.dead = 0
+
+    def add(self, h: int, key: str):
+        if key in self.entries:
+            return
+        self.entries[key] = h
+        self.tree.add(h, key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.dead += 1
+
+    def discard(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            self.dead += 1
+
+    def search(self, h: int, max_distance: int) -> list:
+        return [(d, key) for d, key in self.tree.search(h, max_distance) if key in self.entries]
+
+    def needs_rebuild(self) -> bool:
+        return self.dead > len(self.entries) // 2
+
+    def rebuild(self):
+        self.tree = BKTree()
+        for key, h in self.entries.items():
+            self.tree.add(h, key)
+        self.dead = 0
+
+
+_INDEX = None
+_LOCK = threading.Lock()
+
+STATS = {
+    "lookups": 0,
+    "exact_hits": 0,
+    "near_dup_hits": 0,
+    "misses": 0,
+    "rebuilds": 0,
+}
+
+
+def _write_index(index: PhashIndex):
+    # rewritten whole, so the file holds at most ~1.5x max_entries rows
+    os.makedirs(os.path.dirname(PHASH_INDEX_PATH) or ".", exist_ok=True)
+    tmp = f"{PHASH_INDEX_PATH}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(f"{h:016x}\t{key}\n" for key, h in index.entries.items())
+    os.replace(tmp, PHASH_INDEX_PATH)
+
+
+def _get_index() -> PhashIndex:
+    global _INDEX
+    if _INDEX is not None:
+        return _INDEX
+
+    # the newest row per key wins; only the last max_entries keys are kept
+    rows = OrderedDict()
+    total = 0
+    try:
+        with open(PHASH_INDEX_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                total += 1
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) == 2:
+                    rows.pop(parts[1], None)
+                    rows[parts[1]] = int(parts[0], 16)
+                    if len(rows) > PHASH_INDEX_MAX_ENTRIES:
+                        rows.popitem(last=False)
+    except FileNotFoundError:
+        pass
+
+    index = PhashIndex(PHASH_INDEX_MAX_ENTRIES)
+    for key, h in rows.items():
+        index.add(h, key)
+    if total > len(index.entries):
+        _write_index(index)
+    _INDEX = index
+    return _INDEX
+
+
+def _maybe_rebuild(index: PhashIndex):
+    if index.needs_rebuild():
+        index.rebuild()
+        _write_index(index)
+        STATS["rebuilds"] += 1
+
+
+def phash_index_add(h: int, key: str):
+    """Registers a cached photo result under its perceptual hash (persisted)."""
+    with _LOCK:
+        index = _get_index()
+        if key in index.entries:
+            return
+        index.add(h, key)
+        os.makedirs(os.path.dirname(PHASH_INDEX_PATH) or ".", exist_ok=True)
+        with open(PHASH_INDEX_PATH, "a", encoding="utf-8") as f:
+            f.write(f"{h:016x}\t{key}\n")
+        _maybe_rebuild(index)
+
+
+def phash_index_discard(key: str):
+    """Drops a key whose cache entry is gone (expired or evicted)."""
+    with _LOCK:
+        index = _get_index()
+        index.discard(key)
+        _maybe_rebuild(index)
+
+
+def phash_index_search(h: int, max_distance: int = None) -> list:
+    if max_distance is None:
+        max_distance = PHASH_MAX_DISTANCE
+    if max_distance < 0:
+        return []
+    with _LOCK:
+        return _get_index().search(h, max_distance)
+
+
+def record_photo_lookup(outcome: str):
+    """outcome: "exact_hits", "near_dup_hits" or "misses"."""
+    STATS["lookups"] += 1
+    STATS[outcome] += 1
+
+
+def photo_cache_stats() -> dict:
+    lookups = STATS["lookups"]
+    return {
+        **STATS,
+        "indexed_hashes": len(_INDEX.entries) if _INDEX is not None else 0,
+        "exact_hit_rate": round(STATS["exact_hits"] / lookups, 4) if lookups else 0.0,
+        "near_dup_hit_rate": round(STATS["near_dup_hits"] / lookups, 4) if lookups else 0.0,
+    }
@@ -26,3 +26,98 @@ Output JSON schema:
 
 Keep reasons short and clear.
 """
+
+PHOTO_PROMPT = """
+You are an expert ornithologist. Identify the bird species visible in the photo.
+
+Return EXACTLY valid JSON in this format:
+
+{
+  "predictions": [
+    {
+      "species_name": "COMMON NAME (non-empty)",
+      "scientific_name": "Scientific name (non-empty if possible)",
+      "confidence": 0.0-1.0,
+      "reason": "1-2 short sentences describing visible features"
+    },
+    {
+      "species_name": "COMMON NAME (non-empty)",
+      "scientific_name": "Scientific name (non-empty if possible)",
+      "confidence": 0.0-1.0,
+      "reason": "..."
+    },
+    {
+      "species_name": "COMMON NAME (non-empty)",
+      "scientific_name": "Scientific name (non-empty if possible)",
+      "confidence": 0.0-1.0,
+      "reason": "..."
+    }
+  ],
+  "notes": "optional additional notes"
+}
+
+Rules:
+- Return exactly 3 predictions.
+- species_name MUST NOT be empty.
+- scientific_name should be provided when possible.
+- confidence must be between 0 and 1.
+- reason MUST NOT be empty.
+- Do not include any extra keys outside of this JSON object.
+"""
+
+SOUND_PROMPT = """
+You are an expert ornithologist and bioacoustics specialist.
+
+You are looking at a LOG-FREQUENCY spectrogram image of a bird vocalization, tuned for 800Hz–11kHz.
+
+Before choosing species, analyze these spectrogram features:
+- frequency range (approximate low and high in Hz)
+- call type (whistle / trill / chirp / complex song)
+- repetition rate (slow / medium / rapid)
+- presence of harmonics (none / weak / strong)
+- note shape (rising / falling / flat / repeated syllables / multi-part)
+
+Then choose the 3 most likely bird species.
+
+Return EXACTLY valid JSON in this format:
+
+{
+  "analysis": {
+    "freq_range_hz": "e.g. 1500-6500",
+    "call_type": "whistle/trill/chirp/song",
+    "repetition_rate": "slow/medium/rapid",
+    "harmonics": "none/weak/strong",
+    "shape_summary": "one short sentence"
+  },
+  "predictions": [
+    {
+      "species_name": "COMMON NAME (non-empty)",
+      "scientific_name": "Scientific name (non-empty if possible)",
+      "confidence": 0.0-1.0,
+      "reason": "One sentence linking spectrogram features to this species"
+    },
+    {
+      "species_name": "COMMON NAME (non-empty)",
+      "scientific_name": "Scientific name (non-empty if possible)",
+      "confidence": 0.0-1.0,
+      "reason": "..."
+    },
+    {
+      "species_name": "COMMON NAME (non-empty)",
+      "scientific_name": "Scientific name (non-empty if possible)",
+      "confidence": 0.0-1.0,
+      "reason": "..."
+    }
+  ],
+  "notes": "optional"
+}
+
+Rules:
+- Return exactly 3 predictions.
+- species_name MUST NOT be empty.
+- reason MUST NOT be empty.
+- confidence must be between 0 and 1.
+- If uncertain, do NOT assign confidence above 0.5.
+- Only use confidence > 0.7 if the pattern is extremely distinctive.
+- Do not include any extra keys outside of this JSON object.
+"""
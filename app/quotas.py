@@ -1,12 +1,20 @@
 import os
-from datetime import datetime
+import time
+import sqlite3
+import threading
+from datetime import datetime, timedelta
 from fastapi import HTTPException, Request
 
-from app.usage_db import get_daily_count, increment_daily
+from app.usage_db import add_daily_counts, load_daily_counts
 
 DAILY_LIMIT_PER_USER = int(os.getenv("DAILY_LIMIT_PER_USER", "25"))
 DAILY_LIMIT_PER_IP = int(os.getenv("DAILY_LIMIT_PER_IP", "100"))
 
+# Counters live in memory (authoritative for this process) and are written
+# to daily_usage / daily_usage_ip as deltas every QUOTA_FLUSH_SECONDS.
+QUOTA_FLUSH_SECONDS = float(os.getenv("QUOTA_FLUSH_SECONDS", "5"))
+QUOTA_SHARDS = int(os.getenv("QUOTA_SHARDS", "16"))
+
 def today_key() -> str:
     return datetime.utcnow().strftime("%Y-%m-%d")
 
@@ -22,15 +30,209 @@ def get_user_id(request: Request) -> str:
         return user_id.strip()
     return f"ip:{get_client_ip(request)}"
 
-def enforce_user_quota(request: Request):
-    user_id = get_user_id(request)
-    day = today_key()
+class QuotaEngine:
+    """
+    Per-user and per-IP daily request counters. A charge checks and
+    increments both under the locks of their shards, so concurrent requests
+    can't overshoot either limit. Counts for the current UTC day are loaded
+    from the database once per day; nothing else touches it on the hot path.
+    """
+
+    def __init__(self, user_limit: int, ip_limit: int, shards: int = 16, persist: bool = True):
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.persist = persist
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._counts = [{} for _ in range(shards)]   # ("user"|"ip", id) -> count today
+        self._pending = [{} for _ in range(shards)]  # same keys -> not yet flushed
+        self._roll_lock = threading.Lock()
+        self._day = None
+        self._day_ends = 0.0
+        self.stats = {"charged": 0, "refunded": 0, "rejected_user": 0, "rejected_ip": 0, "flushes": 0, "flush_errors": 0}
+
+    def _shard(self, key) -> int:
+        return hash(key) % len(self._locks)
+
+    def _lock_all(self):
+        for lock in self._locks:
+            lock.acquire()
+
+    def _unlock_all(self):
+        for lock in reversed(self._locks):
+            lock.release()
+
+    def _roll_day(self):
+        if time.time() < self._day_ends:
+            return
+        with self._roll_lock:
+            now = datetime.utcnow()
+            if time.time() < self._day_ends:
+                return
+            # the previous day's deltas go out under the previous day
+            self.flush()
+            users, ips = load_daily_counts(now.strftime("%Y-%m-%d")) if self.persist else ({}, {})
+
+            self._lock_all()
+            try:
+                for counts, pending in zip(self._counts, self._pending):
+                    counts.clear()
+                    pending.clear()
+                for kind, loaded in (("user", users), ("ip", ips)):
+                    for subject, n in loaded.items():
+                        key = (kind, subject)
+                        self._counts[self._shard(key)][key] = n
+                self._day = now.strftime("%Y-%m-%d")
+                midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+                self._day_ends = time.time() + (midnight - now).total_seconds()
+            finally:
+                self._unlock_all()
+
+    def charge(self, user_id: str, ip: str, cost: int = 1):
+        """
+        Counts cost requests against the user's and the IP's daily limits.
+        Returns None when charged, or "user"/"ip" for the limit that is
+        exhausted (in which case nothing is charged).
+        """
+        self._roll_day()
+        user_key, ip_key = ("user", user_id), ("ip", ip)
+        us, ips = self._shard(user_key), self._shard(ip_key)
+        # fixed lock order across shards: no deadlock between two charges
+        shards = sorted({us, ips})
+        for i in shards:
+            self._locks[i].acquire()
+        try:
+            if self._counts[us].get(user_key, 0) + cost > self.user_limit:
+                self.stats["rejected_user"] += 1
+                return "user"
+            if self._counts[ips].get(ip_key, 0) + cost > self.ip_limit:
+                self.stats["rejected_ip"] += 1
+                return "ip"
+            for shard, key in ((us, user_key), (ips, ip_key)):
+                self._counts[shard][key] = self._counts[shard].get(key, 0) + cost
+                self._pending[shard][key] = self._pending[shard].get(key, 0) + cost
+            self.stats["charged"] += cost
+            return None
+        finally:
+            for i in reversed(shards):
+                self._locks[i].release()
+
+    def refund(self, user_id: str, ip: str, cost: int = 1):
+        """Gives back cost requests charged today for work that was never done."""
+        user_key, ip_key = ("user", user_id), ("ip", ip)
+        us, ips = self._shard(user_key), self._shard(ip_key)
+        shards = sorted({us, ips})
+        for i in shards:
+            self._locks[i].acquire()
+        try:
+            for shard, key in ((us, user_key), (ips, ip_key)):
+                n = min(cost, self._counts[shard].get(key, 0))
+                if n:
+                    self._counts[shard][key] -= n
+                    self._pending[shard][key] = self._pending[shard].get(key, 0) - n
+            self.stats["refunded"] += cost
+        finally:
+            for i in reversed(shards):
+                self._locks[i].release()
+
+    def count(self, kind: str, subject: str) -> int:
+        key = (kind, subject)
+        shard = self._shard(key)
+        with self._locks[shard]:
+            return self._counts[shard].get(key, 0)
+
+    def flush(self):
+        """Writes the deltas accumulated since the last flush to the database."""
+        if not self.persist or self._day is None:
+            return
+        self._lock_all()
+        try:
+            day = self._day
+            taken = [pending.copy() for pending in self._pending]
+            for pending in self._pending:
+                pending.clear()
+        finally:
+            self._unlock_all()
 
-    count = get_daily_count(user_id, day)
-    if count >= DAILY_LIMIT_PER_USER:
+        users, ips = {}, {}
+        for pending in taken:
+            for (kind, subject), n in pending.items():
+                (users if kind == "user" else ips)[subject] = n
+        if not users and not ips:
+            return
+        try:
+            add_daily_counts(day, users, ips)
+            self.stats["flushes"] += 1
+        except sqlite3.Error:
+            # keep the deltas for the next attempt
+            self.stats["flush_errors"] += 1
+            self._lock_all()
+            try:
+                if self._day == day:
+                    for shard, pending in enumerate(taken):
+                        for key, n in pending.items():
+                            self._pending[shard][key] = self._pending[shard].get(key, 0) + n
+            finally:
+                self._unlock_all()
+
+    def snapshot(self) -> dict:
+        self._lock_all()
+        try:
+            users = sum(1 for counts in self._counts for kind, _ in counts if kind == "user")
+            ips = sum(1 for counts in self._counts for kind, _ in counts if kind == "ip")
+            pending = sum(sum(p.values()) for p in self._pending)
+        finally:
+            self._unlock_all()
+        return {
+            **self.stats,
+            "day": self._day,
+            "tracked_users": users,
+            "tracked_ips": ips,
+            "pending_flush": pending,
+            "limit_per_user": self.user_limit,
+            "limit_per_ip": self.ip_limit,
+        }
+
+_ENGINE = None
+_FLUSHER = None
+_ENGINE_LOCK = threading.Lock()
+
+def get_quota_engine() -> QuotaEngine:
+    global _ENGINE, _FLUSHER
+    if _ENGINE is not None:
+        return _ENGINE
+    with _ENGINE_LOCK:
+        if _ENGINE is None:
+            _ENGINE = QuotaEngine(DAILY_LIMIT_PER_USER, DAILY_LIMIT_PER_IP, QUOTA_SHARDS)
+            _FLUSHER = threading.Thread(target=_flush_loop, name="quota-flusher", daemon=True)
+            _FLUSHER.start()
+    return _ENGINE
+
+def _flush_loop():
+    while True:
+        time.sleep(QUOTA_FLUSH_SECONDS)
+        _ENGINE.flush()
+
+def flush_quotas():
+    """Persists pending counts now (shutdown)."""
+    if _ENGINE is not None:
+        _ENGINE.flush()
+
+def quota_stats() -> dict:
+    return _ENGINE.snapshot() if _ENGINE is not None else {}
+
+def enforce_user_quota(request: Request, cost: int = 1):
+    exhausted = get_quota_engine().charge(get_user_id(request), get_client_ip(request), cost)
+    if exhausted == "user":
         raise HTTPException(
             status_code=429,
             detail=f"Daily identification limit reached ({DAILY_LIMIT_PER_USER}/day)."
         )
+    if exhausted == "ip":
+        raise HTTPException(
+            status_code=429,
+            detail=f"Daily limit for this network reached ({DAILY_LIMIT_PER_IP}/day)."
+        )
 
-    increment_daily(user_id, day)
+def refund_user_quota(request: Request, cost: int = 1):
+    """Undoes enforce_user_quota for a request rejected before doing any work."""
+    get_quota_engine().refund(get_user_id(request), get_client_ip(request), cost)
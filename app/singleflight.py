@@ -0,0 +1,54 @@
+import asyncio
+import copy
+
+# key -> Future of the in-flight leader call for that key
+_INFLIGHT = {}
+
+STATS = {
+    "leaders": 0,     # calls that actually went upstream
+    "coalesced": 0,   # calls that waited on a leader instead
+}
+
+
+async def singleflight(key: str, fn):
+    """
+    Runs `await fn()` once per key among concurrent callers.
+    The first caller (leader) runs fn; callers arriving while it is in
+    flight wait for it and receive a deep copy of its result.
+    Returns (result, coalesced) where coalesced is True for followers.
+    """
+    fut = _INFLIGHT.get(key)
+    if fut is not None:
+        STATS["coalesced"] += 1
+        try:
+            result = await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            if fut.cancelled():
+                # the leader was cancelled, not us: try again (likely as leader)
+                STATS["coalesced"] -= 1
+                return await singleflight(key, fn)
+            raise
+        return copy.deepcopy(result), True
+
+    fut = asyncio.get_running_loop().create_future()
+    _INFLIGHT[key] = fut
+    STATS["leaders"] += 1
+    try:
+        result = await fn()
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        # mark retrieved so an unshared failure doesn't log "never retrieved"
+        fut.exception()
+        raise
+    else:
+        fut.set_result(result)
+        return result, False
+    finally:
+        _INFLIGHT.pop(key, None)
+
+
+def singleflight_stats() -> dict:
+    return {**STATS, "in_flight": len(_INFLIGHT)}
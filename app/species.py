@@ -3,8 +3,36 @@ import os
 
 SPECIES_CACHE = None
 
+# Lookup tables built once alongside SPECIES_CACHE.
+# Each maps a normalized key to a position in SPECIES_CACHE, so the records
+# themselves are stored exactly once.
+_BY_ID = {}
+_BY_SCIENTIFIC = {}
+_BY_COMMON = {}
+
+def _norm(value: str) -> str:
+    return (value or "").strip().lower()
+
+def _build_index(data: list):
+    by_id, by_sci, by_common = {}, {}, {}
+
+    for pos, s in enumerate(data):
+        # setdefault keeps the first record on duplicates, like the old linear scan
+        if s.get("id"):
+            by_id.setdefault(s["id"], pos)
+
+        sci = _norm(s.get("scientific_name", ""))
+        if sci:
+            by_sci.setdefault(sci, pos)
+
+        common = _norm(s.get("species_name", ""))
+        if common:
+            by_common.setdefault(common, pos)
+
+    return by_id, by_sci, by_common
+
 def load_species():
-    global SPECIES_CACHE
+    global SPECIES_CACHE, _BY_ID, _BY_SCIENTIFIC, _BY_COMMON
     if SPECIES_CACHE is not None:
         return SPECIES_CACHE
 
@@ -13,25 +41,31 @@ def load_species():
         data = json.load(f)
 
     # expected format: [{"id":"...", "species_name":"...", "scientific_name":"..."}]
+    _BY_ID, _BY_SCIENTIFIC, _BY_COMMON = _build_index(data)
     SPECIES_CACHE = data
     return SPECIES_CACHE
 
+def get_species_by_id(species_id: str):
+    species = load_species()
+    pos = _BY_ID.get(species_id)
+    return species[pos] if pos is not None else None
+
 def match_species(pred_name: str, pred_sci: str):
     species = load_species()
 
-    pred_name_l = (pred_name or "").strip().lower()
-    pred_sci_l = (pred_sci or "").strip().lower()
+    pred_name_l = _norm(pred_name)
+    pred_sci_l = _norm(pred_sci)
 
     # match by scientific name first
     if pred_sci_l:
-        for s in species:
-            if (s.get("scientific_name","").strip().lower() == pred_sci_l):
-                return s
+        pos = _BY_SCIENTIFIC.get(pred_sci_l)
+        if pos is not None:
+            return species[pos]
 
     # then common name
     if pred_name_l:
-        for s in species:
-            if s.get("species_name","").strip().lower() == pred_name_l:
-                return s
+        pos = _BY_COMMON.get(pred_name_l)
+        if pos is not None:
+            return species[pos]
 
     return None
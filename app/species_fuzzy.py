@@ -0,0 +1,157 @@
+import os
+import re
+
+import numpy as np
+
+from app.species import load_species
+
+FUZZY_MATCH_MIN_SCORE = float(os.getenv("FUZZY_MATCH_MIN_SCORE", "0.6"))
+# the best record has to beat the runner-up by this much
+FUZZY_MATCH_MIN_MARGIN = float(os.getenv("FUZZY_MATCH_MIN_MARGIN", "0.05"))
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Built lazily on first use, then shared: one trigram index per name field.
+_FUZZY_INDEX = None
+
+
+def _normalize(name: str) -> str:
+    # "Grey-headed  Woodpecker" -> "grey headed woodpecker"
+    return _NON_ALNUM.sub(" ", (name or "").lower()).strip()
+
+
+def _trigrams(name: str) -> set:
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrigramIndex:
+    """
+    Character-trigram inverted index over one name field of the species list.
+    Postings are int32 arrays of record positions, so a query is one
+    concatenate + bincount instead of a scan over every name.
+    """
+
+    def __init__(self, names: list):
+        postings = {}
+        sizes = np.zeros(len(names), dtype=np.int32)
+
+        for pos, name in enumerate(names):
+            grams = _trigrams(name) if name else set()
+            sizes[pos] = len(grams)
+            for g in grams:
+                postings.setdefault(g, []).append(pos)
+
+        self.sizes = sizes
+        self.postings = {g: np.asarray(p, dtype=np.int32) for g, p in postings.items()}
+
+    def scores(self, name: str):
+        """Dice similarity of name against every record, or None if no overlap."""
+        if not name:
+            return None
+
+        grams = _trigrams(name)
+        hits = [self.postings[g] for g in grams if g in self.postings]
+        if not hits:
+            return None
+
+        overlap = np.bincount(np.concatenate(hits), minlength=len(self.sizes))
+        return 2.0 * overlap / (len(grams) + self.sizes)
+
+
+def _within_edits(a: str, b: str, limit: int) -> bool:
+    """
+    Optimal string alignment distance (insert, delete, substitute, swap
+    neighbours) of a and b is at most limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return False
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return False
+        prev2, prev = prev, cur
+    return prev[-1] <= limit
+
+
+def _token_matches(token: str, query_token: str) -> bool:
+    return token == query_token or _within_edits(token, query_token, 1 if len(token) <= 5 else 2)
+
+
+def _covers(query: str, name: str) -> bool:
+    """
+    True when every word of name has a close counterpart in query. A generic
+    query ("Sparrow", "Passer sp.") then can't match a specific species
+    ("Song Sparrow", "Passer pyrrhonotus") however similar the trigrams are.
+    """
+    if not query or not name:
+        return False
+    query_tokens = query.split()
+    if all(any(_token_matches(t, q) for q in query_tokens) for t in name.split()):
+        return True
+    # "Greyheaded Woodpecker" vs "Grey-headed Woodpecker"
+    query, name = query.replace(" ", ""), name.replace(" ", "")
+    return _within_edits(query, name, 2)
+
+
+def _get_index():
+    global _FUZZY_INDEX
+    if _FUZZY_INDEX is not None:
+        return _FUZZY_INDEX
+
+    species = load_species()
+    _FUZZY_INDEX = (
+        _TrigramIndex([_normalize(s.get("scientific_name", "")) for s in species]),
+        _TrigramIndex([_normalize(s.get("species_name", "")) for s in species]),
+    )
+    return _FUZZY_INDEX
+
+
+def fuzzy_match_species(pred_name: str, pred_sci: str, min_score: float = None):
+    """
+    Approximate counterpart of match_species() for misspelled or variant names.
+    Returns (species_record, score) where score is the trigram Dice similarity
+    in [0, 1], or (None, best_score) when there is no confident match: the
+    best record must reach min_score, lead the runner-up by
+    FUZZY_MATCH_MIN_MARGIN, and have every word of its common or scientific
+    name covered by the corresponding query.
+    """
+    if min_score is None:
+        min_score = FUZZY_MATCH_MIN_SCORE
+
+    species = load_species()
+    sci_index, common_index = _get_index()
+
+    pred_sci, pred_name = _normalize(pred_sci), _normalize(pred_name)
+    sci_scores = sci_index.scores(pred_sci)
+    common_scores = common_index.scores(pred_name)
+
+    if sci_scores is None and common_scores is None:
+        return None, 0.0
+    if sci_scores is None:
+        scores = common_scores
+    elif common_scores is None:
+        scores = sci_scores
+    else:
+        # Both names given: the stronger field dominates, but the other one
+        # has to agree somewhat, so a shared epithet alone can't pull in an
+        # unrelated species (e.g. "Parus caeruleus" vs "Elanus caeruleus").
+        scores = 0.75 * np.maximum(sci_scores, common_scores) + 0.25 * np.minimum(sci_scores, common_scores)
+
+    pos = int(np.argmax(scores))
+    score = float(scores[pos])
+    scores[pos] = 0.0
+    runner_up = float(scores.max())
+    if score < min_score or score - runner_up < FUZZY_MATCH_MIN_MARGIN:
+        return None, score
+
+    s = species[pos]
+    if not (_covers(pred_sci, _normalize(s.get("scientific_name", "")))
+            or _covers(pred_name, _normalize(s.get("species_name", "")))):
+        return None, score
+    return s, score
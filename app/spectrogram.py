@@ -1,15 +1,83 @@
+import os
+import io
 import tempfile
 import subprocess
-import os
 
-def audio_to_spectrogram_image(audio_bytes: bytes) -> bytes:
+import numpy as np
+from PIL import Image
+
+from app.media_utils import wav_to_samples
+
+# "numpy": in-process renderer below; "ffmpeg": original showspectrumpic subprocess
+SPECTROGRAM_RENDERER = os.getenv("SPECTROGRAM_RENDERER", "numpy").lower()
+
+_WIDTH, _HEIGHT = 1200, 600
+_BAND_HZ = (800.0, 11000.0)
+_NFFT = 2048
+_DYNAMIC_RANGE_DB = 120.0
+_SAMPLE_RATE = 22050
+
+# ffmpeg's "intensity" color table: (position, Y, U, V)
+_INTENSITY_YUV = np.array([
+    [0.00, 0.0, 0.0, 0.0],
+    [0.13, .03587126228984074, .1573300977624594, -.02548747583751842],
+    [0.30, .18572281794568020, .1772436246393981, .17475554840414750],
+    [0.60, .28184980583656130, -.1593064119945782, .47132074554608920],
+    [0.73, .65830621175547810, -.3716070802232764, .24352759331252930],
+    [0.78, .76318535758242900, -.4307467689263783, .16866496622310430],
+    [0.91, .95336363636363640, -.2045454545454546, .03313636363636363],
+    [1.00, 1.0, 0.0, 0.0],
+])
+
+
+def _intensity_lut() -> np.ndarray:
+    pos = np.linspace(0.0, 1.0, 256)
+    y, u, v = (np.interp(pos, _INTENSITY_YUV[:, 0], _INTENSITY_YUV[:, i]) for i in (1, 2, 3))
+    rgb = np.stack([y + 1.402 * v, y - 0.344136 * u - 0.714136 * v, y + 1.772 * u], axis=1)
+    return (np.clip(rgb, 0.0, 1.0) * 255).astype(np.uint8)
+
+
+_LUT = _intensity_lut()
+_WINDOW = np.hanning(_NFFT).astype(np.float32)
+
+
+def render_spectrogram(samples: np.ndarray, sample_rate: int = _SAMPLE_RATE) -> bytes:
     """
-    Bird-tuned spectrogram generator:
-    - bandpass focus: 800 Hz to 11 kHz (typical bird vocalization range)
-    - log-frequency scale (critical for bird calls)
-    - intensity color mapping for high contrast
-    - larger resolution for clearer patterns
+    In-process equivalent of the ffmpeg filter chain: 1200 STFT columns
+    spread across the clip, rows resampled onto a log-frequency axis from
+    800 Hz to 11 kHz, log magnitude over a 120 dB range, intensity colormap.
+    Returns PNG bytes.
     """
+    samples = np.asarray(samples, dtype=np.float32)
+    if len(samples) < _NFFT:
+        samples = np.pad(samples, (0, _NFFT - len(samples)))
+
+    # one analysis window per output column
+    starts = np.linspace(0, len(samples) - _NFFT, _WIDTH).astype(np.int64)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, _NFFT)[starts]
+    mag = np.abs(np.fft.rfft(frames * _WINDOW, axis=1))
+    mag /= _WINDOW.sum() / 2  # full-scale sine -> 1.0
+
+    # log-frequency rows, top = 11 kHz, linear interpolation between FFT bins
+    hi = min(_BAND_HZ[1], sample_rate / 2)
+    freqs = _BAND_HZ[0] * (hi / _BAND_HZ[0]) ** np.linspace(1.0, 0.0, _HEIGHT)
+    bins = freqs * _NFFT / sample_rate
+    b0 = np.minimum(bins.astype(np.int64), mag.shape[1] - 2)
+    w = (bins - b0).astype(np.float32)
+    band = mag[:, b0] * (1 - w) + mag[:, b0 + 1] * w  # (columns, rows)
+
+    db = 20 * np.log10(band.T + 1e-12)
+    level = np.clip((db + _DYNAMIC_RANGE_DB) / _DYNAMIC_RANGE_DB, 0.0, 1.0)
+    # palette PNG: one byte per pixel, a third of the RGB encode work and payload
+    img = Image.fromarray((level * 255).astype(np.uint8), "P")
+    img.putpalette(_LUT.tobytes())
+
+    out = io.BytesIO()
+    img.save(out, format="PNG", compress_level=1)
+    return out.getvalue()
+
+
+def _ffmpeg_spectrogram(audio_bytes: bytes) -> bytes:
     with tempfile.TemporaryDirectory() as tmpdir:
         audio_path = os.path.join(tmpdir, "audio.wav")
         png_path = os.path.join(tmpdir, "spectrogram.png")
@@ -43,3 +111,20 @@ def audio_to_spectrogram_image(audio_bytes: bytes) -> bytes:
 
         with open(png_path, "rb") as f:
             return f.read()
+
+
+def audio_to_spectrogram_image(audio_bytes: bytes, samples: np.ndarray = None) -> bytes:
+    """
+    Bird-tuned spectrogram generator:
+    - bandpass focus: 800 Hz to 11 kHz (typical bird vocalization range)
+    - log-frequency scale (critical for bird calls)
+    - intensity color mapping for high contrast
+    - larger resolution for clearer patterns
+    Pass already-decoded samples to skip re-parsing the WAV.
+    """
+    if SPECTROGRAM_RENDERER == "ffmpeg":
+        return _ffmpeg_spectrogram(audio_bytes)
+
+    if samples is None:
+        samples = wav_to_samples(audio_bytes)
+    return render_spectrogram(samples)
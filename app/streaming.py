@@ -0,0 +1,100 @@
+import json
+import time
+import asyncio
+import logging
+
+from fastapi import HTTPException, Request
+
+SSE_HEARTBEAT_SECONDS = 15.0
+
+# Streams whose client went away keep running to completion (the upstream
+# call is paid for and its result gets cached); held here until then.
+_BACKGROUND = set()
+
+STATS = {
+    "streams": 0,
+    "single_event": 0,        # answered with just "result" (cache hits)
+    "first_event_ms_total": 0.0,
+    "result_ms_total": 0.0,
+    "errors": 0,
+}
+
+
+def wants_stream(request: Request) -> bool:
+    return "text/event-stream" in request.headers.get("accept", "") or \
+        request.query_params.get("stream", "").lower() in ("1", "true")
+
+
+def sse_event(name: str, data) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def sse_stream(work, uploads: list = ()):
+    """
+    Runs `await work(emit)` and returns an SSE stream: an event for each
+    emit(name, data) while it runs, then "result" with its return value, or
+    "error" with {"status", "detail"}. The work starts now, not when the
+    stream is first read, so the uploads it reads are closed when it
+    finishes even if the client is gone before the response starts.
+    """
+    started = time.perf_counter()
+    queue = asyncio.Queue()
+    task = asyncio.create_task(work(lambda name, data: queue.put_nowait((name, data))))
+    _BACKGROUND.add(task)
+
+    def _finished(t: asyncio.Task):
+        _BACKGROUND.discard(t)
+        for upload in uploads:
+            upload.close()
+        if not t.cancelled():
+            # retrieved here so an abandoned stream's failure isn't logged as unhandled
+            t.exception()
+        queue.put_nowait(None)
+
+    task.add_done_callback(_finished)
+    STATS["streams"] += 1
+    return _sse_events(task, queue, started)
+
+
+async def _sse_events(task: asyncio.Task, queue: asyncio.Queue, started: float):
+    events = 0
+    while True:
+        try:
+            item = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keep-alive\n\n"
+            continue
+        if item is None:
+            break
+        if not events:
+            STATS["first_event_ms_total"] += (time.perf_counter() - started) * 1000
+        events += 1
+        yield sse_event(*item)
+
+    if not events:
+        STATS["single_event"] += 1
+    STATS["result_ms_total"] += (time.perf_counter() - started) * 1000
+    try:
+        result = task.result()
+    except HTTPException as e:
+        STATS["errors"] += 1
+        yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+    except Exception:
+        logging.exception("streamed identification failed")
+        STATS["errors"] += 1
+        yield sse_event("error", {"status": 500, "detail": "Identification failed."})
+    else:
+        yield sse_event("result", result)
+
+
+def stream_stats() -> dict:
+    streamed = STATS["streams"] - STATS["single_event"]
+    done = STATS["streams"] - len(_BACKGROUND)
+    return {
+        "streams": STATS["streams"],
+        "single_event": STATS["single_event"],
+        "errors": STATS["errors"],
+        "in_flight": len(_BACKGROUND),
+        "first_event_ms_avg": round(STATS["first_event_ms_total"] / streamed, 2) if streamed > 0 else 0.0,
+        "result_ms_avg": round(STATS["result_ms_total"] / done, 2) if done > 0 else 0.0,
+    }
@@ -0,0 +1,50 @@
+import hashlib
+
+from app.cache import cache_get, cache_set
+from app import media_utils
+
+# Maps sha256 of the raw upload to what its normalized pipeline produced
+# (the photo cache key, or the trimmed-audio hash), so exact re-uploads
+# are answered before any decoding. Stored in the regular result cache.
+
+STATS = {
+    "photo_lookups": 0,
+    "photo_hits": 0,
+    "audio_lookups": 0,
+    "audio_hits": 0,
+}
+
+
+def _pipeline_tag(kind: str) -> str:
+    # the same raw bytes normalize differently if these settings change
+    if kind == "photo":
+        params = (media_utils.MAX_IMAGE_SIZE, media_utils.PHOTO_ENCODE_FORMAT, media_utils.PHOTO_ENCODE_QUALITY)
+    else:
+        params = (media_utils.AUDIO_TRIM_SECONDS, media_utils.AUDIO_SAMPLE_RATE)
+    return hashlib.sha256(repr(params).encode("utf-8")).hexdigest()[:8]
+
+
+def _alias_key(kind: str, raw_hash: str) -> str:
+    return f"raw_{kind}_{_pipeline_tag(kind)}_{raw_hash}"
+
+
+def alias_get(kind: str, raw_hash: str):
+    """kind: "photo" or "audio". Returns the aliased value or None."""
+    STATS[f"{kind}_lookups"] += 1
+    entry = cache_get(_alias_key(kind, raw_hash))
+    if not entry:
+        return None
+    STATS[f"{kind}_hits"] += 1
+    return entry.get("target")
+
+
+def alias_set(kind: str, raw_hash: str, target: str):
+    cache_set(_alias_key(kind, raw_hash), {"target": target})
+
+
+def alias_stats() -> dict:
+    out = dict(STATS)
+    for kind in ("photo", "audio"):
+        lookups = STATS[f"{kind}_lookups"]
+        out[f"{kind}_hit_rate"] = round(STATS[f"{kind}_hits"] / lookups, 4) if lookups else 0.0
+    return out
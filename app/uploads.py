@@ -0,0 +1,165 @@
+import os
+import json
+import hashlib
+import tempfile
+
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Per-endpoint caps on the uploaded file; larger requests get a 413 as soon as
+# the Content-Length (or the bytes received so far) show they are over.
+UPLOAD_MAX_PHOTO_BYTES = int(os.getenv("UPLOAD_MAX_PHOTO_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MAX_AUDIO_BYTES = int(os.getenv("UPLOAD_MAX_AUDIO_BYTES", str(25 * 1024 * 1024)))
+# whole request to /api/identify/photos; each photo is still capped as above
+UPLOAD_MAX_BATCH_BYTES = int(os.getenv("UPLOAD_MAX_BATCH_BYTES", str(4 * UPLOAD_MAX_PHOTO_BYTES)))
+
+# Uploads up to this size stay in memory; larger ones are spooled to
+# UPLOAD_SPOOL_DIR and handed to the media stages by path.
+UPLOAD_SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES", str(4 * 1024 * 1024)))
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+UPLOAD_LIMITS = {
+    "/api/identify/photo": UPLOAD_MAX_PHOTO_BYTES,
+    "/api/identify/photos": UPLOAD_MAX_BATCH_BYTES,
+    "/api/identify/sound": UPLOAD_MAX_AUDIO_BYTES,
+    "/api/validate/sound": UPLOAD_MAX_AUDIO_BYTES,
+}
+
+# Multipart boundaries, part headers and small form fields
+_FORM_OVERHEAD_BYTES = 64 * 1024
+
+STATS = {
+    "uploads": 0,
+    "bytes": 0,
+    "spooled_to_disk": 0,
+    "rejected_too_large": 0,
+}
+
+
+def _too_large(limit: int) -> HTTPException:
+    STATS["rejected_too_large"] += 1
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {round(limit / (1024 * 1024), 1):g} MB limit.")
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects oversized uploads to the endpoints in UPLOAD_LIMITS before the
+    multipart body is parsed: up front from Content-Length, otherwise as
+    soon as the streamed body passes the limit.
+    """
+
+    def __init__(self, app, limits: dict = None):
+        self.app = app
+        self.limits = limits if limits is not None else UPLOAD_LIMITS
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        allowed = limit + _FORM_OVERHEAD_BYTES
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > allowed:
+            exc = _too_large(limit)
+            await send({
+                "type": "http.response.start",
+                "status": exc.status_code,
+                "headers": [(b"content-type", b"application/json"), (b"connection", b"close")],
+            })
+            await send({"type": "http.response.body", "body": json.dumps({"detail": exc.detail}).encode()})
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > allowed:
+                    # raised inside form parsing; FastAPI passes HTTPException through
+                    raise _too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class SpooledUpload:
+    """
+    An ingested upload. source is the bytes when it fit in memory, or the
+    path of its spool file; both are accepted by the media stages as-is.
+    """
+
+    def __init__(self, source, size: int, sha256: str):
+        self.source = source
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def on_disk(self) -> bool:
+        return isinstance(self.source, str)
+
+    def close(self):
+        if self.on_disk:
+            try:
+                os.remove(self.source)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def ingest_upload(upload: UploadFile, max_bytes: int) -> SpooledUpload:
+    """
+    Reads an upload in chunks, hashing as it goes and raising 413 past
+    max_bytes. Spools to disk once it outgrows UPLOAD_SPOOL_MEMORY_BYTES.
+    """
+    hasher = hashlib.sha256()
+    chunks, size = [], 0
+    spool = None
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise _too_large(max_bytes)
+            hasher.update(chunk)
+
+            if spool is None and size > UPLOAD_SPOOL_MEMORY_BYTES:
+                spool = tempfile.NamedTemporaryFile(prefix="upload_", dir=UPLOAD_SPOOL_DIR, delete=False)
+                spool.writelines(chunks)
+                chunks = []
+            if spool is not None:
+                spool.write(chunk)
+            else:
+                chunks.append(chunk)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+        raise
+
+    STATS["uploads"] += 1
+    STATS["bytes"] += size
+    if spool is not None:
+        spool.close()
+        STATS["spooled_to_disk"] += 1
+        return SpooledUpload(spool.name, size, hasher.hexdigest())
+    return SpooledUpload(b"".join(chunks), size, hasher.hexdigest())
+
+
+def upload_stats() -> dict:
+    return {
+        **STATS,
+        "max_photo_bytes": UPLOAD_MAX_PHOTO_BYTES,
+        "max_audio_bytes": UPLOAD_MAX_AUDIO_BYTES,
+        "spool_memory_bytes": UPLOAD_SPOOL_MEMORY_BYTES,
+    }
@@ -1,9 +1,46 @@
 import os
+import sys
+import csv
+import gzip
+import time
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
 
 DB_PATH = os.getenv("DB_PATH", "./data/usage.sqlite")
 
+# log_usage only enqueues; a background writer inserts rows in one
+# transaction per USAGE_LOG_BATCH_SIZE rows or USAGE_LOG_FLUSH_SECONDS,
+# whichever comes first. When the queue is full new rows are dropped.
+USAGE_LOG_QUEUE_SIZE = int(os.getenv("USAGE_LOG_QUEUE_SIZE", "10000"))
+USAGE_LOG_BATCH_SIZE = int(os.getenv("USAGE_LOG_BATCH_SIZE", "200"))
+USAGE_LOG_FLUSH_SECONDS = float(os.getenv("USAGE_LOG_FLUSH_SECONDS", "1.0"))
+
+# Raw usage_logs rows (and hourly rollups) older than this are pruned by the
+# writer thread; 0 keeps everything. Daily rollups are kept forever. With
+# USAGE_LOG_ARCHIVE_DIR set, pruned rows are first appended to one
+# usage_logs_YYYY-MM-DD.csv.gz per day there.
+USAGE_LOG_RETENTION_DAYS = int(os.getenv("USAGE_LOG_RETENTION_DAYS", "90"))
+USAGE_LOG_ARCHIVE_DIR = os.getenv("USAGE_LOG_ARCHIVE_DIR", "")
+USAGE_LOG_PRUNE_SECONDS = float(os.getenv("USAGE_LOG_PRUNE_SECONDS", "3600"))
+
+_QUEUE = queue.Queue(maxsize=USAGE_LOG_QUEUE_SIZE)
+_STOP = object()
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+STATS = {
+    "enqueued": 0,
+    "written": 0,
+    "dropped": 0,
+    "batches": 0,
+    "write_errors": 0,
+    "batch_ms_max": 0.0,
+    "pruned": 0,
+    "prune_errors": 0,
+}
+
 def _connect():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     return sqlite3.connect(DB_PATH, check_same_thread=False)
@@ -11,6 +48,8 @@ def _connect():
 def init_db():
     conn = _connect()
     cur = conn.cursor()
+    # readers (admin queries, quota checks) don't block the log writer
+    cur.execute("PRAGMA journal_mode=WAL")
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS usage_logs (
@@ -26,6 +65,27 @@ def init_db():
     )
     """)
 
+    # keyset pagination (id DESC) per filter, and time-range scans / pruning
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_usage_logs_user ON usage_logs (user_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_usage_logs_endpoint ON usage_logs (endpoint, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_usage_logs_created ON usage_logs (created_at)")
+
+    # Maintained by the log writer in the same transaction as the raw rows.
+    # bucket is "YYYY-MM-DDTHH" (hourly) or "YYYY-MM-DD" (daily), UTC.
+    for table in ("usage_rollup_hourly", "usage_rollup_daily"):
+        cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            bucket TEXT,
+            endpoint TEXT,
+            model TEXT,
+            user_id TEXT,
+            requests INTEGER,
+            cache_hits INTEGER,
+            input_bytes INTEGER,
+            PRIMARY KEY(bucket, endpoint, model, user_id)
+        ) WITHOUT ROWID
+        """)
+
     cur.execute("""
     CREATE TABLE IF NOT EXISTS daily_usage (
         user_id TEXT,
@@ -35,17 +95,33 @@ def init_db():
     )
     """)
 
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS daily_usage_ip (
+        ip TEXT,
+        day TEXT,
+        count INTEGER,
+        PRIMARY KEY(ip, day)
+    )
+    """)
+
     conn.commit()
+
+    # first start with rollups on an existing database
+    has_logs = cur.execute("SELECT EXISTS(SELECT 1 FROM usage_logs)").fetchone()[0]
+    has_rollups = cur.execute("SELECT EXISTS(SELECT 1 FROM usage_rollup_daily)").fetchone()[0]
+    if has_logs and not has_rollups:
+        rebuild_rollups(conn)
     conn.close()
 
-def log_usage(user_id: str, ip: str, endpoint: str, file_hash: str, cached: bool, model: str, input_bytes: int):
-    conn = _connect()
-    cur = conn.cursor()
+_INSERT_LOG = """
+INSERT INTO usage_logs (user_id, ip, endpoint, file_hash, cached, created_at, model, input_bytes)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
-    cur.execute("""
-    INSERT INTO usage_logs (user_id, ip, endpoint, file_hash, cached, created_at, model, input_bytes)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+def log_usage(user_id: str, ip: str, endpoint: str, file_hash: str, cached: bool, model: str, input_bytes: int):
+    """Queues one usage row for the background writer; never blocks on SQLite."""
+    _ensure_writer()
+    row = (
         user_id,
         ip,
         endpoint,
@@ -54,10 +130,282 @@ def log_usage(user_id: str, ip: str, endpoint: str, file_hash: str, cached: bool
         datetime.utcnow().isoformat(),
         model,
         input_bytes
-    ))
+    )
+    try:
+        _QUEUE.put_nowait(row)
+        STATS["enqueued"] += 1
+    except queue.Full:
+        STATS["dropped"] += 1
 
-    conn.commit()
+def _ensure_writer():
+    global _WRITER
+    if _WRITER is not None and _WRITER.is_alive():
+        return
+    with _WRITER_LOCK:
+        if _WRITER is None or not _WRITER.is_alive():
+            _WRITER = threading.Thread(target=_writer_loop, name="usage-log-writer", daemon=True)
+            _WRITER.start()
+
+def _writer_loop():
+    # one long-lived connection, owned by this thread
+    conn = _connect()
+    conn.execute("PRAGMA journal_mode=WAL")
+    # WAL + NORMAL: commits don't fsync; a power cut can lose the last batch only
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    last_prune = 0.0
+    stopping = False
+    while not stopping:
+        batch = []
+        deadline = None
+        while len(batch) < USAGE_LOG_BATCH_SIZE:
+            timeout = USAGE_LOG_PRUNE_SECONDS if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                item = _QUEUE.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + USAGE_LOG_FLUSH_SECONDS
+
+        if stopping:
+            # drain whatever was queued before the stop marker
+            while True:
+                try:
+                    item = _QUEUE.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+
+        if batch:
+            _write_batch(conn, batch)
+        if USAGE_LOG_RETENTION_DAYS > 0 and time.monotonic() - last_prune >= USAGE_LOG_PRUNE_SECONDS:
+            last_prune = time.monotonic()
+            try:
+                STATS["pruned"] += prune_usage_logs(conn)
+            except (sqlite3.Error, OSError):
+                STATS["prune_errors"] += 1
+    conn.close()
+
+def _write_batch(conn, batch: list):
+    started = time.perf_counter()
+    try:
+        with conn:
+            conn.executemany(_INSERT_LOG, batch)
+            _update_rollups(conn, batch)
+    except sqlite3.Error:
+        STATS["write_errors"] += 1
+        STATS["dropped"] += len(batch)
+        return
+    STATS["written"] += len(batch)
+    STATS["batches"] += 1
+    STATS["batch_ms_max"] = max(STATS["batch_ms_max"], (time.perf_counter() - started) * 1000)
+
+_UPSERT_ROLLUP = """
+INSERT INTO {table} (bucket, endpoint, model, user_id, requests, cache_hits, input_bytes)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(bucket, endpoint, model, user_id) DO UPDATE SET
+    requests = requests + excluded.requests,
+    cache_hits = cache_hits + excluded.cache_hits,
+    input_bytes = input_bytes + excluded.input_bytes
+"""
+
+def _update_rollups(conn, batch: list):
+    hourly = {}
+    for user_id, _ip, endpoint, _hash, cached, created_at, model, input_bytes in batch:
+        key = (created_at[:13], endpoint or "", model or "", user_id or "")
+        agg = hourly.setdefault(key, [0, 0, 0])
+        agg[0] += 1
+        agg[1] += cached
+        agg[2] += input_bytes or 0
+
+    daily = {}
+    for (hour, *rest), (requests, hits, nbytes) in hourly.items():
+        agg = daily.setdefault((hour[:10], *rest), [0, 0, 0])
+        agg[0] += requests
+        agg[1] += hits
+        agg[2] += nbytes
+
+    for table, rows in (("usage_rollup_hourly", hourly), ("usage_rollup_daily", daily)):
+        conn.executemany(_UPSERT_ROLLUP.format(table=table), [(*k, *v) for k, v in rows.items()])
+
+def rebuild_rollups(conn=None):
+    """Recomputes both rollup tables over the span still covered by raw rows."""
+    own = conn is None
+    conn = conn or _connect()
+    with conn:
+        for table, width in (("usage_rollup_hourly", 13), ("usage_rollup_daily", 10)):
+            # buckets older than the oldest raw row may already be pruned: keep them
+            conn.execute(f"""
+            DELETE FROM {table}
+            WHERE bucket >= (SELECT substr(MIN(created_at), 1, {width}) FROM usage_logs)
+            """)
+            conn.execute(f"""
+            INSERT INTO {table} (bucket, endpoint, model, user_id, requests, cache_hits, input_bytes)
+            SELECT substr(created_at, 1, {width}), COALESCE(endpoint, ''), COALESCE(model, ''),
+                   COALESCE(user_id, ''), COUNT(*), SUM(cached), SUM(COALESCE(input_bytes, 0))
+            FROM usage_logs
+            GROUP BY 1, 2, 3, 4
+            """)
+    if own:
+        conn.close()
+
+def prune_usage_logs(conn=None, retention_days: int = None, chunk: int = 5000) -> int:
+    """
+    Deletes raw rows and hourly rollups older than retention_days (default
+    USAGE_LOG_RETENTION_DAYS), archiving raw rows first when
+    USAGE_LOG_ARCHIVE_DIR is set. Works in chunks so the write lock is
+    never held for long. Returns the number of raw rows removed.
+    """
+    days = USAGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    if days <= 0:
+        return 0
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+
+    own = conn is None
+    conn = conn or _connect()
+    removed = 0
+    try:
+        while True:
+            rows = conn.execute("""
+            SELECT id, user_id, ip, endpoint, file_hash, cached, created_at, model, input_bytes
+            FROM usage_logs
+            WHERE created_at < ?
+            ORDER BY created_at
+            LIMIT ?
+            """, (cutoff, chunk)).fetchall()
+            if not rows:
+                break
+            if USAGE_LOG_ARCHIVE_DIR:
+                _archive_rows(rows)
+            with conn:
+                conn.executemany("DELETE FROM usage_logs WHERE id=?", [(r[0],) for r in rows])
+            removed += len(rows)
+
+        with conn:
+            conn.execute("DELETE FROM usage_rollup_hourly WHERE bucket < ?", (cutoff[:13],))
+    finally:
+        if own:
+            conn.close()
+    return removed
+
+def _archive_rows(rows: list):
+    os.makedirs(USAGE_LOG_ARCHIVE_DIR, exist_ok=True)
+    by_day = {}
+    for row in rows:
+        by_day.setdefault((row[6] or "")[:10] or "unknown", []).append(row)
+    for day, day_rows in by_day.items():
+        path = os.path.join(USAGE_LOG_ARCHIVE_DIR, f"usage_logs_{day}.csv.gz")
+        # gzip members concatenate, so appending keeps the file readable
+        with gzip.open(path, "at", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(day_rows)
+
+ROLLUP_DIMENSIONS = ("endpoint", "model", "user_id")
+
+def query_rollups(granularity: str = "day", since: str = None, until: str = None, group_by=(),
+                  endpoint: str = None, model: str = None, user_id: str = None, limit: int = 1000):
+    """
+    Sums the rollup tables per bucket (and per group_by dimension), newest
+    first. since/until are inclusive ISO dates or datetimes, truncated to
+    the bucket. Returns dicts with requests, cache_hits, hit_rate, input_bytes.
+    """
+    if granularity not in ("hour", "day"):
+        raise ValueError("granularity must be 'hour' or 'day'")
+    unknown = [g for g in group_by if g not in ROLLUP_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"cannot group by {', '.join(unknown)}; use {', '.join(ROLLUP_DIMENSIONS)}")
+    table, width = ("usage_rollup_hourly", 13) if granularity == "hour" else ("usage_rollup_daily", 10)
+
+    where, params = [], []
+    if since:
+        where.append("bucket >= ?")
+        params.append(since[:width])
+    if until:
+        where.append("bucket <= ?")
+        params.append(until[:width])
+    for column, value in (("endpoint", endpoint), ("model", model), ("user_id", user_id)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+
+    columns = ", ".join(("bucket", *group_by))
+    sql = f"""
+    SELECT {columns}, SUM(requests) AS requests, SUM(cache_hits) AS cache_hits, SUM(input_bytes) AS input_bytes
+    FROM {table}
+    {"WHERE " + " AND ".join(where) if where else ""}
+    GROUP BY {columns}
+    ORDER BY bucket DESC, requests DESC
+    LIMIT ?
+    """
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r) for r in conn.execute(sql, (*params, limit)).fetchall()]
     conn.close()
+    for r in rows:
+        r["hit_rate"] = round(r["cache_hits"] / r["requests"], 4) if r["requests"] else 0.0
+    return rows
+
+def query_logs(user_id: str = None, endpoint: str = None, cached: bool = None, since: str = None,
+               until: str = None, before_id: int = None, limit: int = 50):
+    """
+    Raw rows matching the filters, newest first. Pass the smallest id of a
+    page as before_id to get the next one (keyset pagination: each page is
+    an index range scan, however deep).
+    """
+    where, params = [], []
+    for column, value in (("user_id", user_id), ("endpoint", endpoint)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if cached is not None:
+        where.append("cached = ?")
+        params.append(1 if cached else 0)
+    if since:
+        where.append("created_at >= ?")
+        params.append(since)
+    if until:
+        where.append("created_at <= ?")
+        params.append(until)
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute(f"""
+    SELECT id, user_id, ip, endpoint, file_hash, cached, created_at, model, input_bytes
+    FROM usage_logs
+    {"WHERE " + " AND ".join(where) if where else ""}
+    ORDER BY id DESC
+    LIMIT ?
+    """, (*params, limit))
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+def flush_usage_logs(timeout: float = 10.0):
+    """Stops the writer after it has written everything queued so far (shutdown)."""
+    global _WRITER
+    with _WRITER_LOCK:
+        writer, _WRITER = _WRITER, None
+    if writer is None or not writer.is_alive():
+        return
+    _QUEUE.put(_STOP, timeout=timeout)
+    writer.join(timeout)
+
+def usage_log_stats() -> dict:
+    return {
+        **STATS,
+        "queued": _QUEUE.qsize(),
+        "queue_size": USAGE_LOG_QUEUE_SIZE,
+        "batch_ms_max": round(STATS["batch_ms_max"], 2),
+    }
 
 def get_daily_count(user_id: str, day: str) -> int:
     conn = _connect()
@@ -80,6 +428,33 @@ def increment_daily(user_id: str, day: str):
     conn.commit()
     conn.close()
 
+def add_daily_counts(day: str, user_counts: dict, ip_counts: dict):
+    """Adds per-user and per-IP request deltas for one day in a single transaction."""
+    conn = _connect()
+    with conn:
+        conn.executemany("""
+        INSERT INTO daily_usage (user_id, day, count)
+        VALUES (?, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET count = count + excluded.count
+        """, [(user_id, day, n) for user_id, n in user_counts.items()])
+        conn.executemany("""
+        INSERT INTO daily_usage_ip (ip, day, count)
+        VALUES (?, ?, ?)
+        ON CONFLICT(ip, day) DO UPDATE SET count = count + excluded.count
+        """, [(ip, day, n) for ip, n in ip_counts.items()])
+    conn.close()
+
+def load_daily_counts(day: str):
+    """Returns ({user_id: count}, {ip: count}) for one day."""
+    conn = _connect()
+    cur = conn.cursor()
+    cur.execute("SELECT user_id, count FROM daily_usage WHERE day=?", (day,))
+    users = dict(cur.fetchall())
+    cur.execute("SELECT ip, count FROM daily_usage_ip WHERE day=?", (day,))
+    ips = dict(cur.fetchall())
+    conn.close()
+    return users, ips
+
 def reset_daily(user_id: str, day: str):
     conn = _connect()
     cur = conn.cursor()
@@ -99,3 +474,21 @@ def fetch_recent_logs(limit: int = 50):
     rows = cur.fetchall()
     conn.close()
     return rows
+
+def _main(argv):
+    if not argv or argv[0] not in ("prune", "rebuild-rollups"):
+        print("usage: python -m app.usage_db prune [days] | rebuild-rollups")
+        return 2
+
+    init_db()
+    if argv[0] == "prune":
+        days = int(argv[1]) if len(argv) > 1 else USAGE_LOG_RETENTION_DAYS
+        n = prune_usage_logs(retention_days=days)
+        print(f"removed {n} usage_logs rows older than {days} days from {DB_PATH}")
+    else:
+        rebuild_rollups()
+        print(f"rebuilt usage rollups in {DB_PATH}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(_main(sys.argv[1:]))
@@ -1,22 +1,38 @@
 import os
 import base64
 import json
-import requests
 from fastapi import UploadFile, Request
 
 from app.prompts_validate import SYSTEM_PROMPT_VALIDATE, USER_PROMPT_VALIDATE_TEMPLATE
+from app.openai_client import chat_completion, chat_completion_streamed
 from app.cache import sha256_bytes, cache_get, cache_set
-from app.spectrogram import audio_to_spectrogram_image
-from app.media_utils import trim_audio
-from app.species import load_species
+from app.artifacts import decoded_audio, spectrogram_png
+from app.species import get_species_by_id
 from app.usage_db import log_usage
+from app.singleflight import singleflight
+from app.media_executor import run_media
+from app.uploads import UPLOAD_MAX_AUDIO_BYTES, SpooledUpload, ingest_upload
+from app.upload_alias import alias_get, alias_set
+from app.jobs import Job, submit_job
+from app.streaming import sse_stream
+from app.audio_fingerprint import (
+    AUDIO_FP_ENABLED,
+    AUDIO_FP_INDEX_ALIGNMENTS,
+    audio_fingerprint,
+    fp_index_add,
+    fp_index_search,
+    record_audio_lookup,
+)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-OPENAI_URL = "https://api.openai.com/v1/chat/completions"
 
 
-def _call_openai_validate(spectrogram_png: bytes, prompt_text: str) -> dict:
+# Fields of the streamed completion that make up the "verdict" event
+_VERDICT_FIELDS = ("best_match_species_id", "match", "match_confidence")
+
+
+async def _call_openai_validate(spectrogram_png: bytes, prompt_text: str, emit=None) -> dict:
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY not set")
 
@@ -39,26 +55,41 @@ def _call_openai_validate(spectrogram_png: bytes, prompt_text: str) -> dict:
         "response_format": {"type": "json_object"},
     }
 
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    if emit is None:
+        data = await chat_completion(payload)
+        content = data["choices"][0]["message"]["content"]
+        return json.loads(content)
 
-    r = requests.post(OPENAI_URL, headers=headers, json=payload, timeout=60)
-    if r.status_code != 200:
-        raise RuntimeError(f"OpenAI error {r.status_code}: {r.text}")
+    # The verdict comes before the explanation and the alternative in the
+    # schema, so it can be sent while those are still being written.
+    seen = {}
 
-    data = r.json()
-    content = data["choices"][0]["message"]["content"]
-    return json.loads(content)
+    def on_value(path, value):
+        if len(path) != 1 or path[0] not in _VERDICT_FIELDS or len(seen) == len(_VERDICT_FIELDS):
+            return
+        seen[path[0]] = value
+        if len(seen) == len(_VERDICT_FIELDS):
+            best_id = seen["best_match_species_id"]
+            emit("verdict", {
+                "best_match": (_species_by_id(best_id) if best_id else None)
+                or {"id": best_id, "species_name": "unknown", "scientific_name": ""},
+                "match": seen["match"] or "uncertain",
+                "match_confidence": float(seen["match_confidence"] or 0.0),
+            })
+
+    return json.loads(await chat_completion_streamed(payload, on_value))
 
 
 def _species_by_id(species_id: str):
-    all_species = load_species()
-    for s in all_species:
-        if s.get("id") == species_id:
-            return s
-    return None
+    return get_species_by_id(species_id)
+
+
+def _validate_key(audio_hash: str, target_species_id: str, candidate_species_ids: list[str]) -> str:
+    # Derived from the clip hash (not the WAV bytes) so fingerprint matches
+    # can look up another clip's validate result.
+    return "validate_" + sha256_bytes(
+        f"{audio_hash}|{target_species_id}|{','.join(candidate_species_ids)}".encode("utf-8")
+    )
 
 
 def _make_candidates_block(candidate_ids: list[str]) -> str:
@@ -81,15 +112,65 @@ async def validate_sound_against_candidates(
     season: str = "",
     habitat: str = "",
 ) -> dict:
-    raw_bytes = await audio.read()
-    trimmed_wav = trim_audio(raw_bytes)
+    with await ingest_upload(audio, UPLOAD_MAX_AUDIO_BYTES) as upload:
+        return await _validate_upload(
+            request, upload, target_species_id, candidate_species_ids, location, season, habitat
+        )
+
 
-    key = "validate_" + sha256_bytes(
-        trimmed_wav
-        + target_species_id.encode("utf-8")
-        + ",".join(candidate_species_ids).encode("utf-8")
+async def stream_validate_sound(
+    request: Request,
+    audio: UploadFile,
+    target_species_id: str,
+    candidate_species_ids: list[str],
+    location: str = "",
+    season: str = "",
+    habitat: str = "",
+):
+    """
+    validate_sound_against_candidates as SSE: a "verdict" event (best match,
+    match, confidence) as soon as the model has written it, then "result".
+    Cache hits send "result" alone.
+    """
+    upload = await ingest_upload(audio, UPLOAD_MAX_AUDIO_BYTES)
+    return sse_stream(
+        lambda emit: _validate_upload(
+            request, upload, target_species_id, candidate_species_ids, location, season, habitat, emit
+        ),
+        [upload],
     )
-    cached = cache_get(key)
+
+
+async def submit_validate_job(
+    request: Request,
+    audio: UploadFile,
+    target_species_id: str,
+    candidate_species_ids: list[str],
+    location: str = "",
+    season: str = "",
+    habitat: str = "",
+) -> Job:
+    """Reads the upload now and queues validate_sound_against_candidates' work as a job."""
+    upload = await ingest_upload(audio, UPLOAD_MAX_AUDIO_BYTES)
+    return submit_job(
+        request,
+        "validate_sound",
+        lambda: _validate_upload(request, upload, target_species_id, candidate_species_ids, location, season, habitat),
+        [upload],
+    )
+
+
+async def _validate_upload(
+    request: Request,
+    upload: SpooledUpload,
+    target_species_id: str,
+    candidate_species_ids: list[str],
+    location: str,
+    season: str,
+    habitat: str,
+    emit=None,
+) -> dict:
+    raw_hash = upload.sha256
 
     user_id = request.headers.get(
         "x-user-id", f"ip:{request.client.host if request.client else 'unknown'}"
@@ -99,58 +180,103 @@ async def validate_sound_against_candidates(
         request.client.host if request.client else "unknown",
     ).split(",")[0].strip()
 
+    # Byte-identical re-upload: the alias gives the clip hash without decoding
+    alias_hash = alias_get("audio", raw_hash)
+    if alias_hash:
+        alias_key = _validate_key(alias_hash, target_species_id, candidate_species_ids)
+        cached = cache_get(alias_key)
+        if cached:
+            record_audio_lookup("exact_hits")
+            cached["cached"] = True
+            log_usage(user_id, ip, "/api/validate/sound", alias_key, True, OPENAI_MODEL, cached.get("input_bytes"))
+            return cached
+
+    trimmed_wav, samples = await decoded_audio(upload.sha256, upload.source)
+
+    audio_hash = sha256_bytes(trimmed_wav)
+    key = _validate_key(audio_hash, target_species_id, candidate_species_ids)
+    cached = cache_get(key)
+    outcome = "exact_hits" if cached else "misses"
+    served_key = key
+
+    if not cached and AUDIO_FP_ENABLED:
+        fp = await run_media(audio_fingerprint, samples)
+        for dup_hash in fp_index_search(fp):
+            dup_key = _validate_key(dup_hash, target_species_id, candidate_species_ids)
+            cached = cache_get(dup_key)
+            if cached:
+                cached["near_duplicate"] = True
+                outcome = "near_dup_hits"
+                served_key = dup_key
+                break
+    record_audio_lookup(outcome)
+
+    if not alias_hash:
+        alias_set("audio", raw_hash, audio_hash)
+
     if cached:
         cached["cached"] = True
-        log_usage(user_id, ip, "/api/validate/sound", key, True, OPENAI_MODEL, len(trimmed_wav))
+        log_usage(user_id, ip, "/api/validate/sound", served_key, True, OPENAI_MODEL, len(trimmed_wav))
         return cached
 
-    target = _species_by_id(target_species_id) or {
-        "id": target_species_id,
-        "species_name": "unknown",
-        "scientific_name": "",
-    }
-    candidates_block = _make_candidates_block(candidate_species_ids)
-
-    prompt = USER_PROMPT_VALIDATE_TEMPLATE.format(
-        target_species_id=target.get("id", ""),
-        target_species_name=target.get("species_name", ""),
-        target_scientific_name=target.get("scientific_name", ""),
-        candidates_block=candidates_block,
-        location=location or "unknown",
-        season=season or "unknown",
-        habitat=habitat or "unknown",
-    )
+    async def _validate():
+        target = _species_by_id(target_species_id) or {
+            "id": target_species_id,
+            "species_name": "unknown",
+            "scientific_name": "",
+        }
+        candidates_block = _make_candidates_block(candidate_species_ids)
 
-    spectrogram_png = audio_to_spectrogram_image(trimmed_wav)
-    raw = _call_openai_validate(spectrogram_png, prompt)
+        prompt = USER_PROMPT_VALIDATE_TEMPLATE.format(
+            target_species_id=target.get("id", ""),
+            target_species_name=target.get("species_name", ""),
+            target_scientific_name=target.get("scientific_name", ""),
+            candidates_block=candidates_block,
+            location=location or "unknown",
+            season=season or "unknown",
+            habitat=habitat or "unknown",
+        )
 
-    best_id = raw.get("best_match_species_id")
-    alt_id = raw.get("best_alternative_species_id")
+        spectro_png = await spectrogram_png(audio_hash, trimmed_wav, samples)
+        raw = await _call_openai_validate(spectro_png, prompt, emit)
 
-    best = _species_by_id(best_id) if best_id else None
-    alt = _species_by_id(alt_id) if alt_id else None
-    target_s = (
-        _species_by_id(raw.get("target_species_id"))
-        if raw.get("target_species_id")
-        else target
-    )
+        best_id = raw.get("best_match_species_id")
+        alt_id = raw.get("best_alternative_species_id")
 
-    out = {
-        "target_species": target_s,
-        "best_match": best
-        if best
-        else {"id": best_id, "species_name": "unknown", "scientific_name": ""},
-        "best_alternative": alt
-        if alt
-        else {"id": alt_id, "species_name": "unknown", "scientific_name": ""},
-        "match": raw.get("match", "uncertain"),
-        "match_confidence": float(raw.get("match_confidence") or 0.0),
-        "best_alternative_confidence": float(raw.get("best_alternative_confidence") or 0.0),
-        "explanation": raw.get("explanation", ""),
-        "cached": False,
-        "input_bytes": len(trimmed_wav),
-    }
+        best = _species_by_id(best_id) if best_id else None
+        alt = _species_by_id(alt_id) if alt_id else None
+        target_s = (
+            _species_by_id(raw.get("target_species_id"))
+            if raw.get("target_species_id")
+            else target
+        )
+
+        out = {
+            "target_species": target_s,
+            "best_match": best
+            if best
+            else {"id": best_id, "species_name": "unknown", "scientific_name": ""},
+            "best_alternative": alt
+            if alt
+            else {"id": alt_id, "species_name": "unknown", "scientific_name": ""},
+            "match": raw.get("match", "uncertain"),
+            "match_confidence": float(raw.get("match_confidence") or 0.0),
+            "best_alternative_confidence": float(raw.get("best_alternative_confidence") or 0.0),
+            "explanation": raw.get("explanation", ""),
+            "cached": False,
+            "input_bytes": len(trimmed_wav),
+        }
+
+        cache_set(key, out)
+        if AUDIO_FP_ENABLED:
+            index_fp = await run_media(audio_fingerprint, samples, AUDIO_FP_INDEX_ALIGNMENTS)
+            fp_index_add(audio_hash, index_fp)
+        return out
+
+    # Identical clip + candidate set already in flight share one upstream call
+    out, coalesced = await singleflight(key, _validate)
+    if coalesced:
+        out["cached"] = True
 
-    cache_set(key, out)
-    log_usage(user_id, ip, "/api/validate/sound", key, False, OPENAI_MODEL, len(trimmed_wav))
+    log_usage(user_id, ip, "/api/validate/sound", key, coalesced, OPENAI_MODEL, len(trimmed_wav))
     return out
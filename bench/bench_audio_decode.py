@@ -0,0 +1,80 @@
+"""
+Audio decode/trim: ffmpeg over pipes vs. the temp-file path.
+
+    python -m bench.bench_audio_decode [--rounds 10]
+
+Fixtures are synthetic chirp clips encoded with the local ffmpeg into the
+upload formats we see (WAV, MP3, Ogg/Opus, M4A with moov at the end).
+"Temp bytes" is what each path writes to the temp dir per request; the pipe
+path writes nothing unless it has to fall back for a non-streamable input.
+"""
+import os
+import time
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+from app import media_utils
+from bench.bench_spectrogram import synthetic_clip
+
+FORMATS = [
+    ("wav", ["-c:a", "pcm_s16le"]),
+    ("mp3", ["-b:a", "128k"]),
+    ("ogg", ["-c:a", "libopus"]),
+    ("m4a", ["-c:a", "aac"]),
+]
+
+
+def _fixtures(tmpdir: str):
+    out = []
+    for seconds in (6, 60):
+        src = os.path.join(tmpdir, f"src_{seconds}.wav")
+        with open(src, "wb") as f:
+            f.write(synthetic_clip(seconds, seconds))
+        for ext, codec in FORMATS:
+            dst = os.path.join(tmpdir, f"clip_{seconds}s.{ext}")
+            subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", src, *codec, dst], check=True)
+            with open(dst, "rb") as f:
+                out.append((f"{seconds}s {ext}", f.read()))
+    return out
+
+
+def _tempfile_path(data: bytes):
+    wav = media_utils._trim_audio_tempfile(data)
+    return wav, media_utils.wav_to_samples(wav)
+
+
+def _time(fn, data: bytes, rounds: int) -> float:
+    fn(data)
+    walls = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn(data)
+        walls.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(walls))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fixtures = _fixtures(tmpdir)
+
+    print(f"{'input':<10} {'bytes':>9}  {'pipe ms':>8} {'temp B':>9}  {'tempfile ms':>11} {'temp B':>9}")
+    for name, data in fixtures:
+        wav, _ = _tempfile_path(data)
+        streamable = media_utils._pipe_decodable(data) and media_utils._decode_pcm_pipe(data) is not None
+        pipe_temp = 0 if streamable else len(data) + len(wav)
+
+        pipe_ms = _time(media_utils.decode_audio, data, args.rounds)
+        file_ms = _time(_tempfile_path, data, args.rounds)
+        print(f"{name:<10} {len(data):>9}  {pipe_ms:>8.1f} {pipe_temp:>9}  {file_ms:>11.1f} {len(data) + len(wav):>9}"
+              + ("" if streamable else "   (pipe fell back)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Batch photo identification against a small media pool.
+
+    python -m bench.bench_photo_batch [--media-workers 1] [--images 8]
+
+Runs POST /api/identify/photos in both modes against the stub upstream with
+MEDIA_WORKERS set low, so a full batch is more than the media pool admits
+at once (MEDIA_WORKERS + MEDIA_QUEUE_SIZE). Every image of a legal batch
+must still succeed: a batch's preprocessing waits for its own earlier
+images instead of being rejected with 503. Exits 1 otherwise.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+
+PORT = int(os.getenv("STUB_PORT", "9138"))
+
+
+def _configure(args, workdir: str):
+    # before app modules are imported: they read their settings at import time
+    os.environ.update({
+        "MEDIA_WORKERS": str(args.media_workers),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub"),
+        "OPENAI_URL": f"http://127.0.0.1:{PORT}/v1/chat/completions",
+        "STUB_LATENCY_MS": str(args.latency_ms),
+        "DB_PATH": os.path.join(workdir, "usage.sqlite"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "CACHE_DB_PATH": os.path.join(workdir, "cache.sqlite"),
+        "PHASH_INDEX_PATH": os.path.join(workdir, "phash_index.tsv"),
+        "UPLOAD_SPOOL_DIR": workdir,
+        "DAILY_LIMIT_PER_USER": "1000000",
+        "DAILY_LIMIT_PER_IP": "1000000",
+    })
+
+
+def _start_stub():
+    import uvicorn
+
+    config = uvicorn.Config("bench.stub_openai:app", host="127.0.0.1", port=PORT, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _run(args) -> bool:
+    import httpx
+
+    from app.main import app, shutdown
+    from app.media_executor import MEDIA_QUEUE_SIZE, MEDIA_WORKERS
+    from bench.bench_photo_preprocess import sample_photo
+
+    print(f"MEDIA_WORKERS={MEDIA_WORKERS}, MEDIA_QUEUE_SIZE={MEDIA_QUEUE_SIZE}, {args.images} images per batch")
+    ok = True
+    seed = 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=120) as client:
+        for mode in ("each", "combined"):
+            files = []
+            for _ in range(args.images):
+                seed += 1
+                files.append(("images", (f"{seed}.jpg", sample_photo(seed, (2400, 1800)), "image/jpeg")))
+
+            t0 = time.perf_counter()
+            r = await client.post("/api/identify/photos", files=files, data={"mode": mode})
+            elapsed = time.perf_counter() - t0
+            if r.status_code != 200:
+                print(f"{mode:<9} {r.status_code} {r.text[:200]}  ({elapsed:.2f} s)")
+                ok = False
+                continue
+            statuses = [img.get("status", 200) for img in r.json()["images"]]
+            counts = {s: statuses.count(s) for s in sorted(set(statuses))}
+            print(f"{mode:<9} 200  per image: {counts}  ({elapsed:.2f} s)")
+            ok = ok and set(statuses) == {200}
+    await shutdown()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--media-workers", type=int, default=1)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        _configure(args, workdir)
+        server = _start_stub()
+        try:
+            ok = asyncio.run(_run(args))
+        finally:
+            server.should_exit = True
+    print("ok" if ok else "FAILED: images were rejected")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Photo preprocessing: legacy full decode + optimized PNG vs. draft decode +
+compact encodings.
+
+    python -m bench.bench_photo_preprocess [--rounds 5]
+
+Sample photos are generated: blurred shapes plus sensor-like noise, saved as
+phone-style JPEGs (12, 8 and 3 MP, one with EXIF rotation) and one PNG
+screenshot-style upload. Payload is the base64 size sent upstream.
+"""
+import io
+import time
+import argparse
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from app import media_utils
+
+
+def sample_photo(seed: int, size, fmt: str = "JPEG", orientation: int = 1) -> bytes:
+    rng = np.random.default_rng(seed)
+    w, h = size
+    img = Image.new("RGB", size, tuple(int(v) for v in rng.integers(40, 200, 3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(20):
+        x, y = rng.integers(0, w, 2)
+        r = int(rng.integers(w // 20, w // 4))
+        draw.ellipse([x, y, x + r, y + r * 0.7], fill=tuple(int(v) for v in rng.integers(0, 255, 3)))
+    img = img.filter(ImageFilter.GaussianBlur(w / 400))
+    noise = rng.normal(0, 6, (h, w, 1)).astype(np.int16)
+    img = Image.fromarray(np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8))
+
+    out = io.BytesIO()
+    if fmt == "JPEG":
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        img.save(out, format="JPEG", quality=92, exif=exif)
+    else:
+        img.save(out, format=fmt)
+    return out.getvalue()
+
+
+def legacy_preprocess(image_bytes: bytes) -> bytes:
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    img.thumbnail((media_utils.MAX_IMAGE_SIZE, media_utils.MAX_IMAGE_SIZE))
+    out = io.BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def _run(fn, data: bytes, rounds: int):
+    payload = fn(data)
+    walls = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn(data)
+        walls.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(walls)), (len(payload) + 2) // 3 * 4
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    photos = [
+        ("12MP jpeg", sample_photo(1, (4000, 3000))),
+        ("12MP jpeg rot", sample_photo(2, (4000, 3000), orientation=6)),
+        ("8MP jpeg", sample_photo(3, (3264, 2448))),
+        ("3MP jpeg", sample_photo(4, (2048, 1536))),
+        ("2MP png", sample_photo(5, (1920, 1080), fmt="PNG")),
+    ]
+
+    def mode(fmt):
+        def run(data):
+            media_utils.PHOTO_ENCODE_FORMAT = fmt
+            return media_utils.preprocess_photo(data)[0]
+        return run
+
+    variants = [("legacy png", legacy_preprocess), ("jpeg", mode("jpeg")), ("webp", mode("webp")), ("png", mode("png"))]
+    print(f"MAX_IMAGE_SIZE={media_utils.MAX_IMAGE_SIZE}, quality={media_utils.PHOTO_ENCODE_QUALITY}; "
+          f"median ms / base64 KB")
+    print(f"{'photo':<14}" + "".join(f"{name:>20}" for name, _ in variants))
+    for label, data in photos:
+        cells = []
+        for _, fn in variants:
+            ms, b64 = _run(fn, data, args.rounds)
+            cells.append(f"{ms:8.1f} / {b64 / 1024:7.0f}")
+        print(f"{label:<14}" + "".join(f"{c:>20}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Quota engine under concurrency: limits must hold exactly, and survive a
+flush + restart. Also shows the overshoot of the old read-then-increment
+check and the per-charge cost of the engine.
+
+    python -m bench.bench_quota_concurrency [--threads 32] [--attempts 200]
+
+Exits non-zero if any limit is exceeded, so it doubles as a check in CI.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+from app import usage_db
+from app.quotas import QuotaEngine, today_key
+
+
+def _hammer(fn, threads: int, attempts: int) -> int:
+    """Runs fn(thread, i) from all threads at once; returns how many returned None."""
+    ok = [0] * threads
+    barrier = threading.Barrier(threads)
+
+    def worker(t):
+        barrier.wait()
+        for i in range(attempts):
+            if fn(t, i) is None:
+                ok[t] += 1
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    return sum(ok)
+
+
+def _legacy_charge(user_id: str, limit: int):
+    # the original enforce_user_quota: read, compare, then increment
+    day = today_key()
+    if usage_db.get_daily_count(user_id, day) >= limit:
+        return "user"
+    usage_db.increment_daily(user_id, day)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--attempts", type=int, default=200)
+    args = parser.parse_args()
+    sys.setswitchinterval(1e-6)  # force as much interleaving as possible
+
+    failures = []
+
+    def check(name, got, want):
+        status = "ok" if got == want else "FAIL"
+        print(f"{name:<44} allowed {got:>5}  limit {want:>5}  {status}")
+        if got != want:
+            failures.append(name)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        usage_db.DB_PATH = os.path.join(tmpdir, "usage.sqlite")
+        usage_db.init_db()
+
+        engine = QuotaEngine(user_limit=25, ip_limit=100, shards=16)
+        check("one user, many IPs",
+              _hammer(lambda t, i: engine.charge("alice", f"10.0.{t}.{i}"), args.threads, args.attempts), 25)
+        check("many users, one IP",
+              _hammer(lambda t, i: engine.charge(f"user{t}-{i}", "192.0.2.7"), args.threads, args.attempts), 100)
+        check("user and IP limits together (user binds)",
+              _hammer(lambda t, i: engine.charge(f"u{i % 3}", f"198.51.100.{t % 2}"), args.threads, args.attempts),
+              3 * 25)
+
+        # persisted deltas rehydrate into a fresh engine (process restart)
+        engine.flush()
+        restarted = QuotaEngine(user_limit=25, ip_limit=100, shards=16)
+        check("after restart: alice", restarted.charge("alice", "10.9.9.9") is None and 1 or 0, 0)
+        check("after restart: bob on the exhausted IP", restarted.charge("bob", "192.0.2.7") is None and 1 or 0, 0)
+        check("after restart: daily_usage row for alice", usage_db.get_daily_count("alice", today_key()), 25)
+
+        legacy = _hammer(lambda t, i: _legacy_charge("carol", 25), min(args.threads, 8), 10)
+        print(f"{'legacy read-then-increment (for reference)':<44} allowed {legacy:>5}  limit {25:>5}")
+
+        fast = QuotaEngine(user_limit=10 ** 9, ip_limit=10 ** 9, shards=16, persist=False)
+        n = 200_000
+        t0 = time.perf_counter()
+        for i in range(n):
+            fast.charge(f"user{i % 1000}", f"10.0.0.{i % 250}")
+        print(f"charge cost: {(time.perf_counter() - t0) / n * 1e6:.2f} us (single thread)")
+
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
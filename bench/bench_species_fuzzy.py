@@ -0,0 +1,88 @@
+"""
+Fuzzy species matching latency at the full species-list size.
+
+    python -m bench.bench_species_fuzzy [--rounds 2000]
+
+Queries are real species names with a typo injected, so every lookup has to go
+through the trigram index rather than the exact-match dicts. Genus-only and
+group-only names ("Sparrow", "Passer sp.") are checked separately: none of
+them may match a specific species.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.species import load_species
+from app.species_fuzzy import fuzzy_match_species, _get_index
+
+
+# (species_name, scientific_name) answers too generic to name one species
+GENERIC_NAMES = [
+    ("Pigeon", ""), ("Robin", ""), ("Sparrow", ""), ("Warbler", ""), ("Crow", ""),
+    ("gull", ""), ("Blackbird", ""), ("Hawk", ""), ("Owl", ""), ("Hummingbird", ""),
+    ("Sparrow", "Passer sp."), ("Thrush", "Turdus"), ("Gull", "Larus sp."),
+    ("", "Turdus"), ("", "Passer"), ("", "Corvus sp."), ("Woodpecker", "Picidae"),
+]
+
+
+def _mutate(name: str, rng: random.Random) -> str:
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 1)
+    op = rng.choice(("drop", "swap", "replace"))
+    if op == "drop":
+        return name[:i] + name[i + 1:]
+    if op == "swap":
+        return name[:i - 1] + name[i] + name[i - 1] + name[i + 1:]
+    return name[:i] + rng.choice("aeiou") + name[i + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    species = load_species()
+
+    t0 = time.perf_counter()
+    _get_index()
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    samples = [rng.choice(species) for _ in range(args.rounds)]
+    queries = [(_mutate(s["species_name"], rng), _mutate(s["scientific_name"], rng)) for s in samples]
+
+    timings = []
+    correct = 0
+    for s, (name, sci) in zip(samples, queries):
+        t0 = time.perf_counter()
+        match, _ = fuzzy_match_species(name, sci)
+        timings.append((time.perf_counter() - t0) * 1e6)
+        if match is not None and match["id"] == s["id"]:
+            correct += 1
+
+    timings.sort()
+    print(f"species records : {len(species)}")
+    print(f"index build     : {build_ms:.1f} ms")
+    print(f"lookups         : {len(timings)}")
+    print(f"p50 / p95 / p99 : {timings[len(timings) // 2]:.0f} / "
+          f"{timings[int(len(timings) * 0.95)]:.0f} / {timings[int(len(timings) * 0.99)]:.0f} us")
+    print(f"mean            : {statistics.mean(timings):.0f} us")
+    print(f"top-1 accuracy  : {correct / len(samples):.1%}")
+
+    false_matches = []
+    for name, sci in GENERIC_NAMES:
+        match, score = fuzzy_match_species(name, sci)
+        if match is not None:
+            false_matches.append(f"{name or sci!r} -> {match['species_name']} ({score:.2f})")
+    print(f"generic names   : {len(false_matches)}/{len(GENERIC_NAMES)} matched a species")
+    for line in false_matches:
+        print(f"  {line}")
+    if false_matches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
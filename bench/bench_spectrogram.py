@@ -0,0 +1,84 @@
+"""
+Spectrogram rendering: in-process NumPy renderer vs. the ffmpeg subprocess.
+
+    python -m bench.bench_spectrogram [--clips 20] [--seconds 6]
+
+Uses synthetic chirp clips (22.05 kHz mono WAV, the trim_audio output format).
+Wall time is per clip; CPU time includes the ffmpeg child processes.
+"""
+import io
+import os
+import wave
+import time
+import argparse
+import resource
+
+import numpy as np
+
+from app.media_utils import wav_to_samples
+from app.spectrogram import render_spectrogram, _ffmpeg_spectrogram
+
+SAMPLE_RATE = 22050
+
+
+def synthetic_clip(seed: int, seconds: float) -> bytes:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    x = rng.normal(0, 0.02, len(t))
+    for _ in range(int(4 * seconds)):
+        start, length = rng.uniform(0, seconds - 0.3), rng.uniform(0.05, 0.25)
+        f0 = rng.uniform(1500, 7000)
+        f1 = f0 * rng.uniform(0.6, 1.6)
+        m = (t >= start) & (t < start + length)
+        tt = t[m] - start
+        x[m] += 0.4 * np.sin(2 * np.pi * (f0 * tt + (f1 - f0) * tt ** 2 / (2 * length))) * np.hanning(m.sum())
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes((np.clip(x, -1, 1) * 32767).astype("<i2").tobytes())
+    return out.getvalue()
+
+
+def _cpu() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+
+def _measure(name, fn, clips):
+    fn(clips[0])  # warm-up
+    walls = []
+    cpu0 = _cpu()
+    for clip in clips:
+        t0 = time.perf_counter()
+        fn(clip)
+        walls.append((time.perf_counter() - t0) * 1000)
+    cpu_ms = (_cpu() - cpu0) * 1000 / len(clips)
+    walls.sort()
+    print(f"{name:<16} p50 {walls[len(walls) // 2]:7.1f} ms   "
+          f"p95 {walls[int(len(walls) * 0.95)]:7.1f} ms   cpu {cpu_ms:7.1f} ms/clip")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clips", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=6.0)
+    args = parser.parse_args()
+
+    clips = [synthetic_clip(i, args.seconds) for i in range(args.clips)]
+    print(f"{args.clips} clips x {args.seconds:.0f} s, 1200x600 PNG")
+
+    _measure("numpy (wav)", lambda b: render_spectrogram(wav_to_samples(b)), clips)
+    decoded = {id(b): wav_to_samples(b) for b in clips}
+    _measure("numpy (samples)", lambda b: render_spectrogram(decoded[id(b)]), clips)
+    if os.system("ffmpeg -version > /dev/null 2>&1") == 0:
+        _measure("ffmpeg", _ffmpeg_spectrogram, clips)
+    else:
+        print("ffmpeg not found, skipping")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Upstream client throughput vs. concurrency against the local stub.
+
+    python -m bench.bench_upstream_concurrency [--latency-ms 200] [--calls 64]
+
+Starts bench.stub_openai in a background thread, then issues the same number
+of chat_completion() calls at increasing concurrency. With a non-blocking,
+pooled client throughput should grow roughly linearly until it reaches
+OPENAI_MAX_CONCURRENCY.
+"""
+import os
+import argparse
+import asyncio
+import threading
+import time
+
+PORT = int(os.getenv("STUB_PORT", "9137"))
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ["OPENAI_URL"] = f"http://127.0.0.1:{PORT}/v1/chat/completions"
+
+import uvicorn  # noqa: E402
+
+from app import openai_client  # noqa: E402
+
+
+def _start_stub(latency_ms: float) -> uvicorn.Server:
+    os.environ["STUB_LATENCY_MS"] = str(latency_ms)
+    config = uvicorn.Config("bench.stub_openai:app", host="127.0.0.1", port=PORT, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _run(calls: int, concurrency: int) -> float:
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            await openai_client.chat_completion({"model": "stub", "messages": []})
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    return time.perf_counter() - t0
+
+
+async def _main(args):
+    print(f"stub latency {args.latency_ms:.0f} ms, {args.calls} calls per level, "
+          f"OPENAI_MAX_CONCURRENCY={openai_client.OPENAI_MAX_CONCURRENCY}")
+    print(f"{'concurrency':>11}  {'seconds':>8}  {'calls/s':>8}")
+    for c in args.levels:
+        elapsed = await _run(args.calls, c)
+        print(f"{c:>11}  {elapsed:>8.2f}  {args.calls / elapsed:>8.1f}")
+    await openai_client.close_client()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--calls", type=int, default=64)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 32])
+    args = parser.parse_args()
+
+    server = _start_stub(args.latency_ms)
+    try:
+        asyncio.run(_main(args))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Usage logging: per-call connect/insert/commit vs. the queued batch writer.
+
+    python -m bench.bench_usage_log [--rows 5000] [--threads 8]
+
+Runs against a throwaway database. "caller us" is the time log_usage takes
+on the request path; for the queued writer, "drain ms" is how long the
+background thread needs to make every row durable after the last call.
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from app import usage_db
+
+
+def _legacy_log_usage(*row):
+    # the original implementation: one connection and one commit per row
+    conn = usage_db._connect()
+    conn.execute(usage_db._INSERT_LOG, (*row[:4], 1 if row[4] else 0, datetime.utcnow().isoformat(), *row[5:]))
+    conn.commit()
+    conn.close()
+
+
+def _run(fn, rows: int, threads: int):
+    per_call = []
+    lock = threading.Lock()
+
+    def worker(n):
+        local = []
+        for i in range(n):
+            t0 = time.perf_counter()
+            fn(f"user{i % 50}", "10.0.0.1", "/api/identify/photo", f"photo_{i:064x}", i % 3 == 0, "gpt-4o-mini", 18000)
+            local.append((time.perf_counter() - t0) * 1e6)
+        with lock:
+            per_call.extend(local)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(rows // threads,)) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return time.perf_counter() - started, np.array(per_call)
+
+
+def _count() -> int:
+    conn = sqlite3.connect(usage_db.DB_PATH)
+    n = conn.execute("SELECT COUNT(*) FROM usage_logs").fetchone()[0]
+    conn.close()
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'writer':<10} {'rows/s':>9} {'caller us p50':>14} {'p99':>9} {'drain ms':>9} {'rows':>7}")
+    for name, fn in (("per-call", _legacy_log_usage), ("queued", usage_db.log_usage)):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            usage_db.DB_PATH = os.path.join(tmpdir, "usage.sqlite")
+            usage_db.init_db()
+
+            wall, per_call = _run(fn, args.rows, args.threads)
+            t0 = time.perf_counter()
+            usage_db.flush_usage_logs()
+            drain_ms = (time.perf_counter() - t0) * 1000
+
+            print(f"{name:<10} {len(per_call) / wall:>9.0f} {np.percentile(per_call, 50):>14.1f} "
+                  f"{np.percentile(per_call, 99):>9.1f} {drain_ms:>9.1f} {_count():>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+End-to-end load generator: drives the identify and validate endpoints at a
+target request rate against the stub upstream.
+
+    python -m bench.loadgen [--rps 20] [--duration 30] [--concurrency 64]
+                            [--mix photo=1,sound=1,validate=1] [--hit-ratio 0.5]
+                            [--stub-latency-ms 800 --stub-latency-dist lognormal
+                             --stub-latency-spread 0.4 --stub-error-rate 0.01]
+                            [--out results.json]
+
+By default it starts bench.stub_openai and the app (uvicorn, --app-workers
+processes) as subprocesses on local ports, with OPENAI_URL pointing at the
+stub and the database, caches and indexes in a temporary directory. With
+--base-url it targets an app that is already running instead (start the
+stub and set OPENAI_URL yourself).
+
+Requests arrive open-loop at --rps (evenly spaced, or --arrivals poisson);
+at most --concurrency are in flight, later arrivals wait for a slot.
+Latency is measured from the scheduled arrival, so client-side waiting
+counts, not just the server's time once a request is sent. A --hit-ratio
+share of requests re-send a fixture that was sent during warm-up (a cache
+hit); the rest send a photo or clip that hasn't been seen before. Fixtures
+are generated before the run starts.
+
+Reports requests, p50/p95/p99 latency, throughput, error rate per status
+and the observed cache-hit share, per endpoint and overall.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import asyncio
+import tempfile
+import subprocess
+
+import httpx
+import numpy as np
+
+from bench.bench_photo_preprocess import sample_photo
+from bench.bench_spectrogram import synthetic_clip
+
+ENDPOINTS = {
+    "photo": "/api/identify/photo",
+    "sound": "/api/identify/sound",
+    "validate": "/api/validate/sound",
+}
+WARM_FIXTURES = 8
+VALIDATE_FORM = {
+    "target_species_id": "turdus_migratorius",
+    "candidate_species_ids": ["turdus_migratorius", "ixoreus_naevius", "pipilo_erythrophthalmus"],
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f} s")
+
+
+def start_servers(args, workdir: str) -> tuple:
+    """Starts the stub and the app; returns (app base URL, stub base URL, processes)."""
+    stub_port, app_port = _free_port(), _free_port()
+    stub_env = {
+        **os.environ,
+        "STUB_LATENCY_MS": str(args.stub_latency_ms),
+        "STUB_LATENCY_DIST": args.stub_latency_dist,
+        "STUB_LATENCY_SPREAD": str(args.stub_latency_spread),
+        "STUB_ERROR_RATE": str(args.stub_error_rate),
+        "STUB_SEED": str(args.seed),
+    }
+    app_env = {
+        **os.environ,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub"),
+        "OPENAI_URL": f"http://127.0.0.1:{stub_port}/v1/chat/completions",
+        "DB_PATH": os.path.join(workdir, "usage.sqlite"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "CACHE_DB_PATH": os.path.join(workdir, "cache.sqlite"),
+        "PHASH_INDEX_PATH": os.path.join(workdir, "phash_index.tsv"),
+        "AUDIO_FP_INDEX_PATH": os.path.join(workdir, "audio_fp_index.tsv"),
+        "ARTIFACT_DIR": os.path.join(workdir, "artifacts"),
+        "UPLOAD_SPOOL_DIR": os.path.join(workdir, "spool"),
+        "DAILY_LIMIT_PER_USER": "1000000000",
+        "DAILY_LIMIT_PER_IP": "1000000000",
+    }
+    os.makedirs(app_env["UPLOAD_SPOOL_DIR"], exist_ok=True)
+
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    procs = [
+        subprocess.Popen([*uvicorn, "--port", str(stub_port), "bench.stub_openai:app"], env=stub_env),
+        subprocess.Popen(
+            [*uvicorn, "--port", str(app_port), "--workers", str(args.app_workers), "app.main:app"],
+            env=app_env,
+        ),
+    ]
+    stub_url, app_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{app_port}"
+    try:
+        _wait_ready(f"{stub_url}/stats", procs[0])
+        _wait_ready(f"{app_url}/health", procs[1])
+    except BaseException:
+        stop_servers(procs)
+        raise
+    return app_url, stub_url, procs
+
+
+def stop_servers(procs: list):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+class Fixtures:
+    """Warm fixtures (re-sent for cache hits) and a supply of unseen ones per endpoint."""
+
+    def __init__(self, counts: dict, seed: int, photo_size: tuple):
+        self._next_seed = seed * 100000
+        self.photo_size = photo_size
+        self.warm = {kind: [self._make(kind) for _ in range(WARM_FIXTURES)] for kind in counts}
+        self.fresh = {kind: [self._make(kind) for _ in range(n)] for kind, n in counts.items()}
+
+    def _make(self, kind: str) -> tuple:
+        self._next_seed += 1
+        if kind == "photo":
+            return "photo.jpg", sample_photo(self._next_seed, self.photo_size), "image/jpeg"
+        # sound and validate get distinct clips, so neither warms the other's cache
+        return "clip.wav", synthetic_clip(self._next_seed, 6.0), "audio/wav"
+
+    def pick(self, kind: str, hit: bool, rng: random.Random) -> tuple:
+        if hit or not self.fresh[kind]:
+            return rng.choice(self.warm[kind]), True
+        return self.fresh[kind].pop(), False
+
+
+async def _send(client: httpx.AsyncClient, kind: str, fixture: tuple, user: str) -> httpx.Response:
+    name, data, ctype = fixture
+    field = "image" if kind == "photo" else "audio"
+    form = VALIDATE_FORM if kind == "validate" else None
+    return await client.post(ENDPOINTS[kind], files={field: (name, data, ctype)}, data=form,
+                             headers={"x-user-id": user})
+
+
+async def warm_up(client: httpx.AsyncClient, fixtures: Fixtures):
+    """Sends every warm fixture once so re-sending it is a cache hit."""
+    for kind, items in fixtures.warm.items():
+        for fixture in items:
+            try:
+                r = await _send(client, kind, fixture, "loadgen-warmup")
+            except httpx.HTTPError as e:
+                print(f"warm-up {kind}: {type(e).__name__}", file=sys.stderr)
+                continue
+            if r.status_code != 200:
+                print(f"warm-up {kind}: {r.status_code} {r.text[:200]}", file=sys.stderr)
+
+
+async def run_load(client: httpx.AsyncClient, fixtures: Fixtures, args, kinds: list, weights: list) -> tuple:
+    rng = random.Random(args.seed)
+    slots = asyncio.Semaphore(args.concurrency)
+    records = []
+    total = int(args.rps * args.duration)
+
+    async def one(kind: str, scheduled: float, user: str):
+        fixture, expect_hit = fixtures.pick(kind, rng.random() < args.hit_ratio, rng)
+        async with slots:
+            sent = time.perf_counter()
+            try:
+                r = await _send(client, kind, fixture, user)
+                status = r.status_code
+                cached = bool(r.json().get("cached")) if status == 200 else False
+            except httpx.HTTPError as e:
+                status, cached = type(e).__name__, False
+        done = time.perf_counter()
+        records.append({
+            "kind": kind,
+            "status": status,
+            "latency_ms": (done - scheduled) * 1000,
+            "wait_ms": (sent - scheduled) * 1000,
+            "expect_hit": expect_hit,
+            "cached": cached,
+            "done": done,
+        })
+
+    tasks = []
+    start = time.perf_counter() + 0.1
+    offset = 0.0
+    for i in range(total):
+        offset = offset + rng.expovariate(args.rps) if args.arrivals == "poisson" else i / args.rps
+        scheduled = start + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = rng.choices(kinds, weights)[0]
+        tasks.append(asyncio.create_task(one(kind, scheduled, f"loadgen-{i % args.users}")))
+    await asyncio.gather(*tasks)
+    return records, start
+
+
+def summarize(records: list, start: float) -> dict:
+    groups = {kind: [r for r in records if r["kind"] == kind] for kind in ENDPOINTS}
+    groups = {kind: rs for kind, rs in groups.items() if rs}
+    groups["all"] = records
+
+    out = {}
+    for name, rs in groups.items():
+        ok = [r for r in rs if r["status"] == 200]
+        errors = {}
+        for r in rs:
+            if r["status"] != 200:
+                errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+        span = max(r["done"] for r in rs) - start
+        lat = np.array([r["latency_ms"] for r in ok]) if ok else np.array([0.0])
+        out[name] = {
+            "requests": len(rs),
+            "ok": len(ok),
+            "error_rate": round((len(rs) - len(ok)) / len(rs), 4),
+            "errors": errors,
+            "p50_ms": round(float(np.percentile(lat, 50)), 1),
+            "p95_ms": round(float(np.percentile(lat, 95)), 1),
+            "p99_ms": round(float(np.percentile(lat, 99)), 1),
+            "max_ms": round(float(lat.max()), 1),
+            "client_wait_p99_ms": round(float(np.percentile([r["wait_ms"] for r in rs], 99)), 1),
+            "throughput_rps": round(len(ok) / span, 2) if span > 0 else 0.0,
+            "cache_hit_share": round(sum(r["cached"] for r in ok) / len(ok), 3) if ok else 0.0,
+            "planned_hit_share": round(sum(r["expect_hit"] for r in rs) / len(rs), 3),
+        }
+    return out
+
+
+def print_summary(summary: dict):
+    print(f"{'endpoint':<10} {'reqs':>6} {'ok/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'err %':>6} {'hits':>6}  errors")
+    for name, s in summary.items():
+        errors = ", ".join(f"{k}: {v}" for k, v in s["errors"].items()) or "-"
+        print(f"{name:<10} {s['requests']:>6} {s['throughput_rps']:>7.1f} {s['p50_ms']:>8.0f} {s['p95_ms']:>8.0f} "
+              f"{s['p99_ms']:>8.0f} {s['max_ms']:>8.0f} {s['error_rate'] * 100:>6.1f} {s['cache_hit_share']:>6.2f}  {errors}")
+
+
+def _parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {kind!r}; choose from {', '.join(ENDPOINTS)}")
+        mix[kind] = float(weight or 1)
+    return {k: w for k, w in mix.items() if w > 0}
+
+
+async def _main(args) -> dict:
+    mix = args.mix
+    kinds, weights = list(mix), [mix[k] for k in mix]
+    total = int(args.rps * args.duration)
+    share = {k: w / sum(weights) for k, w in mix.items()}
+    # enough unseen fixtures for the expected misses, plus slack for randomness
+    counts = {k: int(total * share[k] * (1 - args.hit_ratio) * 1.2) + 5 for k in kinds}
+
+    t0 = time.perf_counter()
+    fixtures = Fixtures(counts, args.seed, (args.photo_width, args.photo_width * 3 // 4))
+    print(f"generated {sum(counts.values()) + WARM_FIXTURES * len(kinds)} fixtures "
+          f"in {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        await warm_up(client, fixtures)
+        print(f"running {total} requests at {args.rps:g}/s, concurrency {args.concurrency}, "
+              f"hit ratio {args.hit_ratio:g}, mix {mix}", file=sys.stderr)
+        records, start = await run_load(client, fixtures, args, kinds, weights)
+
+    stats = None
+    if args.admin_stats:
+        # a fresh connection: the app closes ones whose request failed with a 500
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+            stats = (await client.get("/admin/stats")).json()
+
+    summary = summarize(records, start)
+    return {"summary": summary, "app_stats": stats}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", help="running app to target (default: start stub and app)")
+    parser.add_argument("--rps", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of arrivals")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--arrivals", choices=("constant", "poisson"), default="constant")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("photo=1,sound=1,validate=1"))
+    parser.add_argument("--hit-ratio", type=float, default=0.5)
+    parser.add_argument("--users", type=int, default=100, help="distinct x-user-id values")
+    parser.add_argument("--photo-width", type=int, default=1600)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--app-workers", type=int, default=1)
+    parser.add_argument("--stub-latency-ms", type=float, default=800.0)
+    parser.add_argument("--stub-latency-dist", choices=("fixed", "uniform", "normal", "lognormal"),
+                        default="lognormal")
+    parser.add_argument("--stub-latency-spread", type=float, default=0.4)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--no-admin-stats", dest="admin_stats", action="store_false",
+                        help="don't fetch /admin/stats after the run")
+    parser.add_argument("--out", help="write the summary (and app stats) as JSON")
+    args = parser.parse_args()
+
+    procs = []
+    stub_url = None
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            if not args.base_url:
+                args.base_url, stub_url, procs = start_servers(args, workdir)
+            result = asyncio.run(_main(args))
+            if stub_url:
+                result["stub_stats"] = httpx.get(f"{stub_url}/stats").json()
+        finally:
+            stop_servers(procs)
+
+    print_summary(result["summary"])
+    if result.get("stub_stats"):
+        s = result["stub_stats"]
+        print(f"\nstub: {s['calls']} upstream calls, {s['errors']} errors, "
+              f"mean latency {s['latency_ms_avg']:.0f} ms ({s['dist']})")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, **result}, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
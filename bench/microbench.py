@@ -0,0 +1,326 @@
+"""
+Microbenchmarks for the hot paths: photo resize, audio trim, spectrogram
+rendering, species matching, the result cache and usage logging.
+
+    python -m bench.microbench [--quick] [--only resize_image,cache_get]
+                               [--out results.json] [--baseline baseline.json]
+                               [--max-regression 0.15]
+
+Fixtures are generated: photos of several sizes (bench_photo_preprocess),
+chirp clips (bench_spectrogram) and queries drawn from the full species
+list. The cache and usage log run against a throwaway directory.
+
+Each case is timed for --seconds (at least --min-calls calls) after a
+warm-up, then run a few more times under tracemalloc for its peak traced memory,
+so tracing doesn't distort the timings. Traced memory covers Python and
+NumPy allocations; Pillow and SQLite allocate outside the tracer, so the
+process's max RSS is reported as well. Throughput is items per
+second of wall time (rows for log_usage_drain, calls otherwise).
+
+--out writes the results as JSON; save one as the baseline. With
+--baseline, every case's p50 is compared with the baseline's and the exit
+status is 1 if any case is slower by more than --max-regression.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app import cache, cache_sqlite, usage_db
+from app.media_utils import resize_image, trim_audio, wav_to_samples
+from app.spectrogram import audio_to_spectrogram_image
+from app.species import load_species, match_species
+from bench.bench_photo_preprocess import sample_photo
+from bench.bench_spectrogram import synthetic_clip
+
+MEMORY_CALLS = 3
+
+
+
+class Case:
+    def __init__(self, name, fn, inputs, batch=1, max_calls=None, setup=None, teardown=None):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.batch = batch          # items handled per call, for throughput
+        self.max_calls = max_calls
+        self.setup = setup
+        self.teardown = teardown
+
+
+def _photo_cases():
+    photos = {
+        "640x480 jpeg": sample_photo(11, (640, 480)),
+        "2048x1536 jpeg": sample_photo(12, (2048, 1536)),
+        "4000x3000 jpeg": sample_photo(13, (4000, 3000)),
+        "1920x1080 png": sample_photo(14, (1920, 1080), fmt="PNG"),
+    }
+    return [Case(f"resize_image[{label}]", resize_image, [data]) for label, data in photos.items()]
+
+
+def _audio_cases():
+    cases = []
+    for seconds in (6, 30):
+        clips = [synthetic_clip(seed, seconds) for seed in range(3)]
+        cases.append(Case(f"trim_audio[{seconds}s wav]", trim_audio, clips))
+
+    wavs = [synthetic_clip(seed, 6) for seed in range(3)]
+    decoded = [(wav, wav_to_samples(wav)) for wav in wavs]
+    cases.append(Case("audio_to_spectrogram_image[wav]", audio_to_spectrogram_image, wavs))
+    cases.append(Case(
+        "audio_to_spectrogram_image[samples]",
+        lambda pair: audio_to_spectrogram_image(*pair),
+        decoded,
+    ))
+    return cases
+
+
+def _species_cases():
+    species = load_species()
+    rng = np.random.default_rng(0)
+    picked = [species[i] for i in rng.choice(len(species), 500, replace=False)]
+    by_scientific = [("", s["scientific_name"]) for s in picked]
+    by_common = [(s["species_name"].upper(), "") for s in picked]
+    misses = [(f"Unlisted bird {i}", f"Nonexistus avis{i}") for i in range(500)]
+    return [
+        Case("match_species[scientific]", lambda q: match_species(*q), by_scientific),
+        Case("match_species[common]", lambda q: match_species(*q), by_common),
+        Case("match_species[miss]", lambda q: match_species(*q), misses),
+    ]
+
+
+def _cache_cases():
+    result = {
+        "predictions": [
+            {"species_id": "turdus_migratorius", "species_name": "American Robin",
+             "scientific_name": "Turdus migratorius", "confidence": 0.82,
+             "reason": "Orange breast, gray back.", "matched_to_db": True, "match_score": 1.0},
+        ] * 3,
+        "notes": "",
+        "cached": False,
+        "input_bytes": 18000,
+    }
+    keys = [f"photo_{i:064x}" for i in range(256)]
+    memory_entries = cache.CACHE_MEMORY_MAX_ENTRIES
+
+    def fill():
+        for key in keys:
+            cache.cache_set(key, result)
+
+    def memory_off():
+        # every read misses memory and goes to the backend
+        cache.CACHE_MEMORY_MAX_ENTRIES = 0
+        cache._MEMORY.clear()
+
+    def memory_on():
+        cache.CACHE_MEMORY_MAX_ENTRIES = memory_entries
+
+    return [
+        Case("cache_set", lambda key: cache.cache_set(key, result), keys),
+        Case("cache_get[memory]", cache.cache_get, keys, setup=fill),
+        Case("cache_get[disk]", cache.cache_get, keys, setup=memory_off, teardown=memory_on),
+        Case("cache_get[miss]", cache.cache_get, [f"photo_missing_{i}" for i in range(256)]),
+    ]
+
+
+def _usage_log_cases():
+    rows = [
+        (f"user{i % 50}", "10.0.0.1", "/api/identify/photo", f"photo_{i:064x}", i % 3 == 0, "gpt-4o-mini", 18000)
+        for i in range(1000)
+    ]
+
+    def drain(batch):
+        for row in batch:
+            usage_db.log_usage(*row)
+        usage_db.flush_usage_logs()
+
+    return [
+        # bounded so the queue never fills and drops rows mid-measurement
+        Case("log_usage", lambda row: usage_db.log_usage(*row), rows,
+             max_calls=usage_db.USAGE_LOG_QUEUE_SIZE // 2, teardown=usage_db.flush_usage_logs),
+        Case("log_usage_drain", drain, [rows], batch=len(rows)),
+    ]
+
+
+GROUPS = {
+    "resize_image": _photo_cases,
+    "trim_audio": _audio_cases,
+    "audio_to_spectrogram_image": _audio_cases,
+    "match_species": _species_cases,
+    "cache_get": _cache_cases,
+    "cache_set": _cache_cases,
+    "log_usage": _usage_log_cases,
+}
+
+
+def run_case(case: Case, seconds: float, min_calls: int) -> dict:
+    if case.setup:
+        case.setup()
+    try:
+        inputs, n = case.inputs, len(case.inputs)
+        case.fn(inputs[0])  # warm-up
+
+        times_ns = []
+        started = time.perf_counter()
+        deadline = started + seconds
+        i = 0
+        while (time.perf_counter() < deadline or i < min_calls) and (case.max_calls is None or i < case.max_calls):
+            item = inputs[i % n]
+            t0 = time.perf_counter_ns()
+            case.fn(item)
+            times_ns.append(time.perf_counter_ns() - t0)
+            i += 1
+        wall = time.perf_counter() - started
+
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            for j in range(min(MEMORY_CALLS, i)):
+                case.fn(inputs[j % n])
+            peak = tracemalloc.get_traced_memory()[1] - base
+        finally:
+            tracemalloc.stop()
+    finally:
+        if case.teardown:
+            case.teardown()
+
+    us = np.array(times_ns, dtype=np.float64) / 1000
+    p50, p90, p99 = np.percentile(us, [50, 90, 99])
+    return {
+        "calls": len(us),
+        "p50_us": round(float(p50), 3),
+        "p90_us": round(float(p90), 3),
+        "p99_us": round(float(p99), 3),
+        "mean_us": round(float(us.mean()), 3),
+        "min_us": round(float(us.min()), 3),
+        "max_us": round(float(us.max()), 3),
+        "stdev_us": round(float(us.std()), 3),
+        "throughput_per_s": round(len(us) * case.batch / wall, 2),
+        "peak_traced_kib": round(max(peak, 0) / 1024, 1),
+    }
+
+
+def _meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = ""
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_rev": rev,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "cache_backend": cache.CACHE_BACKEND,
+    }
+
+
+def _fmt_us(us: float) -> str:
+    if us >= 1000:
+        return f"{us / 1000:.2f} ms"
+    return f"{us:.1f} us"
+
+
+def print_results(results: dict):
+    print(f"{'case':<38} {'calls':>7} {'p50':>10} {'p90':>10} {'p99':>10} {'per s':>10} {'peak KiB':>9}")
+    for name, r in results.items():
+        print(f"{name:<38} {r['calls']:>7} {_fmt_us(r['p50_us']):>10} {_fmt_us(r['p90_us']):>10} "
+              f"{_fmt_us(r['p99_us']):>10} {r['throughput_per_s']:>10.1f} {r['peak_traced_kib']:>9.1f}")
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Prints p50 against the baseline per case; returns the names of regressed cases."""
+    base_meta, base_cases = baseline.get("meta", {}), baseline.get("cases", {})
+    for key in ("python", "numpy", "machine", "cpus", "cache_backend"):
+        current = _meta()[key]
+        if base_meta.get(key) != current:
+            print(f"note: baseline {key} is {base_meta.get(key)!r}, this run {current!r}")
+
+    regressed = []
+    print(f"\n{'case':<38} {'baseline p50':>13} {'p50':>10} {'change':>8}")
+    for name, r in results.items():
+        base = base_cases.get(name)
+        if not base:
+            print(f"{name:<38} {'-':>13} {_fmt_us(r['p50_us']):>10} {'new':>8}")
+            continue
+        change = r["p50_us"] / base["p50_us"] - 1 if base["p50_us"] else 0.0
+        flag = ""
+        if change > max_regression:
+            flag = "  REGRESSED"
+            regressed.append(name)
+        elif change < -max_regression:
+            flag = "  improved"
+        print(f"{name:<38} {_fmt_us(base['p50_us']):>13} {_fmt_us(r['p50_us']):>10} {change:>+8.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", default="", help="comma-separated functions (default: all)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="timed seconds per case")
+    parser.add_argument("--min-calls", type=int, default=10)
+    parser.add_argument("--quick", action="store_true", help="0.2 s per case")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --out to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    only = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = [name for name in only if name not in GROUPS]
+    if unknown:
+        parser.error(f"unknown function(s): {', '.join(unknown)}; choose from {', '.join(GROUPS)}")
+    seconds = 0.2 if args.quick else args.seconds
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cache.CACHE_DIR = os.path.join(tmpdir, "cache")
+        cache_sqlite.CACHE_DB_PATH = os.path.join(tmpdir, "cache.sqlite")
+        usage_db.DB_PATH = os.path.join(tmpdir, "usage.sqlite")
+        usage_db.init_db()
+
+        # a group builder can serve several functions; build each once, keep order
+        builders = []
+        for name, build in GROUPS.items():
+            if (not only or name in only) and build not in builders:
+                builders.append(build)
+
+        results = {}
+        for build in builders:
+            for case in build():
+                if only and not any(case.name.split("[")[0].startswith(name) for name in only):
+                    continue
+                print(f"  {case.name} ...", file=sys.stderr)
+                results[case.name] = run_case(case, seconds, args.min_calls)
+        usage_db.flush_usage_logs()
+
+    print_results(results)
+    max_rss_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nprocess max RSS {max_rss_mib:.0f} MiB")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": {**_meta(), "max_rss_mib": round(max_rss_mib, 1)}, "cases": results}, f, indent=2)
+        print(f"wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressed = compare(results, baseline, args.max_regression)
+        if regressed:
+            print(f"\n{len(regressed)} case(s) slower than the baseline by more than {args.max_regression:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
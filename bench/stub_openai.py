@@ -0,0 +1,134 @@
+"""
+Local stand-in for the OpenAI Chat Completions endpoint.
+
+    STUB_LATENCY_MS=200 uvicorn bench.stub_openai:app --port 9000
+    OPENAI_URL=http://127.0.0.1:9000/v1/chat/completions uvicorn app.main:app
+
+Every call sleeps (without blocking the loop) and returns a fixed, valid
+prediction payload (or a validation verdict for validate prompts), so
+upstream concurrency can be measured offline. With "stream": true the
+content is sent as chat.completion.chunk events of STUB_STREAM_CHUNK_CHARS
+characters every STUB_STREAM_CHUNK_MS, roughly like a model writing tokens.
+
+Latency per call is drawn from STUB_LATENCY_DIST:
+    fixed      STUB_LATENCY_MS
+    uniform    STUB_LATENCY_MS +/- STUB_LATENCY_SPREAD ms
+    normal     mean STUB_LATENCY_MS, standard deviation STUB_LATENCY_SPREAD ms
+    lognormal  median STUB_LATENCY_MS, shape STUB_LATENCY_SPREAD (e.g. 0.5);
+               a long right tail like real model latency
+A STUB_ERROR_RATE share of calls (after the delay) fail with
+STUB_ERROR_STATUS. GET /stats returns call and error counts.
+"""
+import os
+import json
+import random
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "200"))
+STUB_LATENCY_DIST = os.getenv("STUB_LATENCY_DIST", "fixed").lower()
+STUB_LATENCY_SPREAD = float(os.getenv("STUB_LATENCY_SPREAD", "0"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_ERROR_STATUS = int(os.getenv("STUB_ERROR_STATUS", "500"))
+STUB_SEED = os.getenv("STUB_SEED")
+STUB_STREAM_CHUNK_CHARS = int(os.getenv("STUB_STREAM_CHUNK_CHARS", "8"))
+STUB_STREAM_CHUNK_MS = float(os.getenv("STUB_STREAM_CHUNK_MS", "20"))
+
+PREDICTIONS = {
+    "predictions": [
+        {"species_name": "American Robin", "scientific_name": "Turdus migratorius",
+         "confidence": 0.82, "reason": "Orange breast, gray back."},
+        {"species_name": "Varied Thrush", "scientific_name": "Ixoreus naevius",
+         "confidence": 0.11, "reason": "Similar orange underparts."},
+        {"species_name": "Eastern Towhee", "scientific_name": "Pipilo erythrophthalmus",
+         "confidence": 0.07, "reason": "Rufous flanks."},
+    ],
+    "notes": "stub",
+}
+
+VALIDATION = {
+    "target_species_id": "turdus_migratorius",
+    "best_match_species_id": "turdus_migratorius",
+    "match": "confirmed",
+    "match_confidence": 0.78,
+    "explanation": "Rising and falling whistled phrases typical of a robin.",
+    "best_alternative_species_id": "ixoreus_naevius",
+    "best_alternative_confidence": 0.12,
+}
+
+app = FastAPI(title="OpenAI stub")
+
+_RNG = random.Random(int(STUB_SEED) if STUB_SEED else None)
+STATS = {"calls": 0, "errors": 0, "streamed": 0, "latency_ms_total": 0.0}
+
+
+def latency_ms() -> float:
+    if STUB_LATENCY_DIST == "uniform":
+        ms = _RNG.uniform(STUB_LATENCY_MS - STUB_LATENCY_SPREAD, STUB_LATENCY_MS + STUB_LATENCY_SPREAD)
+    elif STUB_LATENCY_DIST == "normal":
+        ms = _RNG.gauss(STUB_LATENCY_MS, STUB_LATENCY_SPREAD)
+    elif STUB_LATENCY_DIST == "lognormal":
+        ms = STUB_LATENCY_MS * _RNG.lognormvariate(0.0, STUB_LATENCY_SPREAD)
+    else:
+        ms = STUB_LATENCY_MS
+    return max(ms, 0.0)
+
+
+@app.get("/stats")
+async def stats():
+    calls = STATS["calls"]
+    return {
+        **STATS,
+        "latency_ms_avg": round(STATS["latency_ms_total"] / calls, 2) if calls else 0.0,
+        "dist": STUB_LATENCY_DIST,
+        "error_rate": STUB_ERROR_RATE,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(payload: dict):
+    delay = latency_ms()
+    STATS["calls"] += 1
+    STATS["latency_ms_total"] += delay
+    await asyncio.sleep(delay / 1000)
+    if STUB_ERROR_RATE and _RNG.random() < STUB_ERROR_RATE:
+        STATS["errors"] += 1
+        return JSONResponse(
+            {"error": {"message": "stub error", "type": "server_error"}},
+            status_code=STUB_ERROR_STATUS,
+        )
+
+    system = payload["messages"][0].get("content", "") if payload.get("messages") else ""
+    # the validate system prompt is the one about a TARGET species
+    answer = VALIDATION if "TARGET species" in str(system) else PREDICTIONS
+    content = json.dumps(answer, indent=2)
+    if payload.get("stream"):
+        STATS["streamed"] += 1
+        return StreamingResponse(_chunks(payload, content), media_type="text/event-stream")
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "model": payload.get("model", "stub"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+    }
+
+
+async def _chunks(payload: dict, content: str):
+    for i in range(0, len(content), STUB_STREAM_CHUNK_CHARS):
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "delta": {"content": content[i:i + STUB_STREAM_CHUNK_CHARS]}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(STUB_STREAM_CHUNK_MS / 1000)
+    yield "data: [DONE]\n\n"
@@ -0,0 +1,59 @@
+import json
+
+from app.json_stream import JsonStreamParser
+
+DOC = (
+    '{"notes": "a \\"quoted\\" note, with {braces} and [brackets]", '
+    '"top_predictions": [{"common_name": "Robin]", "confidence": 0.9}, '
+    '{"common_name": "Wren\\\\", "confidence": 0.1}], '
+    '"tags": ["x,y", 2, null], "empty": [], "count": 3}'
+)
+
+EXPECTED = [
+    (("notes",), 'a "quoted" note, with {braces} and [brackets]'),
+    (("top_predictions", 0), {"common_name": "Robin]", "confidence": 0.9}),
+    (("top_predictions", 1), {"common_name": "Wren\\", "confidence": 0.1}),
+    (("top_predictions",), json.loads(DOC)["top_predictions"]),
+    (("tags", 0), "x,y"),
+    (("tags", 1), 2),
+    (("tags", 2), None),
+    (("tags",), ["x,y", 2, None]),
+    (("empty",), []),
+    (("count",), 3),
+]
+
+
+def _feed_all(pieces) -> list:
+    parser = JsonStreamParser()
+    out = []
+    for piece in pieces:
+        out.extend(parser.feed(piece))
+    return out
+
+
+def test_whole_document():
+    assert _feed_all([DOC]) == EXPECTED
+
+
+def test_one_character_at_a_time():
+    # splits land inside escapes, strings, keys and numbers
+    assert _feed_all(DOC) == EXPECTED
+
+
+def test_every_two_way_split():
+    for i in range(1, len(DOC)):
+        assert _feed_all([DOC[:i], DOC[i:]]) == EXPECTED, i
+
+
+def test_values_come_out_as_soon_as_complete():
+    parser = JsonStreamParser()
+    assert parser.feed('{"notes": "hi", "top_predictions": [{"a": 1}') == [
+        (("notes",), "hi"),
+        (("top_predictions", 0), {"a": 1}),
+    ]
+    assert parser.feed(', {"a": 2}') == [(("top_predictions", 1), {"a": 2})]
+    assert parser.feed("]}") == [(("top_predictions",), [{"a": 1}, {"a": 2}])]
+
+
+def test_unparseable_slice_is_skipped():
+    assert _feed_all(['{"a": tru, "b": 1}']) == [(("b",), 1)]